@@ -1 +1,5 @@
+"""
+Heavy dependencies such as tensorflow and keras are only imported once
+models are used, so that metadata operations start quickly.
+"""
 from . import flowcat_api as flowcat
@@ -1,3 +1,26 @@
-from .classifier import SOMClassifier, SOMClassifierConfig
-from .saliency import SOMSaliency
-from .models import create_model_multi_input
+"""
+Classifier models are imported lazily, since they require keras.
+"""
+import sys
+import importlib
+
+LAZY_ATTRIBUTES = {
+    "SOMClassifier": ".classifier",
+    "SOMClassifierConfig": ".classifier",
+    "SOMSaliency": ".saliency",
+    "create_model_multi_input": ".models",
+}
+
+
+if sys.version_info < (3, 7):
+    # module __getattr__ is only supported from python 3.7 on
+    from .classifier import SOMClassifier, SOMClassifierConfig
+    from .saliency import SOMSaliency
+    from .models import create_model_multi_input
+
+
+def __getattr__(name):
+    if name in LAZY_ATTRIBUTES:
+        module = importlib.import_module(LAZY_ATTRIBUTES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -5,9 +5,11 @@ from sklearn.preprocessing import LabelBinarizer
 from flowcat import io_functions, utils
 from flowcat.dataset import case_dataset
 from flowcat.plots import history as plot_history
+from flowcat.types import som_codec
 from flowcat.types.classifier_config import SOMClassifierConfig, save_somclassifier_config, load_somclassifier_config
 
-from . import som_dataset
+from . import som_dataset, tf_dataset
+from .padding import pad_stored_arrays, stored_padding
 
 
 def plot_training_history(history, output):
@@ -30,6 +32,13 @@ def getter_som(data, tube):
     return data.get_tube(tube, kind="som")
 
 
+def batch_getter_case(data, tube):
+    samples = [d.get_tube(tube, kind="som") for d in data]
+    if any(s.data for s in samples):
+        return np.array([s.get_data().data for s in samples])
+    return som_codec.load_arrays([s.complete_path for s in samples])
+
+
 class SOMClassifier:
     def __init__(
             self,
@@ -63,6 +72,28 @@ class SOMClassifier:
         }
         return cls(config, binarizer=binarizer, model=model, data_ids=data_ids, modeldir=path)
 
+    @classmethod
+    def from_bundle(cls, arrays: dict, meta: dict, prefix: str = "classifier") -> "SOMClassifier":
+        """Create classifier from bundle data created by to_bundle."""
+        config = SOMClassifierConfig(**meta["config"])
+        model = keras.models.model_from_json(meta["model"])
+        model.set_weights([arrays[f"{prefix}/weights/{i}"] for i in range(meta["num_weights"])])
+        binarizer = LabelBinarizer().fit(meta["classes"])
+        return cls(config, binarizer=binarizer, model=model, data_ids=meta["data_ids"])
+
+    def to_bundle(self, prefix: str = "classifier") -> "Tuple[dict, dict]":
+        """Get model weights and configuration for saving in a bundle."""
+        weights = self.model.get_weights()
+        arrays = {f"{prefix}/weights/{i}": w for i, w in enumerate(weights)}
+        meta = {
+            "config": self.config.to_json(),
+            "model": self.model.to_json(),
+            "num_weights": len(weights),
+            "classes": list(self.binarizer.classes_),
+            "data_ids": self.data_ids,
+        }
+        return arrays, meta
+
     def create_model(self, fun, kwargs=None, compile=True):
         """Create a model using the given model function."""
         if kwargs is None:
@@ -103,48 +134,111 @@ class SOMClassifier:
     def get_validation_data(self, dataset: som_dataset.SOMDataset) -> som_dataset.SOMDataset:
         return dataset.filter(labels=self.data_ids["validation"])
 
-    def create_sequence(
-            self,
-            dataset: som_dataset.SOMDataset,
-            batch_size: int = 128,
-            getter: "Callback" = None,
-    ) -> som_dataset.SOMSequence:
+    def _case_padding(self, cases) -> dict:
+        """Get padding of stored SOMs per tube from the first case, checked against the map dims."""
+        if not len(cases):
+            return {}
+        case = next(iter(cases))
+        return {
+            tube: stored_padding(getter_case(case, tube).shape, config["dims"])
+            for tube, config in self.config.tubes.items()
+        }
+
+    def _dataset_getters(self, dataset, getter=None) -> tuple:
+        """Get single case and batch getters and stored SOM padding for a dataset."""
+        batch_getter = None
+        stored_padding = None
+        if isinstance(dataset, som_dataset.SOMDataset):
+            stored_padding = {
+                tube: config.get("padding", 0)
+                for tube, config in dataset.config.items() if isinstance(config, dict)
+            }
+        elif isinstance(dataset, case_dataset.CaseCollection):
+            stored_padding = self._case_padding(dataset)
         if getter is None:
             if isinstance(dataset, som_dataset.SOMDataset):
                 getter = getter_som
+                batch_getter = som_dataset.batch_getter
             elif isinstance(dataset, case_dataset.CaseCollection):
                 getter = getter_case
+                batch_getter = batch_getter_case
             else:
                 raise ValueError(f"Unknown dataset type {type(dataset)} with no given getter.")
+        return getter, batch_getter, stored_padding
 
+    def create_sequence(
+            self,
+            dataset: som_dataset.SOMDataset,
+            batch_size: int = 128,
+            getter: "Callback" = None,
+            sampler: "EpochSampler" = None,
+    ) -> som_dataset.SOMSequence:
+        getter, batch_getter, stored_padding = self._dataset_getters(dataset, getter)
         seq = som_dataset.SOMSequence(
             dataset, self.binarizer,
             get_array_fun=getter,
             tube=self.config.tubes,
             batch_size=batch_size,
             pad_width=self.config.pad_width,
+            get_batch_fun=batch_getter,
+            sampler=sampler,
+            stored_padding=stored_padding,
         )
         return seq
 
+    def create_tf_dataset(
+            self,
+            dataset: som_dataset.SOMDataset,
+            batch_size: int = 128,
+            getter: "Callback" = None,
+            sampler: "EpochSampler" = None,
+            cache: utils.URLPath = None,
+            **kwargs) -> "SOMTFDataset":
+        """Create tf.data input pipeline usable in place of a sequence for training.
+
+        Args:
+            cache: File to cache loaded SOMs to.
+            kwargs: Further arguments to SOMTFDataset.
+        """
+        getter, _, stored_padding = self._dataset_getters(dataset, getter)
+        return tf_dataset.SOMTFDataset(
+            dataset, self.binarizer,
+            tube=self.config.tubes,
+            get_array_fun=getter,
+            batch_size=batch_size,
+            pad_width=self.config.pad_width,
+            sampler=sampler,
+            stored_padding=stored_padding,
+            cache=cache,
+            **kwargs)
+
     def array_from_cases(self, cases):
-        """Transform som data in a single into a format usable for prediction."""
+        """Transform som data in a single into a format usable for prediction.
+
+        SOMs stored with padding are adjusted to the pad width of the classifier.
+        """
         xdata = [
-            np.array([
-                som_dataset.pad_array(
-                    case.get_tube(tube, kind="som").get_data().data,
-                    self.config.pad_width)
-                for case in cases
-            ])
-            for tube in self.config.tubes
+            pad_stored_arrays(
+                [getter_case(case, tube) for case in cases],
+                config["dims"], self.config.pad_width)
+            for tube, config in self.config.tubes.items()
         ]
 
         ydata = self.binarizer.transform([case.group for case in cases])
         return xdata, ydata
 
     def train_generator(self, train, validation=None, epochs=20, class_weight=None):
-        """Train the current model using the given data."""
+        """Train the current model using the given data.
+
+        Args:
+            train: Sequence or tf.data pipeline created by create_tf_dataset.
+        """
+        if isinstance(train, tf_dataset.SOMTFDataset):
+            generator, steps_per_epoch = train.generator(), len(train)
+        else:
+            generator, steps_per_epoch = train, None
         history = self.model.fit_generator(
-            generator=train, validation_data=validation,
+            generator=generator, steps_per_epoch=steps_per_epoch, validation_data=validation,
             epochs=epochs, shuffle=True, class_weight=class_weight)
         self.training_history.append(
             ({"epochs": epochs, "class_weight": class_weight}, history)
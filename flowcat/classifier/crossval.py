@@ -0,0 +1,281 @@
+"""
+Cross-validation and learning curves of SOM classifiers with folds trained
+concurrently in worker processes.
+
+SOMs of the dataset are loaded once and saved padded as a single array per
+tube. Workers map these arrays read-only, so all folds share the same memory
+pages, and every worker runs its tensorflow session with an equal share of
+cpus.
+"""
+import os
+import logging
+import multiprocessing
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from flowcat import utils, io_functions
+from flowcat.dataset import splits
+from flowcat.types import som_codec
+from .padding import repad_batch
+from .predictions import generate_all_metrics
+from .sampling import create_sampler
+
+
+LOGGER = logging.getLogger(__name__)
+
+THREAD_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+# state of worker processes, set by the pool initializer
+_SHARED = {}
+
+
+@dataclass
+class Fold:
+    """Train and test positions of a single fold in the dataset."""
+
+    name: str
+    train: np.array
+    test: np.array
+
+
+def load_tube_array(dataset: "SOMDataset", tube: str) -> np.array:
+    """Get SOMs of a tube for all cases as a single array."""
+    cases = list(dataset)
+    if any(tube in case.data for case in cases):
+        return np.array([case.get_tube(tube) for case in cases])
+    return som_codec.load_arrays([case.soms[tube] for case in cases])
+
+
+def save_shared_arrays(
+        dataset: "SOMDataset",
+        tubes: Iterable[str],
+        path: utils.URLPath,
+        padding: int = 0,
+        stored_padding: Dict[str, int] = None) -> Dict[str, str]:
+    """Save SOMs of every tube as a single array file to be mapped by workers.
+
+    Args:
+        padding: Store SOMs wrap padded, so that batches are sliced without padding.
+        stored_padding: Padding of SOMs in the dataset per tube, which is
+            adjusted to the given padding.
+    Returns:
+        Paths of array files by tube.
+    """
+    path.mkdir()
+    paths = {}
+    for tube in tubes:
+        tube_path = path / f"t{tube}.npy"
+        data = repad_batch(load_tube_array(dataset, tube), (stored_padding or {}).get(tube, 0), padding)
+        np.save(str(tube_path), data)
+        paths[tube] = str(tube_path)
+    return paths
+
+
+def load_shared_arrays(paths: Dict[str, str]) -> Dict[str, np.array]:
+    return {tube: np.load(path, mmap_mode="r") for tube, path in paths.items()}
+
+
+def _init_worker(threads: int, array_paths: Dict[str, str], padding: int, labels: list, groups: list):
+    for name in THREAD_VARIABLES:
+        os.environ[name] = str(threads)
+    _SHARED["threads"] = threads
+    _SHARED["padding"] = padding
+    _SHARED["arrays"] = load_shared_arrays(array_paths)
+    _SHARED["labels"] = labels
+    _SHARED["groups"] = groups
+
+
+def _reset_session(threads: int):
+    """Clear the graph of a previous fold and limit threads of the new session."""
+    import tensorflow as tf
+    import keras
+
+    keras.backend.clear_session()
+    keras.backend.set_session(tf.Session(config=tf.ConfigProto(
+        intra_op_parallelism_threads=threads,
+        inter_op_parallelism_threads=threads)))
+
+
+def _fold_dataset(indexes: np.array, tubes: dict) -> "SOMDataset":
+    """Create SOM dataset of the cases at the given positions with data mapped from the shared arrays."""
+    from .som_dataset import SOMCase, SOMDataset
+
+    arrays = _SHARED["arrays"]
+    cases = [
+        SOMCase(
+            label=_SHARED["labels"][i],
+            group=_SHARED["groups"][i],
+            data={tube: array[i] for tube, array in arrays.items()})
+        for i in indexes
+    ]
+    config = {tube: {**tubes[tube], "padding": _SHARED["padding"]} for tube in arrays}
+    return SOMDataset(pd.Series(cases), config=config)
+
+
+def _run_fold(args) -> dict:
+    from .classifier import SOMClassifier
+    from .models import create_model_multi_input
+
+    fold, config, output, balance, class_weights, model_fun, save_model = args
+    _reset_session(_SHARED["threads"])
+
+    train = _fold_dataset(fold.train, config.tubes)
+    test = _fold_dataset(fold.test, config.tubes)
+    sampler = create_sampler(train.groups, balance)
+
+    model = SOMClassifier(config)
+    model.create_model(model_fun or create_model_multi_input)
+    model.train_generator(
+        model.create_sequence(train, config.train_batch_size, sampler=sampler),
+        epochs=config.train_epochs, class_weight=class_weights)
+
+    pred_arr, pred_labels = model.predict_generator(model.create_sequence(test, config.valid_batch_size))
+    predictions = pd.DataFrame(pred_arr, index=test.labels, columns=model.binarizer.classes_)
+    predictions["group"] = test.groups
+    predictions["prediction"] = pred_labels
+    predictions["fold"] = fold.name
+
+    fold_output = output / fold.name
+    mapping = {"groups": config.groups, "map": {}}
+    confusion, metrics = generate_all_metrics(test.groups, pred_labels, mapping, fold_output)
+    io_functions.save_csv(predictions, fold_output / "predictions.csv")
+    if save_model:
+        model.save(fold_output / "model")
+
+    return {
+        "name": fold.name,
+        "train_size": len(train),
+        "test_size": len(test),
+        "metrics": {name: float(value) for name, value in metrics.items()},
+        "confusion": confusion,
+        "predictions": predictions,
+    }
+
+
+def run_folds(
+        dataset: "SOMDataset",
+        folds: List[Fold],
+        config: "SOMClassifierConfig",
+        output: utils.URLPath,
+        workers: int = 4,
+        balance: dict = None,
+        class_weights: dict = None,
+        model_fun: Callable = None,
+        save_model: bool = False) -> List[dict]:
+    """Train and evaluate a classifier for every fold in a pool of worker processes.
+
+    Args:
+        dataset: SOM dataset with groups already mapped and filtered.
+        folds: Train and test positions in the dataset.
+        config: Classifier configuration used for all folds.
+        output: Directory for shared arrays and results of each fold.
+        workers: Number of folds trained concurrently, cpus are divided equally among them.
+        balance: Training cases per group drawn every epoch, see sampling.create_sampler.
+        model_fun: Function creating the keras model, needs to be picklable.
+        save_model: Save the trained classifier of every fold.
+    Returns:
+        List of fold results with sizes, metrics, confusion matrix and predictions.
+    """
+    workers = max(1, min(workers, len(folds)))
+    threads = utils.thread_budget(workers)
+    labels = dataset.labels
+    stored_padding = {
+        tube: tube_config.get("padding", 0)
+        for tube, tube_config in dataset.config.items() if isinstance(tube_config, dict)
+    }
+    array_paths = save_shared_arrays(
+        dataset, config.tubes, output / "arrays", padding=config.pad_width, stored_padding=stored_padding)
+    io_functions.save_json(
+        {
+            fold.name: {"train": [labels[i] for i in fold.train], "test": [labels[i] for i in fold.test]}
+            for fold in folds
+        },
+        output / "folds.json")
+
+    LOGGER.info("Running %d folds in %d workers with %d threads each", len(folds), workers, threads)
+    jobs = [(fold, config, output, balance, class_weights, model_fun, save_model) for fold in folds]
+    results = {}
+    with multiprocessing.get_context("spawn").Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(threads, array_paths, config.pad_width, labels, dataset.groups)) as pool:
+        for result in pool.imap_unordered(_run_fold, jobs):
+            LOGGER.info("Finished fold %s: %s", result["name"], result["metrics"])
+            results[result["name"]] = result
+    return [results[fold.name] for fold in folds]
+
+
+def aggregate_results(results: List[dict], groups: list, output: utils.URLPath) -> dict:
+    """Create a single report from the results of all folds.
+
+    Metrics are summarized as mean and standard deviation over folds and
+    additionally calculated on the pooled out-of-fold predictions.
+    """
+    fold_metrics = pd.DataFrame(
+        [result["metrics"] for result in results], index=[result["name"] for result in results])
+    predictions = pd.concat([result["predictions"] for result in results])
+
+    confusion, metrics = generate_all_metrics(
+        list(predictions["group"]), list(predictions["prediction"]), {"groups": groups, "map": {}}, output / "pooled")
+    report = {
+        "folds": fold_metrics.to_dict("index"),
+        "mean": fold_metrics.mean().to_dict(),
+        "std": fold_metrics.std().to_dict(),
+        "pooled": {name: float(value) for name, value in metrics.items()},
+        "confusion": confusion.values.tolist(),
+    }
+    io_functions.save_csv(fold_metrics, output / "fold_metrics.csv")
+    io_functions.save_csv(predictions, output / "predictions.csv")
+    io_functions.save_json(report, output / "report.json")
+    return report
+
+
+def cross_validate(
+        dataset: "SOMDataset",
+        config: "SOMClassifierConfig",
+        output: utils.URLPath,
+        folds: int = 10,
+        seed=None,
+        **kwargs) -> dict:
+    """Run stratified k-fold cross-validation, see run_folds for further arguments."""
+    fold_splits = [
+        Fold(f"fold_{i}", train, test)
+        for i, (train, test) in enumerate(splits.stratified_kfold(dataset.groups, folds, seed=seed))
+    ]
+    results = run_folds(dataset, fold_splits, config, output, **kwargs)
+    return aggregate_results(results, config.groups, output)
+
+
+def learning_curve(
+        dataset: "SOMDataset",
+        config: "SOMClassifierConfig",
+        output: utils.URLPath,
+        sizes: List[float],
+        test_num: float = 0.2,
+        seed: int = None,
+        **kwargs) -> dict:
+    """Train on nested training subsets of increasing size and test on a single held-out set.
+
+    Args:
+        sizes: Fractions or numbers of training cases per group.
+        test_num: Fraction or number of held-out cases per group.
+    """
+    rng = np.random.RandomState(seed)
+    test, train = splits.holdout_split(dataset.groups, test_num, seed=rng)
+    train_groups = [dataset.groups[i] for i in train]
+    fold_splits = [
+        Fold(f"size_{size}", train[subset], test)
+        for size, subset in zip(sizes, splits.learning_curve(train_groups, sizes, seed=rng))
+    ]
+    results = run_folds(dataset, fold_splits, config, output, **kwargs)
+
+    report = {
+        result["name"]: {"train_size": result["train_size"], **result["metrics"]}
+        for result in results
+    }
+    io_functions.save_csv(pd.DataFrame.from_dict(report, orient="index"), output / "learning_curve.csv")
+    io_functions.save_json(report, output / "report.json")
+    return report
@@ -0,0 +1,208 @@
+"""
+Inference of SOM classifiers with numpy only.
+
+Keras models built from Conv2D, GlobalMaxPooling2D, Concatenate and Dense
+layers, such as create_model_multi_input, are exported into a bundle file
+with their weights and layer graph. The bundle is evaluated layer by layer
+without importing keras or tensorflow. Convolutions are computed as a single
+matrix multiplication of the im2col windows of the whole batch.
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from flowcat import io_functions, utils
+from .padding import pad_stored_arrays
+
+
+SUPPORTED_LAYERS = ("InputLayer", "Conv2D", "GlobalMaxPooling2D", "Concatenate", "Dense")
+
+BUNDLE_PREFIX = "numpy_classifier"
+
+
+def relu(data: np.array) -> np.array:
+    return np.maximum(data, 0, out=data)
+
+
+def softmax(data: np.array) -> np.array:
+    data = np.exp(data - data.max(axis=-1, keepdims=True))
+    return data / data.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    "linear": lambda data: data,
+    "relu": relu,
+    "softmax": softmax,
+}
+
+
+def im2col(data: np.array, kernel_size: Tuple[int, int], strides: Tuple[int, int]) -> np.array:
+    """Get all convolution windows of a batch [batch, rows, cols, channels].
+
+    Returns:
+        Array of shape [batch, out rows, out cols, kernel rows * kernel cols * channels].
+    """
+    data = np.ascontiguousarray(data)
+    batch, rows, cols, channels = data.shape
+    krows, kcols = kernel_size
+    srows, scols = strides
+    out_rows = (rows - krows) // srows + 1
+    out_cols = (cols - kcols) // scols + 1
+    sbatch, srow, scol, schannel = data.strides
+    windows = np.lib.stride_tricks.as_strided(
+        data,
+        shape=(batch, out_rows, out_cols, krows, kcols, channels),
+        strides=(sbatch, srow * srows, scol * scols, srow, scol, schannel),
+        writeable=False)
+    return windows.reshape(batch, out_rows, out_cols, krows * kcols * channels)
+
+
+def conv2d(data: np.array, kernel: np.array, bias: np.array = None, strides: Tuple[int, int] = (1, 1)) -> np.array:
+    """Valid convolution with kernel of shape [kernel rows, kernel cols, in channels, filters]."""
+    columns = im2col(data, kernel.shape[:2], strides)
+    result = columns @ kernel.reshape(-1, kernel.shape[-1])
+    if bias is not None:
+        result += bias
+    return result
+
+
+def _check_layer(layer: dict):
+    if layer["class"] not in SUPPORTED_LAYERS:
+        raise ValueError(f"Layer {layer['name']} of type {layer['class']} is not supported.")
+    config = layer["config"]
+    if layer["class"] == "Conv2D":
+        if config["padding"] != "valid" or config["data_format"] != "channels_last":
+            raise ValueError(f"Only valid channels_last convolutions are supported, got {layer['name']}.")
+        if tuple(config["dilation_rate"]) != (1, 1):
+            raise ValueError(f"Dilated convolutions are not supported, got {layer['name']}.")
+    if config.get("activation", "linear") not in ACTIVATIONS:
+        raise ValueError(f"Activation {config['activation']} of {layer['name']} is not supported.")
+
+
+def model_to_bundle(model: "keras.models.Model", prefix: str = BUNDLE_PREFIX) -> Tuple[Dict[str, np.array], dict]:
+    """Get layer graph and weights of a keras model for saving in a bundle.
+
+    Raises:
+        ValueError if the model contains unsupported layers.
+    """
+    arrays = {}
+    layers = []
+    for layer in model.layers:
+        config = layer.get_config()
+        layer_info = {
+            "name": layer.name,
+            "class": layer.__class__.__name__,
+            "config": {
+                key: config[key]
+                for key in ("strides", "padding", "data_format", "dilation_rate", "activation", "axis")
+                if key in config
+            },
+            "inbound": [
+                inbound.name for node in layer._inbound_nodes[:1] for inbound in node.inbound_layers
+            ],
+            "num_weights": len(layer.get_weights()),
+        }
+        _check_layer(layer_info)
+        for i, weight in enumerate(layer.get_weights()):
+            arrays[f"{prefix}/{layer.name}/{i}"] = weight.astype(np.float32)
+        layers.append(layer_info)
+    meta = {
+        "layers": layers,
+        "inputs": list(model.input_names),
+        "outputs": list(model.output_names),
+    }
+    return arrays, meta
+
+
+class NumpyModel:
+    """Batched forward pass of an exported keras model."""
+
+    def __init__(self, layers: List[dict], weights: Dict[str, List[np.array]], inputs: List[str], outputs: List[str]):
+        for layer in layers:
+            _check_layer(layer)
+        self.layers = layers
+        self.weights = weights
+        self.inputs = inputs
+        self.outputs = outputs
+
+    @classmethod
+    def from_bundle(cls, arrays: Dict[str, np.array], meta: dict, prefix: str = BUNDLE_PREFIX) -> "NumpyModel":
+        weights = {
+            layer["name"]: [arrays[f"{prefix}/{layer['name']}/{i}"] for i in range(layer["num_weights"])]
+            for layer in meta["layers"]
+        }
+        return cls(meta["layers"], weights, meta["inputs"], meta["outputs"])
+
+    def _run_layer(self, layer: dict, inputs: List[np.array]) -> np.array:
+        config = layer["config"]
+        weights = self.weights[layer["name"]]
+        if layer["class"] == "Conv2D":
+            result = conv2d(inputs[0], *weights, strides=config["strides"])
+        elif layer["class"] == "Dense":
+            result = inputs[0] @ weights[0]
+            if len(weights) > 1:
+                result += weights[1]
+        elif layer["class"] == "GlobalMaxPooling2D":
+            result = inputs[0].max(axis=(1, 2))
+        elif layer["class"] == "Concatenate":
+            result = np.concatenate(inputs, axis=config["axis"])
+        return ACTIVATIONS[config.get("activation", "linear")](result)
+
+    def predict(self, data: List[np.array]) -> np.array:
+        """Predict a batch given as a list of arrays in the order of the model inputs."""
+        if len(data) != len(self.inputs):
+            raise ValueError(f"Expected {len(self.inputs)} inputs, got {len(data)}")
+        outputs = {name: np.asarray(array, dtype=np.float32) for name, array in zip(self.inputs, data)}
+        for layer in self.layers:
+            if layer["class"] == "InputLayer":
+                continue
+            outputs[layer["name"]] = self._run_layer(layer, [outputs[name] for name in layer["inbound"]])
+        result = [outputs[name] for name in self.outputs]
+        return result[0] if len(result) == 1 else result
+
+
+class NumpySOMClassifier:
+    """SOM classifier predicting with a numpy model, see SOMClassifier."""
+
+    def __init__(self, config: "SOMClassifierConfig", model: NumpyModel, classes: list, data_ids: dict = None):
+        self.config = config
+        self.model = model
+        self.classes = classes
+        self.data_ids = data_ids
+
+    @classmethod
+    def load(cls, path: utils.URLPath, verify: bool = True) -> "NumpySOMClassifier":
+        from flowcat.types.classifier_config import SOMClassifierConfig
+
+        arrays, meta = io_functions.load_bundle(path, verify=verify)
+        return cls(
+            SOMClassifierConfig(**meta["config"]),
+            NumpyModel.from_bundle(arrays, meta["model"]),
+            meta["classes"],
+            meta["data_ids"])
+
+    def array_from_cases(self, cases) -> List[np.array]:
+        """Get padded model inputs, SOMs stored with padding are adjusted to the pad width."""
+        return [
+            pad_stored_arrays(
+                [case.get_tube(tube, kind="som").get_data().data for case in cases],
+                config["dims"], self.config.pad_width)
+            for tube, config in self.config.tubes.items()
+        ]
+
+    def predict(self, data) -> List[dict]:
+        """Predict on a list of cases or som samples."""
+        preds = self.model.predict(self.array_from_cases(data))
+        return [dict(zip(self.classes, pred)) for pred in preds]
+
+
+def save_classifier(classifier: "SOMClassifier", path: utils.URLPath):
+    """Export a trained SOMClassifier to a bundle usable by NumpySOMClassifier."""
+    arrays, model_meta = model_to_bundle(classifier.model)
+    meta = {
+        "config": classifier.config.to_json(),
+        "model": model_meta,
+        "classes": list(classifier.binarizer.classes_),
+        "data_ids": classifier.data_ids,
+    }
+    io_functions.save_bundle(arrays, meta, path)
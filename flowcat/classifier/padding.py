@@ -0,0 +1,92 @@
+"""
+Wrap padding of toroidal SOMs for classifier inputs.
+"""
+import numpy as np
+
+
+def pad_array(array, pad_width):
+    if pad_width > 0:
+        array = np.pad(array, pad_width=[
+            (pad_width, pad_width),
+            (pad_width, pad_width),
+            (0, 0),
+        ], mode="wrap")
+    return array
+
+
+def _fill_wrap(buffer, pad_width):
+    """Fill borders of a batch [batch, m, n, channels] from its center in place."""
+    p = pad_width
+    buffer[:, :p, p:-p] = buffer[:, -2 * p:-p, p:-p]
+    buffer[:, -p:, p:-p] = buffer[:, p:2 * p, p:-p]
+    # columns last, so that corners are copied from the filled rows
+    buffer[:, :, :p] = buffer[:, :, -2 * p:-p]
+    buffer[:, :, -p:] = buffer[:, :, p:2 * p]
+    return buffer
+
+
+def pad_batch(batch, pad_width):
+    """Pad a batch of SOMs of shape [batch, m, n, channels]."""
+    if pad_width <= 0:
+        return batch
+    _, rows, cols, channels = batch.shape
+    if pad_width > min(rows, cols):
+        return np.pad(batch, pad_width=[
+            (0, 0),
+            (pad_width, pad_width),
+            (pad_width, pad_width),
+            (0, 0),
+        ], mode="wrap")
+    buffer = np.empty(
+        (len(batch), rows + 2 * pad_width, cols + 2 * pad_width, channels), dtype=batch.dtype)
+    buffer[:, pad_width:-pad_width, pad_width:-pad_width] = batch
+    return _fill_wrap(buffer, pad_width)
+
+
+def pad_arrays(arrays, pad_width):
+    """Gather a list of SOMs of shape [m, n, channels] into a single padded batch."""
+    if isinstance(arrays, np.ndarray):
+        return pad_batch(arrays, pad_width)
+    if pad_width <= 0 or not arrays:
+        return np.array(arrays)
+    rows, cols, channels = arrays[0].shape
+    if pad_width > min(rows, cols):
+        return pad_batch(np.array(arrays), pad_width)
+    buffer = np.empty(
+        (len(arrays), rows + 2 * pad_width, cols + 2 * pad_width, channels),
+        dtype=arrays[0].dtype)
+    for i, array in enumerate(arrays):
+        buffer[i, pad_width:-pad_width, pad_width:-pad_width] = array
+    return _fill_wrap(buffer, pad_width)
+
+
+def repad_batch(batch, stored_padding, pad_width):
+    """Get batch with the given padding from SOMs stored with padding."""
+    if stored_padding == pad_width:
+        return batch
+    # wider padding is cropped, narrower padding is replaced, since borders
+    # of a padded SOM do not wrap around with the padded size
+    crop = stored_padding - pad_width if stored_padding > pad_width else stored_padding
+    batch = batch[:, crop:batch.shape[1] - crop, crop:batch.shape[2] - crop]
+    if stored_padding > pad_width:
+        return batch
+    return pad_batch(batch, pad_width)
+
+
+def stored_padding(shape, dims) -> int:
+    """Get padding of a SOM of the given shape stored for a map of dims [m, n, ...]."""
+    rows, cols = shape[0] - dims[0], shape[1] - dims[1]
+    if rows != cols or rows < 0 or rows % 2:
+        raise ValueError(f"SOM of shape {tuple(shape)} does not fit map dims {tuple(dims)}")
+    return rows // 2
+
+
+def pad_stored_arrays(arrays, dims, pad_width):
+    """Gather SOMs stored with any padding into a single batch with the given padding."""
+    paddings = {stored_padding(array.shape, dims) for array in arrays}
+    if len(paddings) > 1:
+        raise ValueError(f"SOMs in batch are stored with different paddings: {sorted(paddings)}")
+    padding = paddings.pop() if paddings else 0
+    if padding:
+        return repad_batch(np.asarray(arrays), padding, pad_width)
+    return pad_arrays(arrays, pad_width)
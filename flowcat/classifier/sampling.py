@@ -0,0 +1,86 @@
+"""
+Sampling of case positions for every training epoch.
+
+Instead of duplicating cases to balance groups, samplers draw positions of
+unique cases anew for every epoch, so that SOMs only need to be loaded once.
+"""
+from typing import Dict, Union
+
+import numpy as np
+
+
+class EpochSampler:
+    """Draw case positions of an epoch by group.
+
+    Policies:
+        counts: Draw the given number of cases per group with replacement.
+            Groups missing from counts contribute all their cases once.
+        inverse_frequency: Draw epoch_size cases with replacement, weighting
+            cases inversely to the size of their group.
+        epoch_size: Draw the given number of cases uniformly with replacement.
+        Without any policy all cases are used once in random order.
+    """
+
+    def __init__(
+            self,
+            groups: list,
+            counts: Dict[str, int] = None,
+            inverse_frequency: bool = False,
+            epoch_size: int = None,
+            seed=None):
+        if counts and (inverse_frequency or epoch_size):
+            raise ValueError("Group counts cannot be combined with weighted sampling.")
+
+        self.groups = np.asarray(groups, dtype=str)
+        self.counts = counts
+        self.inverse_frequency = inverse_frequency
+        self._epoch_size = epoch_size
+        self.rng = np.random.RandomState(seed)
+
+        self.group_positions = {
+            group: np.flatnonzero(self.groups == group) for group in np.unique(self.groups)
+        }
+        if inverse_frequency:
+            sizes = {group: len(positions) for group, positions in self.group_positions.items()}
+            weights = np.array([1 / sizes[group] for group in self.groups])
+            self.weights = weights / weights.sum()
+        else:
+            self.weights = None
+
+    @property
+    def epoch_size(self) -> int:
+        if self.counts:
+            return sum(
+                self.counts.get(group, len(positions)) for group, positions in self.group_positions.items())
+        return self._epoch_size or len(self.groups)
+
+    def sample(self) -> np.array:
+        """Get case positions of a new epoch in random order."""
+        if self.counts:
+            positions = np.concatenate([
+                self.rng.choice(positions, self.counts[group], replace=True) if group in self.counts else positions
+                for group, positions in self.group_positions.items()
+            ])
+            return self.rng.permutation(positions)
+        if self.weights is None and self._epoch_size is None:
+            return self.rng.permutation(len(self.groups))
+        return self.rng.choice(len(self.groups), self.epoch_size, replace=True, p=self.weights)
+
+    def __repr__(self):
+        return f"<EpochSampler {len(self.groups)} cases, {self.epoch_size} per epoch>"
+
+
+def create_sampler(groups: list, balance: Union[dict, int, str], seed=None) -> EpochSampler:
+    """Create sampler from a balance setting.
+
+    Args:
+        balance: Dict of case counts per group, a single count for all groups
+            or 'inverse' for inverse frequency weighting.
+    """
+    if balance is None:
+        return None
+    if balance == "inverse":
+        return EpochSampler(groups, inverse_frequency=True, seed=seed)
+    if isinstance(balance, dict):
+        return EpochSampler(groups, counts=balance, seed=seed)
+    return EpochSampler(groups, counts={group: int(balance) for group in set(groups)}, seed=seed)
@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 from dataslots import with_slots
-from typing import List, Tuple, Dict
+from typing import Iterable, List, Tuple, Dict
 
 import numpy as np
 import pandas as pd
@@ -8,17 +8,10 @@ import pandas as pd
 from tensorflow import keras
 
 from flowcat import utils, io_functions
+from flowcat.dataset import splits
 from flowcat.types.som import SOM
-
-
-def pad_array(array, pad_width):
-    if pad_width > 0:
-        array = np.pad(array, pad_width=[
-            (pad_width, pad_width),
-            (pad_width, pad_width),
-            (0, 0),
-        ], mode="wrap")
-    return array
+from flowcat.types import som_codec
+from .padding import pad_arrays, repad_batch
 
 
 @with_slots
@@ -35,9 +28,9 @@ class SOMCase:
     def get_tube(self, tube: str, store: bool = False, **_) -> SOM:
         if tube not in self.data:
             sompath = self.soms[tube]
-            data = np.load(sompath)
+            data = som_codec.load_array(sompath)
             if store:
-                self.data[tube] = np.load(sompath)
+                self.data[tube] = data
             return data
         return self.data[tube]
 
@@ -45,11 +38,12 @@ class SOMCase:
         return f"<SOMCase {self.label} {self.group}"
 
 
-def load_som_cases(row, path, tubes):
+def load_som_cases(row, path, tubes, suffixes=None):
     """Create SomCase (with path to SOM npy file) for a given combination of row info and path."""
     sompath = path / str(row["label"])
+    suffixes = suffixes or {}
     soms = {
-        tube: sompath + f"_t{tube}.npy" for tube in tubes
+        tube: sompath + f"_t{tube}{suffixes.get(tube, '.npy')}" for tube in tubes
     }
     return SOMCase(soms=soms, group=row["group"], label=row["label"])
 
@@ -86,14 +80,22 @@ class SOMDataset:
         except FileNotFoundError:
             metadata = from_case_dataset(path)
         tubes = list(config.keys())
+        suffixes = {
+            tube: som_codec.storage_suffix(config[tube].get("storage", "float32"))
+            for tube in tubes if isinstance(config[tube], dict)
+        }
         data_path = path / "data"
-        som_cases = metadata.apply(load_som_cases, axis=1, args=(data_path, tubes))
+        som_cases = metadata.apply(load_som_cases, axis=1, args=(data_path, tubes, suffixes))
         return cls(data=som_cases, config=config)
 
     @property
     def labels(self):
         return [s.label for s in self.data]
 
+    @property
+    def groups(self):
+        return [s.group for s in self.data]
+
     @property
     def group_count(self):
         return {
@@ -118,41 +120,19 @@ class SOMDataset:
     def get_tube(self, tube: int) -> List[SOM]:
         return [s.get_tube(tube) for s in self.data]
 
-    def create_split(self, num: float, stratify: bool = True) -> Tuple["SOMDataset", "SOMDataset"]:
-        if stratify:
-            trains = []
-            valids = []
-            for group, data in self.data.groupby(by=lambda s: self.data[s].group):
-                data.reset_index(drop=True, inplace=True)
-                data = data.reindex(np.random.permutation(data.index))
-                if num < 1:
-                    pivot = round(num * len(data))
-                else:
-                    pivot = int(num)
-                trains.append(data[:pivot])
-                valids.append(data[pivot:])
-            train = pd.concat(trains)
-            validate = pd.concat(valids)
-        else:
-            data = self.data.reindex(np.random.permutation(data.index))
-            pivot = round(num * len(data))
-            if num < 1:
-                pivot = round(num * len(data))
-            else:
-                pivot = int(num)
-            train = data[pivot:]
-            validate = data[:pivot]
+    def take(self, indexes: Iterable[int]) -> "SOMDataset":
+        """Create dataset of the cases at the given positions, cases are not copied."""
+        return self.__class__(self.data.iloc[np.asarray(indexes, dtype=int)].reset_index(drop=True), config=self.config)
 
-        # reset index and shuffle randomly
-        train.reset_index(drop=True, inplace=True)
-        train = train.reindex(np.random.permutation(train.index))
-        validate.reset_index(drop=True, inplace=True)
-        validate = validate.reindex(np.random.permutation(validate.index))
+    def create_split(self, num: float, stratify: bool = True, seed=None) -> Tuple["SOMDataset", "SOMDataset"]:
+        """Split into randomly ordered train and validation datasets.
 
-        return (
-            self.__class__(train, config=self.config),
-            self.__class__(validate, config=self.config),
-        )
+        Args:
+            num: Fraction or number of training cases, per group if stratified.
+            seed: Seed or random state, see flowcat.dataset.splits.
+        """
+        train, validate = splits.holdout_split(self.groups, num, stratify=stratify, seed=seed)
+        return self.take(train), self.take(validate)
 
     def balance(self, num_per_group: int) -> "SOMDataset":
         """Randomly upsample groups with samples less than num_per_group,
@@ -210,6 +190,14 @@ def default_getter(sample, tube):
     return sample.get_tube(tube)
 
 
+def batch_getter(batch, tube):
+    """Load a tube for all cases of a batch, so that delta encoded SOMs are
+    reconstructed together."""
+    if any(tube in s.data for s in batch):
+        return np.array([s.get_tube(tube) for s in batch])
+    return som_codec.load_arrays([s.soms[tube] for s in batch])
+
+
 class SOMSequence(keras.utils.Sequence):
 
     def __init__(
@@ -219,15 +207,35 @@ class SOMSequence(keras.utils.Sequence):
             tube: List[str],
             get_array_fun=default_getter,
             batch_size: int = 32,
-            pad_width: int = 0):
+            pad_width: int = 0,
+            get_batch_fun=None,
+            sampler: "EpochSampler" = None,
+            stored_padding: Dict[str, int] = None):
+        """
+        Args:
+            get_array_fun: Get SOM array of a tube for a single case.
+            get_batch_fun: Optionally get SOM arrays of a tube for all cases
+                in a batch at once, used instead of get_array_fun.
+            sampler: Optionally draw the cases of every epoch from the
+                dataset, see flowcat.classifier.sampling. SOMs are then
+                cached per unique case instead of per batch.
+            stored_padding: Padding of stored SOMs per tube, which is
+                adjusted to pad_width.
+        """
         self.dataset = dataset
         self.tube = tube
         self.get_array_fun = get_array_fun
+        self.get_batch_fun = get_batch_fun
         self.batch_size = batch_size
         self.binarizer = binarizer
         self.pad_width = pad_width
+        self.sampler = sampler
+        self.stored_padding = stored_padding or {}
 
         self._cache = {}
+        if sampler is not None:
+            self._cases = list(dataset)
+            self._positions = sampler.sample()
 
     @property
     def true_labels(self):
@@ -238,26 +246,63 @@ class SOMSequence(keras.utils.Sequence):
         batch = self.dataset.get_labels(labels)
         return self._create_batch(batch)
 
+    def _pad(self, arrays, tube: str) -> np.array:
+        stored_padding = self.stored_padding.get(tube, 0)
+        if stored_padding:
+            return repad_batch(np.asarray(arrays), stored_padding, self.pad_width)
+        return pad_arrays(arrays, self.pad_width)
+
     def _create_batch(self, batch: List[SOMCase]) -> Tuple[np.array, np.array]:
         inputs = []
         for tube in self.tube:
-            x_batch = np.array([
-                pad_array(
-                    self.get_array_fun(s, tube),
-                    # s.get_tube(tube, kind="som").get_data().data,
-                    self.pad_width,
-                ) for s in batch
-            ])
-            inputs.append(x_batch)
+            if self.get_batch_fun is not None:
+                arrays = self.get_batch_fun(batch, tube)
+            else:
+                arrays = [self.get_array_fun(s, tube) for s in batch]
+            inputs.append(self._pad(arrays, tube))
 
         y_labels = [s.group for s in batch]
         y_batch = self.binarizer.transform(y_labels)
         return inputs, y_batch
 
+    def _load_cases(self, positions: List[int]):
+        """Load SOMs of cases at the given positions that have not been loaded yet."""
+        missing = [p for p in dict.fromkeys(positions) if p not in self._cache]
+        if not missing:
+            return
+        cases = [self._cases[p] for p in missing]
+        arrays = {}
+        for tube in self.tube:
+            if self.get_batch_fun is not None:
+                arrays[tube] = self.get_batch_fun(cases, tube)
+            else:
+                arrays[tube] = [self.get_array_fun(s, tube) for s in cases]
+        for i, position in enumerate(missing):
+            self._cache[position] = {tube: arrays[tube][i] for tube in self.tube}
+
+    def _create_sampled_batch(self, positions: List[int]) -> Tuple[np.array, np.array]:
+        self._load_cases(positions)
+        inputs = [
+            self._pad([self._cache[p][tube] for p in positions], tube)
+            for tube in self.tube
+        ]
+        y_batch = self.binarizer.transform([self._cases[p].group for p in positions])
+        return inputs, y_batch
+
+    def on_epoch_end(self):
+        if self.sampler is not None:
+            self._positions = self.sampler.sample()
+
     def __len__(self) -> int:
+        if self.sampler is not None:
+            return int(np.ceil(self.sampler.epoch_size / float(self.batch_size)))
         return int(np.ceil(len(self.dataset) / float(self.batch_size)))
 
     def __getitem__(self, idx: int) -> Tuple[np.array, np.array]:
+        if self.sampler is not None:
+            return self._create_sampled_batch(
+                self._positions[idx * self.batch_size:(idx + 1) * self.batch_size])
+
         if idx in self._cache:
             return self._cache[idx]
 
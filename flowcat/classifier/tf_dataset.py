@@ -0,0 +1,156 @@
+"""
+Input pipeline for SOM classifiers using tf.data.
+
+SOMs are loaded by python functions mapped in parallel over case positions,
+padded in graph and prefetched, so that batches are ready before the model
+requests them. Batches are fed to keras fit_generator from the session of
+the keras backend.
+"""
+from typing import Dict, List
+
+import numpy as np
+import tensorflow as tf
+import keras
+
+from flowcat import utils
+
+
+def wrap_pad(batch: tf.Tensor, pad_width: int) -> tf.Tensor:
+    """Wrap pad a batch tensor of shape [batch, m, n, channels] on both map axes."""
+    if pad_width <= 0:
+        return batch
+    batch = tf.concat([batch[:, -pad_width:], batch, batch[:, :pad_width]], axis=1)
+    return tf.concat([batch[:, :, -pad_width:], batch, batch[:, :, :pad_width]], axis=2)
+
+
+def repad(batch: tf.Tensor, stored_padding: int, pad_width: int) -> tf.Tensor:
+    """Get batch tensor with the given padding from SOMs stored with padding.
+
+    See flowcat.classifier.padding.repad_batch.
+    """
+    if stored_padding == pad_width:
+        return batch
+    crop = stored_padding - pad_width if stored_padding > pad_width else stored_padding
+    rows, cols = int(batch.shape[1]), int(batch.shape[2])
+    batch = batch[:, crop:rows - crop, crop:cols - crop]
+    if stored_padding > pad_width:
+        return batch
+    return wrap_pad(batch, pad_width)
+
+
+class SOMTFDataset:
+    """Endless batches of a SOM dataset produced by a tf.data pipeline.
+
+    Without sampler, SOMs are shuffled in graph every epoch and can be cached
+    to a local file after loading. With sampler, case positions of every
+    epoch are drawn by the sampler and SOMs are kept in memory once loaded.
+    """
+
+    def __init__(
+            self,
+            dataset: "SOMDataset",
+            binarizer,
+            tube: List[str],
+            get_array_fun,
+            batch_size: int = 32,
+            pad_width: int = 0,
+            sampler: "EpochSampler" = None,
+            stored_padding: Dict[str, int] = None,
+            cache: utils.URLPath = None,
+            parallel_calls: int = None,
+            prefetch: int = 4,
+            seed: int = None):
+        """
+        Args:
+            get_array_fun: Get SOM array of a tube for a single case.
+            sampler: Optionally draw the cases of every epoch, see flowcat.classifier.sampling.
+            stored_padding: Padding of stored SOMs per tube, which is adjusted to pad_width.
+            cache: File to cache loaded SOMs to, only used without sampler.
+            parallel_calls: Number of SOMs loaded in parallel, defaults to the available cpus.
+            prefetch: Number of batches prepared in advance.
+        """
+        self.dataset = dataset
+        self.binarizer = binarizer
+        self.tube = tube
+        self.get_array_fun = get_array_fun
+        self.batch_size = batch_size
+        self.pad_width = pad_width
+        self.sampler = sampler
+        self.stored_padding = stored_padding or {}
+        self.cache = cache
+        self.parallel_calls = parallel_calls or utils.available_cpus()
+        self.prefetch = prefetch
+        self.seed = seed
+
+        self._cases = list(dataset)
+        self._loaded = {}
+        self.tf_dataset = self._create_pipeline()
+
+    @property
+    def epoch_size(self) -> int:
+        if self.sampler is not None:
+            return self.sampler.epoch_size
+        return len(self._cases)
+
+    def _load_case(self, position) -> tuple:
+        """Load SOMs of all tubes and the binarized label of a single case."""
+        position = int(position)
+        if position in self._loaded:
+            return self._loaded[position]
+        case = self._cases[position]
+        loaded = (
+            *[np.asarray(self.get_array_fun(case, tube), dtype=np.float32) for tube in self.tube],
+            self.binarizer.transform([case.group])[0].astype(np.float32),
+        )
+        if self.sampler is not None:
+            self._loaded[position] = loaded
+        return loaded
+
+    def _create_pipeline(self) -> tf.data.Dataset:
+        shapes = [array.shape for array in self._load_case(0)]
+
+        def load(position):
+            tensors = tf.py_func(self._load_case, [position], [tf.float32] * len(shapes))
+            for tensor, shape in zip(tensors, shapes):
+                tensor.set_shape(shape)
+            return tuple(tensors)
+
+        def pad(*tensors):
+            inputs = tuple(
+                repad(tensor, self.stored_padding.get(tube, 0), self.pad_width)
+                for tube, tensor in zip(self.tube, tensors[:-1])
+            )
+            return inputs, tensors[-1]
+
+        if self.sampler is not None:
+            data = tf.data.Dataset.from_generator(self.sampler.sample, tf.int64, tf.TensorShape([]))
+            data = data.map(load, num_parallel_calls=self.parallel_calls)
+        elif self.cache is not None:
+            self.cache.parent.mkdir()
+            data = tf.data.Dataset.range(len(self._cases))
+            data = data.map(load, num_parallel_calls=self.parallel_calls).cache(str(self.cache))
+            data = data.shuffle(len(self._cases), seed=self.seed, reshuffle_each_iteration=True)
+        else:
+            data = tf.data.Dataset.range(len(self._cases))
+            data = data.shuffle(len(self._cases), seed=self.seed, reshuffle_each_iteration=True)
+            data = data.map(load, num_parallel_calls=self.parallel_calls)
+
+        data = data.batch(self.batch_size).map(pad, num_parallel_calls=self.parallel_calls)
+        return data.repeat().prefetch(self.prefetch)
+
+    def generator(self, session: tf.Session = None):
+        """Generate batches of model inputs and labels."""
+        session = session or keras.backend.get_session()
+        iterator = self.tf_dataset.make_initializable_iterator()
+        next_batch = iterator.get_next()
+        session.run(iterator.initializer)
+        while True:
+            inputs, labels = session.run(next_batch)
+            yield list(inputs), labels
+
+    def __len__(self) -> int:
+        """Number of batches in an epoch."""
+        return int(np.ceil(self.epoch_size / float(self.batch_size)))
+
+    def __repr__(self):
+        return f"<SOMTFDataset {len(self._cases)} cases, {len(self)} batches per epoch>"
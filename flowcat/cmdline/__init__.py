@@ -6,7 +6,9 @@ from .filter import filter
 from .reference import reference
 from .transform import transform
 from .dataset import dataset
+from .verify import verify
+from .merge import merge
 
 
 def main():
-    argmagic([predict, train, filter, reference, transform, dataset])
+    argmagic([predict, train, filter, reference, transform, dataset, verify, merge])
@@ -0,0 +1,32 @@
+import re
+
+from flowcat import utils, io_functions
+
+
+def merge(data: utils.URLPath, output: utils.URLPath = None, workers: int = 8):
+    """Merge SOM dataset shards created with transform --shard into a single dataset.
+
+    Args:
+        data: Directory containing shard_<index>_<count> SOM datasets.
+        output: Output directory of the merged dataset, defaults to data.
+        workers: Number of files exported concurrently.
+    """
+    shards = {}
+    for path in data.iterdir():
+        match = re.fullmatch(r"shard_(\d+)_(\d+)", path.name)
+        if match:
+            shards[(int(match.group(1)), int(match.group(2)))] = path
+
+    counts = {count for _, count in shards}
+    if len(counts) != 1:
+        raise ValueError(f"Expected shards of a single shard count in {data}, got {sorted(shards)}")
+    count, = counts
+    missing = [i for i in range(count) if (i, count) not in shards]
+    if missing:
+        raise ValueError(f"Missing shards {missing} of {count} in {data}")
+
+    if output is None:
+        output = data
+    paths = [shards[(i, count)] for i in range(count)]
+    merged = io_functions.merge_som_datasets(paths, output, workers=workers)
+    print(f"Merged {count} shards into {merged} at {output}")
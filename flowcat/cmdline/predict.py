@@ -1,6 +1,5 @@
-from flowcat import utils, classifier, io_functions
+from flowcat import utils, io_functions
 from flowcat.constants import GROUP_MAPS
-from flowcat.classifier import predictions as fc_predictions, som_dataset
 
 
 def predict(
@@ -18,13 +17,16 @@ def predict(
         output: Destination for plotting.
         labels: List of case ids to be filtered for generating predictions.
     """
+    from flowcat.classifier import predictions as fc_predictions, som_dataset
+    from flowcat.classifier.classifier import SOMClassifier
+
     print(f"Loaded cases from {data}")
     dataset = som_dataset.SOMDataset.from_path(data)
     if labels:
         labels = io_functions.load_json(labels)
         dataset = dataset.filter(labels=labels)
 
-    model = classifier.SOMClassifier.load(model)
+    model = SOMClassifier.load(model)
     data_sequence = model.create_sequence(dataset, 128)
 
     values, pred_labels = model.predict_generator(data_sequence)
@@ -1,6 +1,6 @@
 import json
 import logging
-from flowcat import utils, sommodels, io_functions
+from flowcat import utils, io_functions
 from flowcat.constants import DEFAULT_REFERENCE_SOM_ARGS
 
 
@@ -23,8 +23,12 @@ def reference(
         meta: utils.URLPath = None,
         tensorboard: bool = False,
         trainargs: json.loads = None,
-        selected_markers: json.loads = None):
+        selected_markers: json.loads = None,
+        intra_op_threads: utils.parse_thread_count = None,
+        inter_op_threads: utils.parse_thread_count = None):
     """Train new reference SOM from random using data filtered by labels."""
+    from flowcat.sommodels.casesom import CaseSom
+
     setup_logging()
 
     dataset = io_functions.load_case_collection(data, meta)
@@ -48,10 +52,12 @@ def reference(
     print("Creating SOM model with following parameters:")
     print(trainargs)
     print(selected_markers)
-    model = sommodels.casesom.CaseSom(
+    model = CaseSom(
         tubes=selected_markers,
         tensorboard_dir=tensorboard_dir,
         modelargs=trainargs,
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=inter_op_threads,
     )
     print(f"Training SOM")
     model.train(dataset)
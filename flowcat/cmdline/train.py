@@ -1,11 +1,13 @@
-from flowcat import utils, classifier, io_functions
+from flowcat import utils
 from flowcat.constants import GROUPS
-from flowcat.classifier import som_dataset
-from flowcat.flowcat_api import train_som_classifier, prepare_classifier_train_dataset
 
 
 def train(data: utils.URLPath, output: utils.URLPath):
     """Train a new classifier using SOM data."""
+    from flowcat.classifier import som_dataset
+    from flowcat.classifier.classifier import SOMClassifierConfig
+    from flowcat.flowcat_api import train_som_classifier, prepare_classifier_train_dataset
+
     groups = GROUPS
     tubes = ("1", "2", "3")
     balance = {
@@ -24,17 +26,16 @@ def train(data: utils.URLPath, output: utils.URLPath):
     train_dataset, validate_dataset = prepare_classifier_train_dataset(
         dataset,
         groups=groups,
-        mapping=mapping,
-        balance=balance)
+        mapping=mapping)
 
-    config = classifier.SOMClassifierConfig(**{
+    config = SOMClassifierConfig(**{
         "tubes": {tube: dataset.config[tube] for tube in tubes},
         "groups": groups,
         "pad_width": 2,
         "mapping": mapping,
         "cost_matrix": None,
     })
-    model = train_som_classifier(train_dataset, validate_dataset, config)
+    model = train_som_classifier(train_dataset, validate_dataset, config, balance=balance)
 
     model.save(output)
     model.save_information(output)
@@ -1,8 +1,16 @@
 import json
+from typing import Tuple
 
 from flowcat import utils, io_functions
 from flowcat.constants import DEFAULT_TRANSFORM_SOM_ARGS
-from flowcat.flowcat_api import transform_dataset_to_som
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse shard given as index/count, eg 0/4 for the first of four shards."""
+    if value is None or value == "":
+        return None
+    index, count = value.split("/")
+    return int(index), int(count)
 
 
 def transform(
@@ -11,23 +19,58 @@ def transform(
         output: utils.URLPath,
         reference: utils.URLPath,
         transargs: json.loads = None,
-        sample: int = 0):
+        sample: int = 0,
+        intra_op_threads: utils.parse_thread_count = None,
+        inter_op_threads: utils.parse_thread_count = None,
+        workers: int = 1,
+        storage: str = "float32",
+        threshold: float = None,
+        incremental: bool = False,
+        shard: parse_shard = None,
+        balance_shards: bool = False,
+        padding: int = 0):
     """Transform dataset using a reference SOM.
 
     Args:
         recreate: Delete and recreate SOMs even if they already exist.
         sample: Number of samples to transform from each group, only useful for testing purposes.
+        intra_op_threads: Threads per tensorflow session, number or 'auto'.
+        inter_op_threads: Threads for independent operations per session, number or 'auto'.
+        workers: Number of transform processes running on this machine, used for 'auto'.
+        storage: Storage type of SOM weights, one of float32, float16, uint8, uint16
+            or delta_float16, delta_uint8, delta_uint16 for differences to the reference.
+        threshold: Only store nodes differing more than threshold from the reference in delta storage types.
+        incremental: Update an existing SOM dataset in output, only transforming new or changed samples.
+        shard: Only transform shard index/count of the dataset, saved to output/shard_<index>_<count>.
+            Shards can be combined with the merge command.
+        balance_shards: Balance fcs event counts between shards instead of assigning cases by id hash.
+        padding: Store SOMs wrap padded by the given width, matching the pad width of the classifier.
     """
+    from flowcat.flowcat_api import transform_dataset_to_som
+
     dataset = io_functions.load_case_collection(data, meta)
 
     # randomly sample 'sample' number cases from each group
     if sample:
         dataset = dataset.sample(sample)
 
+    if shard:
+        index, count = shard
+        dataset = dataset.shard(index, count, balance=balance_shards)
+        output = output / f"shard_{index}_{count}"
+        print(f"Transforming shard {index}/{count} with {dataset}")
+
     if transargs is None:
         transargs = DEFAULT_TRANSFORM_SOM_ARGS
 
     print(f"Loading referece from {reference}")
-    model = io_functions.load_casesom(reference, **transargs)
+    model = io_functions.load_casesom(
+        reference,
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=inter_op_threads,
+        workers=workers,
+        **transargs)
 
-    transform_dataset_to_som(model, dataset, output)
+    transform_dataset_to_som(
+        model, dataset, output, storage=storage, threshold=threshold, incremental=incremental,
+        padding=padding)
@@ -0,0 +1,47 @@
+import collections
+
+from flowcat import utils, io_functions
+from flowcat.dataset import manifest as fc_manifest
+
+
+def verify(
+        data: utils.URLPath,
+        meta: utils.URLPath = None,
+        manifest: utils.URLPath = None,
+        update: bool = False,
+        workers: int = 8):
+    """Verify sample files of a dataset against its manifest.
+
+    Only files with changed size or modification time are hashed again.
+
+    Args:
+        manifest: Path to manifest, defaults to manifest.json.gz next to the metadata.
+        update: Save current file information to the manifest, creating it if missing.
+        workers: Number of files checked concurrently.
+    """
+    dataset = io_functions.load_case_collection(data, meta)
+    if manifest is None:
+        manifest = (meta.parent if meta else data) / fc_manifest.MANIFEST_NAME
+
+    if manifest.exists():
+        previous = fc_manifest.load_manifest(manifest)
+    elif update:
+        print(f"Creating manifest for {dataset} at {manifest}")
+        previous = fc_manifest.empty_manifest()
+    else:
+        print(f"No manifest found at {manifest}, create it with --update")
+        raise SystemExit(1)
+
+    status, updated = fc_manifest.verify_manifest(dataset, previous, workers=workers)
+    print(dict(collections.Counter(status.values())))
+    failed = {
+        path: file_status for path, file_status in status.items()
+        if file_status in (fc_manifest.MISSING, fc_manifest.MODIFIED)
+    }
+    for path, file_status in sorted(failed.items()):
+        print(f"{file_status}: {path}")
+
+    if update:
+        fc_manifest.save_manifest(updated, manifest)
+    if failed:
+        raise SystemExit(1)
@@ -234,6 +234,11 @@ DEFAULT_REFERENCE_SOM_ARGS = {
     "map_type": "toroid",
     "dims": [32, 32, -1],
     "scaler": "MinMaxScaler",
+    # eg {"strategy": "density", "size": 100000}, see flowcat.preprocessing.subsample
+    "subsample": None,
+    # eg [{"dims": [8, 8], "max_epochs": 10}, {"dims": [16, 16], "max_epochs": 4}]
+    # with fewer max_epochs and smaller initial_radius for the full map
+    "multiresolution": None,
 }
 
 DEFAULT_TRANSFORM_SOM_ARGS = {
@@ -241,6 +246,7 @@ DEFAULT_TRANSFORM_SOM_ARGS = {
     "batch_size": 50000,
     "initial_radius": 4,
     "end_radius": 1,
+    "subsample": None,
 }
 
 DEFAULT_CLASSIFIER_CONFIG = SOMClassifierConfig(
@@ -275,4 +281,6 @@ DEFAULT_TRAIN_ARGS = {
     "reference": DEFAULT_REFERENCE_SOM_ARGS,
     "transform": DEFAULT_TRANSFORM_SOM_ARGS,
     "classifier": DEFAULT_CLASSIFIER_ARGS,
+    # update existing SOM datasets with new or changed samples only
+    "incremental": False,
 }
@@ -2,20 +2,20 @@
 Classes for managing collections of case and tubecase objects.
 """
 import random
+import hashlib
 import logging
 import collections
 from dataclasses import dataclass, field
-from typing import List, Tuple
+from typing import Iterable, List, Tuple
 
 from dataslots import with_slots
-import numpy as np
 import pandas as pd
-from sklearn import model_selection
 
 from flowcat import utils
 
 from . import case as fc_case
 from . import sample as fc_sample
+from . import splits
 
 
 LOGGER = logging.getLogger(__name__)
@@ -185,6 +185,45 @@ class CaseCollection:
         filtered, _ = self.filter_reasons(labels=labels)
         return filtered
 
+    def shard(self, index: int, count: int, key: str = "id", balance: bool = False) -> "CaseCollection":
+        """Select one of count disjoint shards for distributed processing.
+
+        Cases are assigned by a stable hash of the given case attribute, so
+        that the assignment does not depend on case order or python hash seeds.
+
+        Args:
+            index: Shard number from 0 to count - 1.
+            count: Number of shards.
+            key: Case attribute used for assignment.
+            balance: Balance the number of fcs events between shards. Cases are
+                assigned to the shard with fewest events and then fewest cases,
+                starting with the largest case. Assignment then depends on all cases in the
+                collection, so every shard has to use the same collection.
+        """
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index {index} not in range of {count} shards")
+
+        def case_hash(case):
+            return int(hashlib.sha256(str(getattr(case, key)).encode("utf-8")).hexdigest(), 16)
+
+        if balance:
+            def case_events(case):
+                return sum(s.count or 0 for s in case.samples if isinstance(s, fc_sample.FCSSample))
+
+            shard_events = [0] * count
+            shard_cases = [0] * count
+            selected = set()
+            for case in sorted(self.cases, key=lambda c: (-case_events(c), case_hash(c))):
+                target = min(range(count), key=lambda i: (shard_events[i], shard_cases[i], i))
+                shard_events[target] += case_events(case)
+                shard_cases[target] += 1
+                if target == index:
+                    selected.add(id(case))
+            cases = [case for case in self.cases if id(case) in selected]
+        else:
+            cases = [case for case in self.cases if case_hash(case) % count == index]
+        return self.__class__(cases, **self.config)
+
     def filter_reasons(self, **kwargs) -> Tuple["CaseCollection", list]:
         """Filter dataset on given arguments. These are specified in
         case.filter_case.
@@ -210,39 +249,19 @@ class CaseCollection:
         filtered, _ = self.filter_reasons(**kwargs)
         return filtered
 
-    def create_split(self, num, stratify=True):
-        """Split the data into two groups."""
-        cases = pd.Series(self.cases)
-        if stratify:
-            trains = []
-            tests = []
-            for group, data in cases.groupby(by=lambda s: cases[s].group):
-                if num < 1:
-                    pivot = round(num * len(data))
-                else:
-                    pivot = int(num)
-                data = data.tolist()
-                random.shuffle(data)
-                trains += data[:pivot]
-                tests += data[pivot:]
-        else:
-            data = cases.reindex(np.random.permutation(cases.index))
-            if num < 1:
-                pivot = round(num * len(data))
-            else:
-                pivot = int(num)
-            trains = data[:pivot].tolist()
-            tests = data[pivot:].tolist()
-        return (
-            self.__class__(
-                trains,
-                selected_markers=self.selected_markers,
-                selected_tubes=self.selected_tubes),
-            self.__class__(
-                tests,
-                selected_markers=self.selected_markers,
-                selected_tubes=self.selected_tubes),
-        )
+    def take(self, indexes: Iterable[int]) -> "CaseCollection":
+        """Create collection of the cases at the given indexes, cases are not copied."""
+        return self.__class__([self.cases[i] for i in indexes], **self.config)
+
+    def create_split(self, num, stratify=True, seed=None):
+        """Split the data into two groups.
+
+        Args:
+            num: Fraction or number of cases in the first group, per group if stratified.
+            seed: Seed or random state, see flowcat.dataset.splits.
+        """
+        first, second = splits.holdout_split(self.groups, num, stratify=stratify, seed=seed)
+        return self.take(first), self.take(second)
 
     def balance(self, num):
         """Balance classes to count given."""
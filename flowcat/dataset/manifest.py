@@ -0,0 +1,110 @@
+"""
+Manifest of sample files in a dataset with size, modification time and a
+sampled content hash, stored as manifest.json.gz next to meta.json.gz.
+
+Verification only hashes files whose size or modification time differ from
+the manifest.
+"""
+import os
+import gzip
+import json
+from typing import Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+from flowcat import utils
+
+
+MANIFEST_NAME = "manifest.json.gz"
+
+# verification status of a single file
+UNCHANGED = "unchanged"
+TOUCHED = "touched"  # changed modification time with same content
+MODIFIED = "modified"
+MISSING = "missing"
+NEW = "new"
+
+
+def file_entry(path: utils.URLPath) -> dict:
+    stat = os.stat(str(path))
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "hash": utils.sampled_hash(path),
+    }
+
+
+def sample_files(dataset: "CaseCollection") -> Dict[str, utils.URLPath]:
+    """Get complete paths of all samples by their path relative to the data path."""
+    return {
+        str(sample.path): sample.complete_path
+        for case in dataset for sample in case.samples
+    }
+
+
+def empty_manifest() -> dict:
+    return {"algorithm": utils.hash_algorithm(), "files": {}}
+
+
+def create_manifest(dataset: "CaseCollection", workers: int = 8) -> dict:
+    """Create manifest for all sample files, hashing files concurrently.
+
+    Missing files are not added to the manifest.
+    """
+    _, manifest = verify_manifest(dataset, empty_manifest(), workers=workers)
+    return manifest
+
+
+def check_file(path: utils.URLPath, entry: dict) -> Tuple[str, dict]:
+    """Check single file against its manifest entry.
+
+    Returns:
+        Tuple of status and current entry, None for missing files.
+    """
+    try:
+        if entry is None:
+            return NEW, file_entry(path)
+        stat = os.stat(str(path))
+        if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime"]:
+            return UNCHANGED, entry
+        current = file_entry(path)
+    except FileNotFoundError:
+        return MISSING, None
+
+    if current["size"] == entry["size"] and current["hash"] == entry["hash"]:
+        return TOUCHED, current
+    return MODIFIED, current
+
+
+def verify_manifest(dataset: "CaseCollection", manifest: dict, workers: int = 8) -> Tuple[Dict[str, str], dict]:
+    """Verify sample files of a dataset against a manifest.
+
+    Manifests created with a different hash algorithm are rehashed completely.
+
+    Returns:
+        Tuple of status by sample path and updated manifest.
+    """
+    files = sample_files(dataset)
+    entries = manifest["files"] if manifest["algorithm"] == utils.hash_algorithm() else {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = dict(zip(files, executor.map(
+            lambda item: check_file(item[1], entries.get(item[0])), files.items())))
+
+    status = {path: result_status for path, (result_status, _) in results.items()}
+    updated = {
+        "algorithm": utils.hash_algorithm(),
+        "files": {path: entry for path, (_, entry) in results.items() if entry is not None},
+    }
+    return status, updated
+
+
+def load_manifest(path: utils.URLPath) -> dict:
+    with gzip.open(str(path), "rt") as mfile:
+        return json.load(mfile)
+
+
+def save_manifest(manifest: dict, path: utils.URLPath):
+    """Save manifest replacing any existing file atomically."""
+    temp_path = path.with_name(f".tmp_{path.name}")
+    with gzip.open(str(temp_path), "wt", compresslevel=1) as mfile:
+        json.dump(manifest, mfile)
+    os.replace(str(temp_path), str(path))
@@ -195,6 +195,7 @@ class FCSSample(Sample):
 class SOMSample(Sample):
     original_id: Union[str, tuple] = None  # sample id of original fcs used to build som
     dims: Tuple[int, int, int] = None
+    fingerprint: str = None  # fingerprint of original fcs file used to build som
 
     def get_data(self) -> som.SOM:
         """
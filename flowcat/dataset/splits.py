@@ -0,0 +1,110 @@
+"""
+Dataset splits on integer index arrays over group labels.
+
+All functions only take the list of group labels of a dataset and return
+index arrays, which can be applied with the take method of case collections
+and SOM datasets. Splits are reproducible by passing a seed.
+"""
+from typing import Iterator, List, Tuple, Union
+
+import numpy as np
+
+
+Split = Tuple[np.array, np.array]
+
+
+def _random_state(seed: Union[int, np.random.RandomState, None]) -> np.random.RandomState:
+    """Create random state, without seed it is drawn from the global numpy random state."""
+    if isinstance(seed, np.random.RandomState):
+        return seed
+    if seed is None:
+        seed = np.random.randint(2 ** 31)
+    return np.random.RandomState(seed)
+
+
+def _grouped_order(groups: list, rng: np.random.RandomState) -> Tuple[np.array, np.array, np.array]:
+    """Randomly permute indexes and sort them by group.
+
+    Returns:
+        Tuple of permuted indexes, their group codes and their rank inside their group.
+    """
+    _, codes = np.unique(np.asarray(groups, dtype=str), return_inverse=True)
+    permutation = rng.permutation(len(codes))
+    order = permutation[np.argsort(codes[permutation], kind="stable")]
+    order_codes = codes[order]
+    counts = np.bincount(order_codes)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    ranks = np.arange(len(order)) - starts[order_codes]
+    return order, order_codes, ranks
+
+
+def _pivot(num: float, size: int) -> int:
+    """Fractions below 1 are relative to the size, otherwise absolute counts."""
+    if num < 1:
+        return round(num * size)
+    return int(num)
+
+
+def holdout_split(groups: list, num: float, stratify: bool = True, seed=None) -> Split:
+    """Split indexes into two randomly ordered parts.
+
+    Args:
+        groups: Group label of every case.
+        num: Fraction or number of cases in the first part. If stratified,
+            this is applied to every group separately.
+        stratify: Split every group separately.
+        seed: Seed or random state.
+    Returns:
+        Tuple of first and second part indexes.
+    """
+    rng = _random_state(seed)
+    if not stratify:
+        permutation = rng.permutation(len(groups))
+        pivot = _pivot(num, len(groups))
+        return permutation[:pivot], permutation[pivot:]
+
+    order, codes, ranks = _grouped_order(groups, rng)
+    pivots = np.array([_pivot(num, count) for count in np.bincount(codes)], dtype=int)
+    first = ranks < pivots[codes]
+    return rng.permutation(order[first]), rng.permutation(order[~first])
+
+
+def repeated_holdout(
+        groups: list, num: float, repeats: int, stratify: bool = True, seed=None) -> Iterator[Split]:
+    """Generate independent holdout splits."""
+    rng = _random_state(seed)
+    for _ in range(repeats):
+        yield holdout_split(groups, num, stratify=stratify, seed=rng)
+
+
+def stratified_kfold(groups: list, folds: int, seed=None) -> Iterator[Split]:
+    """Generate train and test indexes for k-fold cross-validation.
+
+    Every group is distributed evenly over folds and fold sizes differ by
+    at most one case per group.
+    """
+    if folds < 2:
+        raise ValueError(f"Need at least two folds, got {folds}")
+    order, _, _ = _grouped_order(groups, _random_state(seed))
+    # cases are ordered by group, so consecutive assignment balances groups and folds
+    assignment = np.empty(len(order), dtype=int)
+    assignment[order] = np.arange(len(order)) % folds
+    for fold in range(folds):
+        yield np.flatnonzero(assignment != fold), np.flatnonzero(assignment == fold)
+
+
+def learning_curve(groups: list, sizes: List[float], stratify: bool = True, seed=None) -> Iterator[np.array]:
+    """Generate nested subsets of increasing size.
+
+    Every subset contains all cases of the previous smaller subsets.
+
+    Args:
+        sizes: Fractions or numbers of cases, per group if stratified.
+    """
+    if not stratify:
+        groups = np.zeros(len(groups))
+    order, codes, ranks = _grouped_order(groups, _random_state(seed))
+    counts = np.bincount(codes)
+    for size in sizes:
+        pivots = np.array([_pivot(size, count) for count in counts], dtype=int)
+        yield order[ranks < pivots[codes]]
@@ -3,17 +3,14 @@ Major wrapper class for generating SOMs and prediction on existing classifier
 and SOM data.
 """
 import logging
-from shutil import rmtree
 from collections import defaultdict
 import numpy as np
 from dataclasses import dataclass
 
 from flowcat import utils, io_functions, constants
-from flowcat.classifier import SOMClassifier, SOMSaliency, SOMClassifierConfig, create_model_multi_input
-from flowcat.classifier.predictions import generate_all_metrics
-from flowcat.classifier.saliency import bmu_calculator
-from flowcat.sommodels.casesom import CaseSom
 from flowcat.dataset import case as fc_case, sample as fc_sample, case_dataset
+from flowcat.types import som_codec
+from flowcat.types.som import SOM
 
 TRAIN_BATCH_SIZE = 32
 VALID_BATCH_SIZE = 128
@@ -46,79 +43,182 @@ def load_case_collection(data: str, meta: str = None):
     return io_functions.load_case_collection(data, meta)
 
 
-def load_existing_casesom(path: utils.URLPath, args: dict) -> CaseSom:
+def sample_fingerprint(sample: fc_sample.Sample) -> str:
+    """Get fingerprint of the file of a sample, None for samples without file."""
+    if sample is None or sample.path is None:
+        return None
     try:
-        casesom = io_functions.load_casesom(path, **args)
-        return casesom
-    except Exception as e:
-        LOGGER.warning("Failed to load existing casesom at %s with error %s:", path, e)
+        return utils.file_fingerprint(sample.complete_path)
+    except OSError:
         return None
 
 
-def load_matching_som_dataset(fcs_dataset: "CaseCollection", som_dataset_path: utils.URLPath) -> "CaseCollection":
-    """Check whether the given som path contains a complete SOM dataset matching the given FCS dataset.
+def cases_fingerprint(dataset: "Iterable[Case]") -> list:
+    """Get ids of cases and their samples together with sample file fingerprints."""
+    return [
+        [case.id, [[s.id, sample_fingerprint(s)] for s in case.samples]]
+        for case in dataset
+    ]
+
+
+def create_som_config(
+        som_reference: "CaseSom", storage: str = "float32", threshold: float = None, padding: int = 0) -> dict:
+    """Create config.json content of a SOM dataset transformed with the given reference."""
+    if padding and storage in som_codec.DELTA_TYPES:
+        raise ValueError("Padded SOMs cannot be stored as differences to the unpadded reference.")
+    som_config = som_reference.som_config
+    for tube, tube_config in som_config.items():
+        if storage != "float32":
+            tube_config["storage"] = storage
+        if padding:
+            tube_config["padding"] = padding
+        # SOMs are only interchangeable if transformed with the same reference weights
+        weights = som_reference.models[tube].model.reference_weights
+        tube_config["reference"] = {"version": som_codec.reference_version(weights.data)}
+        if storage in som_codec.DELTA_TYPES:
+            tube_config["reference"].update({
+                "path": f"reference/t{tube}.npy",
+                "threshold": threshold,
+            })
+    return som_config
+
+
+def load_updatable_som_dataset(output: utils.URLPath, som_config: dict) -> "CaseCollection":
+    """Load existing SOM dataset at output if it has been created with the same config.
 
     Otherwise return None.
     """
+    if not (output / "meta.json.gz").exists():
+        return None
     try:
-        som_dataset = io_functions.load_case_collection(som_dataset_path)
+        existing_config = io_functions.load_json(output / "config.json")
+        som_dataset = io_functions.load_case_collection(output, output / "meta.json.gz")
     except Exception as e:
-        LOGGER.warning("Loading existing dataset at %s produced error: %s", som_dataset_path, e)
+        LOGGER.warning("Loading existing dataset at %s produced error: %s", output, e)
         return None
-
-    same_case_number = len(fcs_dataset) == len(som_dataset)
-    same_sample_count = len([1 for c in fcs_dataset for s in c.samples]) == len([1 for c in som_dataset for s in c.samples])
-    if not (same_case_number and same_sample_count):
-        LOGGER.warning("Existing som dataset at %s does not match number of samples or cases of given FCS dataset", som_dataset_path)
+    if not io_functions.same_som_config(existing_config, som_config):
+        LOGGER.warning("Existing som dataset at %s has been created with a different reference or storage", output)
         return None
     return som_dataset
 
 
-def transform_dataset_to_som(som_reference: CaseSom, dataset: "CaseCollection", output: utils.URLPath):
+def transform_dataset_to_som(
+        som_reference: "CaseSom",
+        dataset: "CaseCollection",
+        output: utils.URLPath,
+        storage: str = "float32",
+        threshold: float = None,
+        incremental: bool = False,
+        padding: int = 0):
     """Transform dataset into som dataste using the given reference SOM model.
+
+    Args:
+        storage: Storage type of SOM weights, see flowcat.types.som_codec.
+        threshold: Minimum node difference stored for delta storage types,
+            by default all nodes are stored.
+        padding: Store SOMs already wrap padded by the given width, so
+            that classifiers using the same pad width load them unchanged.
+            Cannot be combined with delta storage types.
+        incremental: Update an existing SOM dataset at output created with
+            the same reference and storage. Only samples that are new or
+            whose fcs file changed are transformed, SOMs of removed samples
+            are deleted.
     """
     print(f"Trainsforming individual samples")
     data_output = output / "data"
     meta_output = output / "meta.json.gz"
     config_output = output / "config.json"
 
+    som_config = create_som_config(som_reference, storage=storage, threshold=threshold, padding=padding)
+    existing = load_updatable_som_dataset(output, som_config) if incremental else None
+
     data_output.mkdir()
 
+    references = {}
+    if storage in som_codec.DELTA_TYPES:
+        for tube, model in som_reference.models.items():
+            references[tube] = output / som_config[tube]["reference"]["path"]
+            if existing is None:
+                references[tube].parent.mkdir()
+                io_functions.save_som(model.model.reference_weights, references[tube].with_suffix(""))
+
+    # reuse existing SOMs for samples with unchanged fcs files
+    previous_samples = {}
+    if existing is not None:
+        previous_samples = {(case.id, s.tube): s for case in existing for s in case.samples}
+
     casesamples = defaultdict(list)
-    count_samples = len(dataset) * len(som_reference.models)
+    fingerprints = {}
+    jobs = []
+    for case in dataset:
+        tubes = []
+        for tube in som_reference.tubes:
+            fcssample = case.get_tube(tube, kind="fcs")
+            fingerprint = sample_fingerprint(fcssample)
+            previous = previous_samples.pop((case.id, tube), None)
+            if (previous is not None and fingerprint is not None
+                    and previous.original_id == fcssample.id and previous.fingerprint == fingerprint):
+                casesamples[case.id].append(previous)
+            else:
+                fingerprints[(case.id, tube)] = fingerprint
+                tubes.append(tube)
+        if tubes:
+            jobs.append((case, tubes))
+
+    count_samples = len(fingerprints)
+    if existing is not None:
+        print(
+            f"Updating existing SOM dataset: reusing {len(dataset) * len(som_reference.tubes) - count_samples}, "
+            f"transforming {count_samples} and removing {len(previous_samples)} samples")
+
+    def transform_jobs():
+        for case, tubes in jobs:
+            for somsample in som_reference.transform(case, tubes=tubes).samples:
+                yield case, somsample
+
     countlen = len(str(count_samples))
-    for i, (case, somsample) in enumerate(utils.time_generator_logger(som_reference.transform_generator(dataset))):
-        sompath = data_output / f"{case.id}_t{somsample.tube}.npy"
-        io_functions.save_som(somsample.data, sompath, save_config=False)
+    for i, (case, somsample) in enumerate(utils.time_generator_logger(transform_jobs())):
+        sompath = data_output / f"{case.id}_t{somsample.tube}"
+        som = somsample.data
+        if padding:
+            som = SOM(som.get_padded(padding), som.markers)
+        sompath = io_functions.save_som(
+            som, sompath, save_config=False, storage=storage,
+            reference=references.get(somsample.tube), threshold=threshold)
         somsample.data = None
         somsample.path = sompath.relative_to(data_output)
-        print(type(somsample.path), somsample.path)
+        somsample.fingerprint = fingerprints[(case.id, somsample.tube)]
         casesamples[case.id].append(somsample)
-        print(f"[{str(i + 1).rjust(countlen, ' ')}/{count_samples}] Created tube {somsample.tube} for {case.id}")
+        epochs_run = som_reference.models[somsample.tube].model.epochs_run
+        print(
+            f"[{str(i + 1).rjust(countlen, ' ')}/{count_samples}] "
+            f"Created tube {somsample.tube} for {case.id} in {epochs_run} epochs")
 
     print(f"Saving result to new collection at {output}")
     som_dataset = case_dataset.CaseCollection([
-        case.copy(samples=casesamples[case.id])
+        case.copy(samples=sorted(casesamples[case.id], key=lambda s: som_reference.tubes.index(s.tube)))
         for case in dataset
     ], data_path=data_output)
     som_dataset.selected_markers = {
         m.tube: m.model.markers for m in som_reference.models.values()
     }
+    io_functions.save_json_atomic(som_config, config_output)
     io_functions.save_case_collection(som_dataset, meta_output)
-    io_functions.save_json(som_reference.som_config, config_output)
-    return som_dataset
 
+    # only delete files after the new metadata no longer references them
+    for removed in previous_samples.values():
+        removed_path = data_output / removed.path
+        if removed_path.exists():
+            removed_path.unlink()
+    return som_dataset
 
-def reconfigure_som_model(som_model: CaseSom, args: dict) -> CaseSom:
-    """Reconfigure SOM by saving a copy and loading it again."""
-    tmp_path = utils.URLPath("/tmp/flowcat/sommodel")
-
-    io_functions.save_casesom(som_model, tmp_path)
-    reconfigured_model = io_functions.load_casesom(tmp_path, **args)
 
-    rmtree(str(tmp_path))
+def reconfigure_som_model(som_model: "CaseSom", args: dict) -> "CaseSom":
+    """Reconfigure SOM training parameters in place, keeping the trained weights.
 
-    return reconfigured_model
+    Save the model before reconfiguring if the original parameters should be kept.
+    """
+    return som_model.reconfigure(**args)
 
 
 def check_dataset_groups(dataset, groups):
@@ -133,13 +233,15 @@ def prepare_classifier_train_dataset(
         split_ratio=0.9,
         mapping=None,
         groups=None,
-        balance=None, val_dataset: "CaseCollection" = None):
-    """Prepare dataset splitting and optional upsampling.
+        val_dataset: "CaseCollection" = None):
+    """Prepare dataset splitting.
+
+    Groups are balanced during training by passing balance to train_som_classifier.
+
     Args:
         split_ratio: Ratio of training set to total dataset.
         mapping: Optionally map existing groups to new groups contained in mapping.
         groups: List of groups to be used.
-        balance: Dict or value to upsample the training dataset.
     """
     if mapping:
         dataset = dataset.map_groups(mapping)
@@ -157,23 +259,39 @@ def prepare_classifier_train_dataset(
     else:
         train, validate = dataset, None
 
-    if balance:
-        train = train.balance_per_group(balance)
     return train, validate
 
 
 def train_som_classifier(
     train_dataset: "CaseCollection",
     validate_dataset: "CaseCollection",
-    config: SOMClassifierConfig = None,
+    config: "SOMClassifierConfig" = None,
     class_weights = None,
-    model_fun: "Callable" = create_model_multi_input,
+    model_fun: "Callable" = None,
+    balance=None,
+    tf_data: bool = False,
+    cache: utils.URLPath = None,
 ) -> "SOMClassifier":
-    """Configure the dataset based on config and train a given model."""
+    """Configure the dataset based on config and train a given model.
+
+    Args:
+        balance: Dict of cases per group, single count for all groups or
+            'inverse' drawn anew from the unique training cases every epoch.
+        tf_data: Load training data with a tf.data pipeline instead of a sequence.
+        cache: File to cache loaded training SOMs to in the tf.data pipeline.
+    """
+    from flowcat.classifier import sampling
+    from flowcat.classifier.classifier import SOMClassifier
+    from flowcat.classifier.models import create_model_multi_input
+
     model = SOMClassifier(config)
-    model.create_model(model_fun)
+    model.create_model(model_fun or create_model_multi_input)
 
-    train = model.create_sequence(train_dataset, config.train_batch_size)
+    sampler = sampling.create_sampler(train_dataset.groups, balance)
+    if tf_data:
+        train = model.create_tf_dataset(train_dataset, config.train_batch_size, sampler=sampler, cache=cache)
+    else:
+        train = model.create_sequence(train_dataset, config.train_batch_size, sampler=sampler)
 
     if validate_dataset is not None:
         validate = model.create_sequence(validate_dataset, config.valid_batch_size)
@@ -185,6 +303,8 @@ def train_som_classifier(
 
 
 def generate_prediction_metrics(predictions: "List[FlowCatPrediction]", mapping: dict, output: utils.URLPath) -> dict:
+    from flowcat.classifier.predictions import generate_all_metrics
+
     true_labels = [p.case.group for p in predictions]
     pred_labels = [p.predicted_group for p in predictions]
 
@@ -216,7 +336,8 @@ class SaliencyMapping:
 class FlowCat:
     BMU_CALC = None
 
-    def __init__(self, reference: CaseSom = None, classifier: SOMClassifier = None, saliency: SOMSaliency = None):
+    def __init__(
+            self, reference: "CaseSom" = None, classifier: "SOMClassifier" = None, saliency: "SOMSaliency" = None):
         """Initialization with optional existing models."""
         self.reference = reference
         self.classifier = classifier
@@ -225,6 +346,9 @@ class FlowCat:
     @classmethod
     def load(cls, path: str = None, ref_path: str = None, cls_path: str = None):
         """Load classifier from the given path, alternatively give a separate path for reference and classifier."""
+        from flowcat.classifier.classifier import SOMClassifier
+        from flowcat.classifier.saliency import SOMSaliency
+
         if path is not None:
             ref_path = utils.URLPath(path) / "reference"
             cls_path = utils.URLPath(path) / "classifier"
@@ -240,6 +364,29 @@ class FlowCat:
             SOMSaliency.load(cls_path)
         )
 
+    @classmethod
+    def load_bundle(cls, path: str, verify: bool = True):
+        """Load reference and classifier from a single bundle file.
+
+        Saliency is not available in models loaded from bundles.
+        """
+        from flowcat.classifier.classifier import SOMClassifier
+
+        arrays, meta = io_functions.load_bundle(utils.URLPath(path), verify=verify)
+        return cls(
+            io_functions.casesom_from_bundle(arrays, meta["reference"]),
+            SOMClassifier.from_bundle(arrays, meta["classifier"]),
+        )
+
+    def save_bundle(self, path: str):
+        """Save reference and classifier into a single bundle file."""
+        ref_arrays, ref_meta = io_functions.casesom_to_bundle(self.reference)
+        cls_arrays, cls_meta = self.classifier.to_bundle()
+        io_functions.save_bundle(
+            {**ref_arrays, **cls_arrays},
+            {"reference": ref_meta, "classifier": cls_meta},
+            utils.URLPath(path))
+
     def save(self, path: str):
         """Save the current model into the given path."""
         path = utils.URLPath(path)
@@ -247,69 +394,136 @@ class FlowCat:
         io_functions.save_casesom(self.reference, path / "reference")
         self.classifier.save(path / path / "classifier")
 
-    def _train_reference(self, reference: "Iterable[Case]", args: dict, transform_args: dict, output: utils.URLPath, tensorboard_dir: utils.URLPath = None) -> "CaseSom":
-        """Train the reference SOM or load preexisting."""
-        sommodel = load_existing_casesom(output, args)
-        if sommodel is not None:
-            LOGGER.info("Loaded existing model at %s", output)
-            self.reference = reconfigure_som_model(sommodel, transform_args)
-            return self.reference
-
-        selected_markers = reference.selected_markers
-        sommodel = CaseSom(
-            tubes=selected_markers,
-            tensorboard_dir=tensorboard_dir,
-            modelargs=args)
-        sommodel.train(reference)
+    def _train_reference(
+            self,
+            reference: "Iterable[Case]",
+            args: dict,
+            transform_args: dict,
+            stages: utils.StageCache,
+            tensorboard_dir: utils.URLPath = None) -> utils.Stage:
+        """Train the reference SOM or load it from the stage cache."""
+        stage = stages.stage(
+            "reference",
+            cases=cases_fingerprint(reference),
+            markers=reference.selected_markers,
+            args=args)
+        if stage.done:
+            LOGGER.info("Loading cached reference at %s", stage.path)
+            sommodel = io_functions.load_casesom(stage.path, **args)
+        else:
+            from flowcat.sommodels.casesom import CaseSom
 
-        io_functions.save_casesom(sommodel, output)
+            stages.start(stage)
+            sommodel = CaseSom(
+                tubes=reference.selected_markers,
+                tensorboard_dir=tensorboard_dir,
+                modelargs=args)
+            sommodel.train(reference)
+            io_functions.save_casesom(sommodel, stage.path)
+            stages.commit(stage)
 
         self.reference = reconfigure_som_model(sommodel, transform_args)
-        return self.reference
-
-    def _transform_dataset(self, dataset: "CaseCollection", output: utils.URLPath) -> "CaseCollection":
-        # try to load an existing SOM dataset
-        existing_dataset = load_matching_som_dataset(dataset, output)
-        if existing_dataset is not None:
-            LOGGER.info("Using existing SOM dataset at: %s", output)
-            return existing_dataset
-
-        som_dataset = transform_dataset_to_som(self.reference, dataset, output)
-        return som_dataset
+        return stage
+
+    def _transform_dataset(
+            self,
+            name: str,
+            dataset: "CaseCollection",
+            args: dict,
+            reference_stage: utils.Stage,
+            stages: utils.StageCache,
+            incremental: bool = False) -> "Tuple[CaseCollection, utils.Stage]":
+        """Transform dataset with the current reference or load it from the stage cache.
+
+        Args:
+            incremental: Start from the latest transformation of other cases
+                with the same reference and arguments, only transforming new
+                or changed samples.
+        """
+        stage = stages.stage(
+            name,
+            cases=cases_fingerprint(dataset),
+            args=args,
+            upstream=reference_stage.key)
+        if stage.done:
+            LOGGER.info("Using cached SOM dataset at %s", stage.path)
+            return io_functions.load_case_collection(stage.path), stage
+
+        previous = stages.previous(stage) if incremental else None
+        if previous is not None:
+            LOGGER.info("Updating SOM dataset from %s", previous.path)
+            stages.seed(stage, previous)
+        else:
+            stages.start(stage)
+        som_dataset = transform_dataset_to_som(self.reference, dataset, stage.path, incremental=incremental)
+        stages.commit(stage)
+        return som_dataset, stage
 
     def _adapt_classifier_config(self, config: "SOMClassifierConfig") -> "SOMClassifierConfig":
         new_config = config.copy()
         new_config.tubes = self.reference.som_config
         return new_config
 
-    def _train_classifier(self, dataset: "CaseCollection", args: dict, val_dataset: "CaseCollection" = None) -> "SOMClassifier":
+    def _train_classifier(
+            self,
+            dataset: "CaseCollection",
+            args: dict,
+            upstream: "List[utils.Stage]",
+            stages: utils.StageCache,
+            val_dataset: "CaseCollection" = None) -> utils.Stage:
+        """Train the classifier or load it from the stage cache."""
+        stage = stages.stage(
+            "classifier",
+            labels=[[case.id, case.group] for case in dataset],
+            val_labels=[[case.id, case.group] for case in val_dataset] if val_dataset else None,
+            args=args,
+            upstream=[s.key for s in upstream])
+        if stage.done:
+            from flowcat.classifier.classifier import SOMClassifier
+
+            LOGGER.info("Loading cached classifier at %s", stage.path)
+            self.classifier = SOMClassifier.load(stage.path)
+            return stage
+
+        stages.start(stage)
         config = self._adapt_classifier_config(args["config"])
         train, validate = prepare_classifier_train_dataset(
             dataset,
             split_ratio=args["split_ratio"],
             groups=config.groups,
-            balance=args["balance"],
             mapping=config.mapping, val_dataset=val_dataset)
-        self.classifier = train_som_classifier(train, validate, config)
-        # return self.classifier
-        return validate
+        self.classifier = train_som_classifier(
+            train, validate, config, balance=args["balance"], tf_data=args.get("tf_data", False))
+        self.classifier.save(stage.path)
+        stages.commit(stage)
+        return stage
 
     def train(self, dataset: "CaseCollection", reference: "List[Case]", output: utils.URLPath, validation_data: "CaseCollection" = None, args: dict = None):
-        """Train a new model using the given dataset."""
+        """Train a new model using the given dataset.
+
+        Results of every stage are cached in output/stages under a key of
+        the stage inputs: case ids and file fingerprints, stage args and the
+        keys of upstream stages. Only stages with new keys are run.
+        """
         if self.reference != None or self.classifier != None:
             raise RuntimeError("flowCat model has already been trained")
 
         if args is None:
             args = constants.DEFAULT_TRAIN_ARGS
 
-        ref_output = output / "reference"
-        som_output = output / "som"
-        som_output_val = output / "som_val"
-
-        self._train_reference(reference, args["reference"], args["transform"], ref_output)
-        som_dataset = self._transform_dataset(dataset, som_output)
-        val_som_dataset = self._transform_dataset(validation_data, som_output_val)
-        self._train_classifier(som_dataset, args=args["classifier"], val_dataset=val_som_dataset)
+        stages = utils.StageCache(output / "stages")
+        incremental = args.get("incremental", False)
+
+        reference_stage = self._train_reference(reference, args["reference"], args["transform"], stages)
+        som_dataset, som_stage = self._transform_dataset(
+            "som", dataset, args["transform"], reference_stage, stages, incremental=incremental)
+        upstream = [som_stage]
+        val_som_dataset = None
+        if validation_data is not None:
+            val_som_dataset, val_stage = self._transform_dataset(
+                "som_val", validation_data, args["transform"], reference_stage, stages, incremental=incremental)
+            upstream.append(val_stage)
+        self._train_classifier(som_dataset, args["classifier"], upstream, stages, val_dataset=val_som_dataset)
         return som_dataset, val_som_dataset
 
     def predict_dict(self, case_dict: dict) -> dict:
@@ -339,6 +553,7 @@ class FlowCat:
     def generate_saliency(self, prediction: FlowCatPrediction, target_group):
         if self.BMU_CALC is None:
             import tensorflow as tf
+            from flowcat.classifier.saliency import bmu_calculator
             self.BMU_CALC = bmu_calculator(tf.Session())
         # returns eg 3x32x32 gradients
         gradients = self.saliency.transform(prediction.som, group=target_group, maximization=True)
@@ -1,10 +1,12 @@
-from typing import Union
+from typing import Union, Dict, Tuple
 import json
 import re
 import gzip
+import hashlib
+import os
 import logging
 import pickle
-import shutil
+import struct
 from collections import Counter
 from datetime import date, datetime
 
@@ -15,15 +17,20 @@ import pandas as pd
 from flowcat.constants import PUBLIC_ENUMS
 from flowcat.types.marker import Marker
 from flowcat.types.som import SOM
+from flowcat.types import som_codec
 from flowcat.utils.time_timers import str_to_date, str_to_datetime
 from flowcat.utils.urlpath import URLPath, cast_urlpath
-from flowcat.sommodels import fcssom
-from flowcat.sommodels.casesom import CaseSingleSom, CaseSom, CaseMergeSom
-from flowcat.dataset import case, case_dataset, sample
+from flowcat.utils.threads import resolve_session_threads
+from flowcat.utils.files import export_files
+from flowcat.dataset import case, case_dataset, sample, manifest
 
 
 LOGGER = logging.getLogger(__name__)
 
+BUNDLE_MAGIC = b"FLOWCATB"
+BUNDLE_VERSION = 1
+BUNDLE_ALIGNMENT = 64
+
 
 class FCEncoder(json.JSONEncoder):
     def default(self, obj):  # pylint: disable=E0202
@@ -112,6 +119,14 @@ def save_json(data, path: URLPath):
     jsfile.close()
 
 
+@cast_urlpath
+def save_json_atomic(data, path: URLPath):
+    """Write json data to a temporary file replacing the given path."""
+    temp_path = path.with_name(f".tmp_{path.name}")
+    save_json(data, temp_path)
+    os.replace(str(temp_path), str(path))
+
+
 @cast_urlpath
 def load_pickle(path: URLPath):
     with path.open("rb") as pfile:
@@ -166,13 +181,28 @@ def get_som_tube_path(
 
 
 @cast_urlpath
-def save_som(som: SOM, path: URLPath, save_config: bool = True):
-    npy_path = path.with_suffix(".npy")
-    np.save(str(npy_path), som.data)
+def save_som(
+        som: SOM,
+        path: URLPath,
+        save_config: bool = True,
+        storage: str = "float32",
+        reference: URLPath = None,
+        threshold: float = None) -> URLPath:
+    """Save SOM weights and optionally markers.
+
+    Args:
+        storage: Storage type of weights, see flowcat.types.som_codec.
+        reference: Path to reference weights for delta storage types.
+        threshold: Minimum node difference stored in delta storage types.
+    Returns:
+        Path of the saved weights.
+    """
+    data_path = som_codec.save_array(som.data, path, storage=storage, reference=reference, threshold=threshold)
 
     if save_config:
         meta_path = path.with_suffix(".json")
         save_json({"markers": som.markers}, meta_path)
+    return data_path
 
 
 @cast_urlpath
@@ -183,21 +213,43 @@ def load_som(path: URLPath, load_config: bool = True) -> SOM:
     else:
         config = {}
 
-    npy_path = path.with_suffix(".npy")
-    return SOM(data=npy_path, **config)
+    data_path = path.with_suffix(".npy")
+    if not data_path.exists():
+        data_path = path.with_suffix(".npz")
+    return SOM(data=data_path, **config)
 
 
 @cast_urlpath
-def load_casesom(path: URLPath, tensorboard_dir: URLPath = None, **kwargs):
+def load_casesom(
+        path: URLPath,
+        tensorboard_dir: URLPath = None,
+        intra_op_threads: Union[int, str] = None,
+        inter_op_threads: Union[int, str] = None,
+        workers: int = 1,
+        **kwargs):
+    """Load CaseSom from directory with one subdirectory per tube.
+
+    Args:
+        intra_op_threads, inter_op_threads: Thread counts for each tube
+            session, 'auto' divides cores among workers and tubes, since tubes
+            are transformed concurrently.
+        workers: Number of models running concurrently on this machine.
+        kwargs: Arguments overriding the saved model configuration.
+    """
+    from flowcat.sommodels.casesom import CaseSom
+
     singlepaths = {p.name.lstrip("tube"): p for p in path.iterdir() if "tube" in str(p)}
 
     if len(singlepaths) == 0:
         raise ValueError(f"{path} does not contain any models. Models in dir should be prefixed with tube.")
 
+    session_threads = resolve_session_threads(
+        intra_op_threads, inter_op_threads, workers=workers * len(singlepaths))
+
     models = {}
     for tube, mpath in sorted(singlepaths.items()):
         tbdir = tensorboard_dir / f"tube{tube}" if tensorboard_dir else None
-        models[tube] = load_casesinglesom(mpath, tensorboard_dir=tbdir, **kwargs)
+        models[tube] = load_casesinglesom(mpath, tensorboard_dir=tbdir, **session_threads, **kwargs)
     return CaseSom(models=models)
 
 
@@ -210,6 +262,8 @@ def save_casesom(model, path: URLPath):
 
 @cast_urlpath
 def load_casesinglesom(path: URLPath, **kwargs):
+    from flowcat.sommodels.casesom import CaseSingleSom
+
     config = load_json(path / "casesinglesom_config.json")
     model = load_fcssom(path, **kwargs)
     return CaseSingleSom(model=model, **config)
@@ -223,6 +277,8 @@ def save_casesinglesom(model, path: URLPath):
 
 @cast_urlpath
 def load_casemergesom(path: URLPath, **kwargs):
+    from flowcat.sommodels.casesom import CaseMergeSom
+
     config = load_json(path / "merge_config.json")
     model = load_fcssom(path, **kwargs)
     return CaseMergeSom.load_from_config(config, model)
@@ -234,18 +290,23 @@ def save_casemergesom(model, path: URLPath):
     save_json(model.config, path / "merge_config.json")
 
 
-@cast_urlpath
-def load_fcssom(path: URLPath, **kwargs):
-    scaler = load_joblib(path / "scaler.joblib")
-    config = load_json(path / "config.json")
+def merge_fcssom_config(config: dict, **kwargs) -> dict:
+    """Merge saved FCSSom config with new arguments into FCSSom init args.
 
-    merged_config = {k: v for k, v in config.items() if k not in ("modelargs", "scaler", "trained")}
+    Multiresolution stages are dropped, since they only apply to training
+    a map from random weights and loaded models are already trained.
+    """
+    merged_config = {
+        k: v for k, v in config.items() if k not in ("modelargs", "scaler", "trained", "multiresolution")
+    }
     for k, v in config["modelargs"]["kwargs"].items():
         merged_config[k] = v
 
     for k, v in kwargs.items():
         if k in ("scaler"):
             LOGGER.warning("Scaler argument %s ignored since using saved version.", v)
+        elif k == "multiresolution":
+            continue
         elif k not in merged_config:
             merged_config[k] = v
         elif k in ("dims", "markers", "marker_name_only"):
@@ -254,7 +315,17 @@ def load_fcssom(path: URLPath, **kwargs):
         else:
             merged_config[k] = v
 
-    print(merged_config)
+    LOGGER.debug("Merged FCSSom config: %s", merged_config)
+    return merged_config
+
+
+@cast_urlpath
+def load_fcssom(path: URLPath, **kwargs):
+    from flowcat.sommodels import fcssom
+
+    scaler = load_joblib(path / "scaler.joblib")
+    config = load_json(path / "config.json")
+    merged_config = merge_fcssom_config(config, **kwargs)
 
     model = fcssom.FCSSom(
         scaler=scaler,
@@ -277,6 +348,136 @@ def save_fcssom(model, path: URLPath):
     save_som(model.weights, path / f"weights", save_config=True)
 
 
+def _align_offset(offset: int, alignment: int = BUNDLE_ALIGNMENT) -> int:
+    return -(-offset // alignment) * alignment
+
+
+@cast_urlpath
+def save_bundle(arrays: Dict[str, np.array], meta: dict, path: URLPath):
+    """Save numpy arrays and json metadata into a single versioned file.
+
+    Layout: magic, version (uint32), header length (uint64), json header and
+    the raw array data, each array aligned so that it can be memory-mapped.
+    The header contains a sha256 hash of the array data.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    index = {}
+    offset = 0
+    digest = hashlib.sha256()
+    for name, array in arrays.items():
+        offset = _align_offset(offset)
+        index[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+
+    header = {"version": BUNDLE_VERSION, "meta": meta, "arrays": index}
+    position = 0
+    for name, array in arrays.items():
+        padding = index[name]["offset"] - position
+        digest.update(b"\0" * padding)
+        digest.update(array.tobytes())
+        position = index[name]["offset"] + array.nbytes
+    header["sha256"] = digest.hexdigest()
+
+    header_bytes = json.dumps(header, cls=FCEncoder).encode("utf-8")
+    prefix_length = len(BUNDLE_MAGIC) + 4 + 8
+    data_start = _align_offset(prefix_length + len(header_bytes))
+
+    with path.open("wb") as bfile:
+        bfile.write(BUNDLE_MAGIC)
+        bfile.write(struct.pack("<IQ", BUNDLE_VERSION, len(header_bytes)))
+        bfile.write(header_bytes)
+        bfile.write(b"\0" * (data_start - prefix_length - len(header_bytes)))
+        position = 0
+        for name, array in arrays.items():
+            bfile.write(b"\0" * (index[name]["offset"] - position))
+            bfile.write(array.tobytes())
+            position = index[name]["offset"] + array.nbytes
+
+
+@cast_urlpath
+def load_bundle(path: URLPath, mmap: bool = True, verify: bool = True) -> Tuple[Dict[str, np.array], dict]:
+    """Load arrays and metadata from a file created with save_bundle.
+
+    Args:
+        path: Path to bundle file.
+        mmap: Memory-map arrays instead of reading them into memory.
+        verify: Check the sha256 hash of the array data.
+
+    Returns:
+        Tuple of dict of arrays and metadata.
+
+    Raises:
+        ValueError if the file is not a valid bundle or fails the integrity check.
+    """
+    with path.open("rb") as bfile:
+        magic = bfile.read(len(BUNDLE_MAGIC))
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"{path} is not a flowcat bundle.")
+        version, header_length = struct.unpack("<IQ", bfile.read(12))
+        if version > BUNDLE_VERSION:
+            raise ValueError(f"Unsupported bundle version {version} in {path}")
+        header = json.loads(bfile.read(header_length).decode("utf-8"), object_hook=as_fc)
+
+    data_start = _align_offset(len(BUNDLE_MAGIC) + 12 + header_length)
+    data_length = max(
+        [v["offset"] + int(np.prod(v["shape"])) * np.dtype(v["dtype"]).itemsize for v in header["arrays"].values()],
+        default=0)
+
+    if data_length:
+        raw = np.memmap(str(path), dtype=np.uint8, mode="r", offset=data_start, shape=(data_length,))
+    else:
+        raw = np.zeros(0, dtype=np.uint8)
+
+    if verify and hashlib.sha256(raw).hexdigest() != header["sha256"]:
+        raise ValueError(f"Integrity check failed for bundle {path}")
+
+    if not mmap:
+        raw = np.array(raw)
+
+    arrays = {}
+    for name, info in header["arrays"].items():
+        dtype = np.dtype(info["dtype"])
+        count = int(np.prod(info["shape"]))
+        arrays[name] = np.frombuffer(
+            raw, dtype=dtype, count=count, offset=info["offset"]).reshape(info["shape"])
+    return arrays, header["meta"]
+
+
+def casesom_to_bundle(model: "CaseSom", prefix: str = "reference") -> Tuple[Dict[str, np.array], dict]:
+    """Get weights, scalers and configs of a trained CaseSom for saving in a bundle."""
+    arrays = {}
+    meta = {}
+    for tube, tmodel in model.models.items():
+        if not tmodel.model.trained:
+            raise RuntimeError("Model has not been trained")
+        arrays[f"{prefix}/{tube}/weights"] = tmodel.model.model.output_weights
+        arrays[f"{prefix}/{tube}/scaler"] = np.frombuffer(pickle.dumps(tmodel.model.scaler), dtype=np.uint8)
+        meta[tube] = {
+            "fcssom": tmodel.model.config,
+            "casesinglesom": tmodel.config,
+        }
+    return arrays, meta
+
+
+def casesom_from_bundle(arrays: Dict[str, np.array], meta: dict, prefix: str = "reference", **kwargs) -> "CaseSom":
+    """Create CaseSom from bundle data without restoring any checkpoints."""
+    from flowcat.sommodels import fcssom
+    from flowcat.sommodels.casesom import CaseSingleSom, CaseSom
+
+    models = {}
+    for tube, tube_meta in sorted(meta.items()):
+        config = merge_fcssom_config(tube_meta["fcssom"], **kwargs)
+        weights = arrays[f"{prefix}/{tube}/weights"]
+        scaler = pickle.loads(arrays[f"{prefix}/{tube}/scaler"].tobytes())
+        dims = config.pop("dims")
+        init_som = SOM(np.reshape(weights, dims), markers=config["markers"])
+        model = fcssom.FCSSom(dims, init=("reference", init_som), scaler=scaler, **config)
+        model.trained = True
+        models[tube] = CaseSingleSom(model=model, **tube_meta["casesinglesom"])
+    return CaseSom(models=models)
+
+
 @cast_urlpath
 def load_case_collection_from_caseinfo(data_path: URLPath, meta_path: URLPath):
     """Load case collection from caseinfo json, as used in the MLL dataset."""
@@ -292,7 +493,8 @@ def load_case_collection_from_caseinfo(data_path: URLPath, meta_path: URLPath):
 
 @cast_urlpath
 def save_case_collection(cases, destination: URLPath):
-    save_json(cases, destination)
+    """Save case collection metadata, replacing existing metadata atomically."""
+    save_json_atomic(cases, destination)
 
 
 def loading_bar(iterable, label="Transforming", total=None):
@@ -308,26 +510,83 @@ def loading_bar(iterable, label="Transforming", total=None):
 
 
 @cast_urlpath
-def save_case_collection_with_data(cases: "CaseCollection", destination: URLPath) -> "CaseCollection":
-    """Saves samples to a new dataset location and returns the resaved case collection."""
+def relocate_case_collection(cases: "CaseCollection", data_path: URLPath) -> "CaseCollection":
+    """Copy case collection with samples pointing to the given data path.
+
+    Cases and samples are copied, so that the original collection is unchanged.
+    """
+    return case_dataset.CaseCollection(
+        [
+            case_obj.copy(samples=[s.copy(dataset_path=data_path) for s in case_obj.samples])
+            for case_obj in cases
+        ],
+        data_path=data_path,
+        selected_markers=cases.selected_markers,
+        selected_tubes=cases.selected_tubes,
+        filterconfig=list(cases.filterconfig))
+
+
+@cast_urlpath
+def export_case_collections(
+        datasets: "List[CaseCollection]",
+        destination: URLPath,
+        workers: int = 8,
+        link: bool = True) -> "List[CaseCollection]":
+    """Export sample files of all datasets into destination/data.
+
+    Files are hardlinked or reflinked if possible, otherwise copied. Files
+    already existing with the same size and content are skipped. Sizes,
+    modification times and, for copied or compared files, sha256 checksums
+    are saved to destination/checksums.json.gz.
+    """
     sample_destination = destination / "data"
-    cases = cases.copy()  # this deep copies cases, so following ops are safe
+    checksums_path = destination / "checksums.json.gz"
+
+    known = {}
+    if checksums_path.exists():
+        known = {
+            str(sample_destination / path): checksum for path, checksum in load_json(checksums_path).items()
+        }
 
-    for case_obj in loading_bar(cases):
-        for case_sample in case_obj.samples:
-            sdest = sample_destination / case_sample.path
-            sdest.parent.mkdir()
-            sorig = str(case_sample.complete_path)
-            if str(sorig) != str(sdest):
-                shutil.copy(sorig, sdest)
-            case_sample.dataset_path = sample_destination
+    files = [
+        (str(case_sample.complete_path), str(sample_destination / case_sample.path))
+        for cases in datasets for case_obj in cases for case_sample in case_obj.samples
+    ]
+    checksums, methods = export_files(files, known=known, workers=workers, link=link)
+    LOGGER.info("Exported %d files to %s: %s", len(files), destination, methods)
 
+    checksums = {
+        str(URLPath(path).relative_to(sample_destination)): checksum for path, checksum in checksums.items()
+    }
+    save_json_atomic(checksums, checksums_path)
+    return [relocate_case_collection(cases, sample_destination) for cases in datasets]
+
+
+@cast_urlpath
+def save_case_collection_with_data(
+        cases: "CaseCollection",
+        destination: URLPath,
+        workers: int = 8,
+        link: bool = True) -> "CaseCollection":
+    """Saves samples to a new dataset location and returns the resaved case collection.
+
+    Args:
+        workers: Number of files exported concurrently.
+        link: Hardlink files on the same filesystem instead of copying.
+    """
+    cases, = export_case_collections([cases], destination, workers=workers, link=link)
+    manifest.save_manifest(
+        manifest.create_manifest(cases, workers=workers), destination / manifest.MANIFEST_NAME)
     save_case_collection(cases, destination=destination / "meta.json.gz")
     return cases
 
 
 @cast_urlpath
-def save_merged_case_collection(datasets: "List[CaseCollection]", dest: URLPath) -> "CaseCollection":
+def save_merged_case_collection(
+        datasets: "List[CaseCollection]",
+        dest: URLPath,
+        workers: int = 8,
+        link: bool = True) -> "CaseCollection":
     """Save the FCS data from the given collections to the given destination directory as a single dataset."""
     labels = Counter([c.id for d in datasets for c in d])
     duplicates = {k: v for k, v in labels.items() if v > 1}
@@ -335,8 +594,74 @@ def save_merged_case_collection(datasets: "List[CaseCollection]", dest: URLPath)
     if len(duplicates) > 0:
         raise RuntimeError(f"Duplicate keys encountered: {duplicates}")
 
-    result_datasets = [save_case_collection_with_data(d, dest) for d in datasets]
-    merged_dataset = case_dataset.CaseCollection([c for d in result_datasets for c in d], data_path=dest)
+    result_datasets = export_case_collections(datasets, dest, workers=workers, link=link)
+    merged_dataset = case_dataset.CaseCollection(
+        [c for d in result_datasets for c in d], data_path=dest / "data")
+    manifest.save_manifest(
+        manifest.create_manifest(merged_dataset, workers=workers), dest / manifest.MANIFEST_NAME)
+    save_case_collection(merged_dataset, destination=dest / "meta.json.gz")
+    return merged_dataset
+
+
+def same_som_config(config_a: dict, config_b: dict) -> bool:
+    """Check whether SOMs in datasets with the given configs are interchangeable."""
+    def comparable(tube_config):
+        reference = tube_config.get("reference") or {}
+        return (
+            list(tube_config["dims"]),
+            [str(c) for c in tube_config["channels"]],
+            tube_config.get("storage", "float32"),
+            reference.get("version"),
+            reference.get("threshold"),
+            tube_config.get("padding", 0),
+        )
+
+    if set(config_a) != set(config_b):
+        return False
+    return all(comparable(config_a[tube]) == comparable(config_b[tube]) for tube in config_a)
+
+
+@cast_urlpath
+def merge_som_datasets(
+        paths: "List[URLPath]",
+        output: URLPath,
+        workers: int = 8,
+        link: bool = True) -> "CaseCollection":
+    """Merge SOM datasets, eg shards transformed on different machines, into a single dataset.
+
+    Raises:
+        ValueError if datasets have been created with different SOM configs.
+        RuntimeError if case ids or SOM files exist in multiple datasets.
+    """
+    configs = [load_json(path / "config.json") for path in paths]
+    for path, config in zip(paths[1:], configs[1:]):
+        if not same_som_config(configs[0], config):
+            raise ValueError(f"SOM config of {path} does not match {paths[0]}")
+
+    datasets = [load_case_collection(path) for path in paths]
+    labels = Counter([c.id for d in datasets for c in d])
+    duplicates = {k: v for k, v in labels.items() if v > 1}
+    if duplicates:
+        raise RuntimeError(f"Duplicate keys encountered: {duplicates}")
+    sompaths = Counter([str(s.path) for d in datasets for c in d for s in c.samples])
+    duplicates = {k: v for k, v in sompaths.items() if v > 1}
+    if duplicates:
+        raise RuntimeError(f"Duplicate SOM files encountered: {duplicates}")
+
+    # delta encoded SOMs need the shared reference weights
+    references = [
+        (str(paths[0] / tube_config["reference"]["path"]), str(output / tube_config["reference"]["path"]))
+        for tube_config in configs[0].values() if tube_config.get("reference", {}).get("path")
+    ]
+    export_files(references, workers=workers, link=link, label="Exporting references")
+
+    result_datasets = export_case_collections(datasets, output, workers=workers, link=link)
+    merged_dataset = case_dataset.CaseCollection(
+        [c for d in result_datasets for c in d],
+        data_path=output / "data",
+        selected_markers=datasets[0].selected_markers)
+    save_json_atomic(configs[0], output / "config.json")
+    save_case_collection(merged_dataset, destination=output / "meta.json.gz")
     return merged_dataset
 
 
@@ -0,0 +1,250 @@
+"""Subsample events of single samples before SOM training and transformation.
+
+Subsamplers are created from a config dict, eg:
+
+    {"strategy": "density", "size": 50000, "seed": 42}
+
+Sampling is deterministic for a given seed and sample key, so that the same
+events are selected for a case independent of processing order.
+"""
+from typing import Iterable, Union
+import hashlib
+import logging
+
+import numpy as np
+
+from flowcat import seed as fc_seed
+from flowcat.types.fcsdata import FCSData
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def weighted_choice(weights: np.array, size: int, rng: np.random.RandomState) -> np.array:
+    """Choose indexes without replacement with probability proportional to weights.
+
+    Uses exponential keys, so that a single pass over all events is sufficient.
+    """
+    keys = np.log(rng.random_sample(weights.shape[0])) / weights
+    selection = np.argpartition(-keys, size - 1)[:size]
+    return np.sort(selection)
+
+
+def reservoir_updates(seen: int, chunk_size: int, size: int, rng: np.random.RandomState):
+    """Get reservoir slots and chunk offsets of events entering the reservoir.
+
+    Args:
+        seen: Number of events seen before the chunk.
+        chunk_size: Number of events in the chunk.
+        size: Size of the reservoir.
+        rng: Random state used for replacement decisions.
+    Returns:
+        Tuple of reservoir slots and offsets of the replacing events in the chunk.
+    """
+    positions = np.arange(seen, seen + chunk_size)
+    slots = positions.copy()
+    full = positions >= size
+    slots[full] = (rng.random_sample(np.count_nonzero(full)) * (positions[full] + 1)).astype(np.int64)
+
+    entering = slots < size
+    slots = slots[entering]
+    positions = positions[entering]
+    # later events replace earlier ones in the same slot
+    slots, last = np.unique(slots[::-1], return_index=True)
+    return slots, positions[::-1][last] - seen
+
+
+def reservoir_indices(chunk_sizes: Iterable[int], size: int, rng: np.random.RandomState) -> np.array:
+    """Select event indexes from a stream of chunks with reservoir sampling.
+
+    Returns:
+        Sorted indexes of events in the reservoir.
+    """
+    reservoir = np.zeros(size, dtype=np.int64)
+    seen = 0
+    for chunk_size in chunk_sizes:
+        slots, offsets = reservoir_updates(seen, chunk_size, size, rng)
+        reservoir[slots] = offsets + seen
+        seen += chunk_size
+    return np.sort(reservoir[:min(seen, size)])
+
+
+class Subsampler:
+    """Select a subset of events from single samples."""
+
+    strategy = None
+
+    def __init__(self, size: int = None, seed: int = None):
+        """
+        Args:
+            size: Maximum number of events per sample.
+            seed: Seed combined with the sample key. None uses the flowcat seed.
+        """
+        self.size = size
+        self.seed = seed
+
+    @property
+    def config(self) -> dict:
+        return {"strategy": self.strategy, "size": self.size, "seed": self.seed}
+
+    def random_state(self, key: str = "") -> np.random.RandomState:
+        """Create random state for the given sample key."""
+        seed = fc_seed.SEED if self.seed is None else self.seed
+        if seed is None:
+            return np.random.RandomState()
+        digest = hashlib.sha256(f"{seed}_{key}".encode()).digest()
+        return np.random.RandomState(int.from_bytes(digest[:4], "little"))
+
+    def select(self, data: np.array, rng: np.random.RandomState) -> np.array:
+        """Get indexes of selected events. None selects all events."""
+        raise NotImplementedError
+
+    def __call__(self, data: FCSData, key: str = "") -> FCSData:
+        selection = self.select(data.data, self.random_state(key))
+        if selection is None:
+            return data
+        LOGGER.debug("Subsampled %s from %d to %d events", key, data.shape[0], selection.shape[0])
+        return data.take(selection)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.config}>"
+
+
+class UniformSubsampler(Subsampler):
+    """Keep a fixed fraction of events in every sample."""
+
+    strategy = "uniform"
+
+    def __init__(self, fraction: float = 1.0, size: int = None, seed: int = None):
+        super().__init__(size=size, seed=seed)
+        if not 0 < fraction <= 1:
+            raise ValueError(f"Fraction {fraction} not in (0, 1]")
+        self.fraction = fraction
+
+    @property
+    def config(self) -> dict:
+        return {**super().config, "fraction": self.fraction}
+
+    def select(self, data, rng):
+        count = int(round(data.shape[0] * self.fraction))
+        if self.size is not None:
+            count = min(count, self.size)
+        if count >= data.shape[0]:
+            return None
+        return np.sort(rng.choice(data.shape[0], count, replace=False))
+
+
+class CappedSubsampler(Subsampler):
+    """Uniformly select at most size events in every sample."""
+
+    strategy = "capped"
+
+    def select(self, data, rng):
+        if self.size is None or data.shape[0] <= self.size:
+            return None
+        return np.sort(rng.choice(data.shape[0], self.size, replace=False))
+
+
+class DensitySubsampler(Subsampler):
+    """Select at most size events with inverse probability to local density.
+
+    Density is approximated by the number of events in the same cell of a grid
+    with bins per channel. Sparse populations are thus kept preferentially.
+    """
+
+    strategy = "density"
+
+    def __init__(self, size: int = None, seed: int = None, bins: int = 8, alpha: float = 1.0):
+        """
+        Args:
+            bins: Number of bins per channel used for density estimation.
+            alpha: Exponent of the inverse density, 0 is uniform sampling.
+        """
+        super().__init__(size=size, seed=seed)
+        self.bins = bins
+        self.alpha = alpha
+
+    @property
+    def config(self) -> dict:
+        return {**super().config, "bins": self.bins, "alpha": self.alpha}
+
+    def density(self, data: np.array) -> np.array:
+        """Get number of events in the grid cell of each event."""
+        mins = data.min(axis=0)
+        ranges = data.max(axis=0) - mins
+        ranges[ranges == 0] = 1
+        binned = np.minimum(((data - mins) / ranges * self.bins).astype(np.int64), self.bins - 1)
+
+        # hash grid cells into single integers, overflow is intended
+        multipliers = np.random.RandomState(0).randint(1, 2 ** 62, size=data.shape[1], dtype=np.int64)
+        with np.errstate(over="ignore"):
+            cells = binned @ multipliers
+        _, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+        return counts[inverse.ravel()]
+
+    def select(self, data, rng):
+        if self.size is None or data.shape[0] <= self.size:
+            return None
+        weights = 1.0 / np.power(self.density(data), self.alpha)
+        return weighted_choice(weights, self.size, rng)
+
+
+class ReservoirSubsampler(Subsampler):
+    """Select at most size events in a single pass over chunks of events."""
+
+    strategy = "reservoir"
+
+    def __init__(self, size: int = None, seed: int = None, chunk_size: int = 100000):
+        super().__init__(size=size, seed=seed)
+        self.chunk_size = chunk_size
+
+    @property
+    def config(self) -> dict:
+        return {**super().config, "chunk_size": self.chunk_size}
+
+    def sample_stream(self, chunks: Iterable[np.array], key: str = "") -> np.array:
+        """Sample rows from an iterable of event arrays, which are only read once."""
+        rng = self.random_state(key)
+        reservoir = None
+        seen = 0
+        for chunk in chunks:
+            if reservoir is None:
+                reservoir = np.zeros((self.size, *chunk.shape[1:]), dtype=chunk.dtype)
+            slots, offsets = reservoir_updates(seen, chunk.shape[0], self.size, rng)
+            reservoir[slots] = chunk[offsets]
+            seen += chunk.shape[0]
+        if reservoir is None:
+            raise ValueError("Empty stream")
+        return reservoir[:min(seen, self.size)]
+
+    def select(self, data, rng):
+        if self.size is None or data.shape[0] <= self.size:
+            return None
+        chunk_sizes = [
+            min(self.chunk_size, data.shape[0] - start)
+            for start in range(0, data.shape[0], self.chunk_size)
+        ]
+        return reservoir_indices(chunk_sizes, self.size, rng)
+
+
+STRATEGIES = {
+    sampler.strategy: sampler
+    for sampler in (UniformSubsampler, CappedSubsampler, DensitySubsampler, ReservoirSubsampler)
+}
+
+
+def create_subsampler(config: Union[dict, Subsampler, None]) -> Union[Subsampler, None]:
+    """Create a subsampler from the given config.
+
+    Args:
+        config: Dict with strategy and its arguments, an existing subsampler or None.
+    Returns:
+        Subsampler or None if no subsampling should be done.
+    """
+    if config is None or isinstance(config, Subsampler):
+        return config
+    args = dict(config)
+    strategy = args.pop("strategy", "capped")
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown subsampling strategy: {strategy}")
+    return STRATEGIES[strategy](**args)
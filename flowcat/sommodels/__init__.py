@@ -0,0 +1,15 @@
+"""
+SOM models depend on tensorflow, submodules are only imported on access.
+
+Import submodules explicitly, e.g. from flowcat.sommodels import casesom,
+since attribute access on the package needs python 3.7.
+"""
+import importlib
+
+SUBMODULES = ("casesom", "fcssom", "nearest", "tfsom", "topology")
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
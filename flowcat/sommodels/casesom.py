@@ -1,5 +1,7 @@
-from typing import Iterable, List, Dict, Tuple
+from typing import Iterable, List, Dict, Tuple, Callable
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import logging
 
 import numpy as np
 
@@ -12,6 +14,9 @@ from flowcat.preprocessing.case_sample_merge import CaseSampleMergeTransformer
 from .fcssom import FCSSom
 
 
+LOGGER = logging.getLogger(__name__)
+
+
 class CaseSomSampleException(Exception):
     def __init__(self, case_id, *args):
         self.case_id = case_id
@@ -67,13 +72,14 @@ class CaseMergeSom:
         return f"{case.id}_{self.run_identifier}"
 
     def train(self, data: "Iterable[Case]"):
+        data = list(data)
         fcsdatas = [self._merger.transform(c) for c in data]
-        self._model.train(fcsdatas)
+        self._model.train(fcsdatas, keys=[c.id for c in data])
         return self
 
     def transform(self, data: "Case"):
         fcsdata = self._merger.transform(data)
-        somdata = self._model.transform(fcsdata)
+        somdata = self._model.transform(fcsdata, label=data.id)
         som_id = self.get_som_id(data)
         somsample = fc_sample.SOMSample(
             id=som_id,
@@ -132,9 +138,14 @@ class CaseSingleSom:
     def weights(self):
         return self.model.weights
 
+    def reconfigure(self, **kwargs) -> "CaseSingleSom":
+        """Change training parameters of the underlying SOM in place."""
+        self.model.reconfigure(**kwargs)
+        return self
+
     def train(self, data: Iterable[fc_sample.FCSSample], *args, **kwargs) -> "CaseSingleSom":
         tsamples = [c.get_data() for c in data]
-        self.model.train(tsamples)
+        self.model.train(tsamples, keys=[c.id for c in data])
         self.train_labels = [c.id for c in data]
         return self
 
@@ -146,6 +157,7 @@ class CaseSingleSom:
             raise CaseSomSampleException(data.id, self.tube, self.materials)
 
         somdata = self.model.transform(data.get_data(), label=data.id, *args, **kwargs)
+        LOGGER.info("Transformed %s tube %s in %d epochs", data.id, self.tube, self.model.epochs_run)
         som_id = f"{data.case_id}_t{self.tube}_{self.run_identifier}"
         somsample = fc_sample.SOMSample(
             id=som_id,
@@ -177,6 +189,10 @@ class CaseSom:
             models: Dict[str, CaseSingleSom] = None,
             materials: list = None,
             tensorboard_dir: utils.URLPath = None,
+            parallel: bool = True,
+            intra_op_threads: "Union[int, str]" = None,
+            inter_op_threads: "Union[int, str]" = None,
+            workers: int = 1,
     ):
         """
         Args:
@@ -185,9 +201,19 @@ class CaseSom:
             models: Alternatively directly give a dictionary mapping tubes to SOM models.
             tensorboard_dir: Path for logging data. Each tube will be saved separately.
             materials: List of allowed materials, as enum of MATERIAL
+            parallel: Process tubes of a single case concurrently. Every tube
+                model has its own tensorflow session, so tubes are independent.
+            intra_op_threads, inter_op_threads: Thread counts for each tube
+                session, 'auto' divides cores among all concurrent sessions.
+            workers: Number of CaseSom models running concurrently on this
+                machine, used to resolve 'auto' thread counts.
         """
         self.materials = materials
+        self.parallel = parallel
         if models is None:
+            concurrent_sessions = workers * (len(tubes) if parallel else 1)
+            session_threads = utils.resolve_session_threads(
+                intra_op_threads, inter_op_threads, workers=concurrent_sessions)
             self.models = {}
             for tube, markers in tubes.items():
                 self.models[tube] = CaseSingleSom(
@@ -195,6 +221,7 @@ class CaseSom:
                     markers=markers,
                     tensorboard_dir=tensorboard_dir / f"tube{tube}" if tensorboard_dir else None,
                     materials=materials,
+                    **session_threads,
                     **modelargs)
         else:
             self.models = models
@@ -212,11 +239,28 @@ class CaseSom:
             } for tube, m in self.models.items()
         }
 
-    def calculate_nearest_nodes(self, data: fc_case.Case) -> dict:
-        return {
-            tube: model.calculate_nearest_nodes(data.get_data(tube, kind="fcs"))
-            for tube, model in self.models.items()
+    def reconfigure(self, **kwargs) -> "CaseSom":
+        """Change training parameters for all tube models in place."""
+        for model in self.models.values():
+            model.reconfigure(**kwargs)
+        return self
+
+    def _map_tubes(self, fun: Callable[[str, CaseSingleSom], "Any"], tubes: List[str] = None) -> dict:
+        """Apply function to all or the given tube models, concurrently if parallel is enabled."""
+        models = {
+            tube: model for tube, model in self.models.items() if tubes is None or tube in tubes
         }
+        if self.parallel and len(models) > 1:
+            with ThreadPoolExecutor(max_workers=len(models)) as executor:
+                futures = {
+                    tube: executor.submit(fun, tube, model) for tube, model in models.items()
+                }
+                return {tube: future.result() for tube, future in futures.items()}
+        return {tube: fun(tube, model) for tube, model in models.items()}
+
+    def calculate_nearest_nodes(self, data: fc_case.Case) -> dict:
+        return self._map_tubes(
+            lambda tube, model: model.calculate_nearest_nodes(data.get_tube(tube, kind="fcs")))
 
     def train(self, data: Iterable[fc_case.Case], *args, **kwargs) -> "CaseSom":
         for tube, model in self.models.items():
@@ -224,17 +268,21 @@ class CaseSom:
             model.train([d.get_tube(tube) for d in data], *args, **kwargs)
         return self
 
-    def transform(self, data: fc_case.Case, *args, **kwargs) -> fc_case.Case:
-        samples = []
-        for tube, model in self.models.items():
+    def transform(self, data: fc_case.Case, *args, tubes: List[str] = None, **kwargs) -> fc_case.Case:
+        """Transform case into SOM samples.
+
+        Args:
+            tubes: Only transform the given tubes, by default all tubes.
+        """
+        def transform_tube(tube, model):
             print(f"Transforming tube {tube}")
-            somsample = model.transform(data.get_tube(tube, kind="fcs"), *args, **kwargs)
-            samples.append(somsample)
+            return model.transform(data.get_tube(tube, kind="fcs"), *args, **kwargs)
 
+        samples = list(self._map_tubes(transform_tube, tubes=tubes).values())
         newcase = data.copy(samples=samples)
         return newcase
 
     def transform_generator(self, data: Iterable[fc_case.Case], **kwargs) -> Iterable[Tuple[fc_case.Case, fc_sample.SOMSample]]:
-        for tube, model in self.models.items():
-            for single in data:
-                yield single, model.transform(single.get_tube(tube), **kwargs)
+        for single in data:
+            for somsample in self.transform(single, **kwargs).samples:
+                yield single, somsample
@@ -1,4 +1,4 @@
-from typing import Union, Iterable
+from typing import Union, Iterable, Tuple
 import logging
 
 import numpy as np
@@ -11,9 +11,10 @@ import tensorflow as tf
 from flowcat.utils import URLPath
 from flowcat.types.fcsdata import FCSData, join_fcs_data
 from flowcat.types.som import SOM
-from flowcat.preprocessing import scalers, edge_removal
+from flowcat.preprocessing import scalers, edge_removal, subsample as fc_subsample
 
 from .tfsom import create_initializer, TFSom
+from .topology import upsample_weights
 
 
 MARKER_IMAGES = {
@@ -32,6 +33,12 @@ MARKER_IMAGES_NAME_ONLY = {
 
 LOGGER = logging.getLogger(__name__)
 
+# training parameters that can be changed on an existing model
+RECONFIGURABLE_ARGS = (
+    "max_epochs", "batch_size", "buffer_size", "initial_radius", "end_radius",
+    "convergence", "convergence_threshold", "bmu_search",
+)
+
 
 class MarkerMissingError(Exception):
     def __init__(self, markers, message):
@@ -97,7 +104,25 @@ class FCSSom:
             name="fcssom",
             scaler="MinMaxScaler",
             scaler_args=(),
+            subsample=None,
+            multiresolution=None,
+            intra_op_threads=None,
+            inter_op_threads=None,
             **kwargs):
+        """
+        Args:
+            subsample: Subsampling config dict applied to each sample before
+                scaling, see flowcat.preprocessing.subsample.
+            multiresolution: List of coarse training stages run before the
+                full map, eg [{"dims": [8, 8], "max_epochs": 5}]. Each stage
+                dict can override TFSom arguments, the initial radius is
+                half the stage map size otherwise. Every map is
+                initialized from the upsampled weights of the previous one.
+            intra_op_threads, inter_op_threads: Thread counts of the
+                tensorflow session. These are runtime settings and are not
+                saved in the model config.
+            kwargs: Additional arguments to TFSom.
+        """
         self.dims = dims
         m, n, dim = self.dims
 
@@ -121,6 +146,14 @@ class FCSSom:
         self.marker_name_only = marker_name_only
         self.name = name
         self.markers = list(markers)
+        self.subsample = fc_subsample.create_subsampler(subsample)
+        if multiresolution and init_type != "random":
+            raise ValueError("Multiresolution training needs random initialization.")
+        self.multiresolution = multiresolution
+        self._session_threads = {
+            "intra_op_threads": intra_op_threads,
+            "inter_op_threads": inter_op_threads,
+        }
         self._graph = tf.Graph()
         self.trained = False
         self.modelargs = {
@@ -136,6 +169,7 @@ class FCSSom:
             graph=self._graph,
             initialization=initialization,
             model_name=f"{self.name}",
+            **self._session_threads,
             **kwargs)
 
         if marker_images and self.model.tensorboard:
@@ -159,8 +193,32 @@ class FCSSom:
             "trained": self.trained,
             "modelargs": self.modelargs,
             "marker_name_only": self.marker_name_only,
+            "subsample": self.subsample.config if self.subsample else None,
+            "multiresolution": self.multiresolution,
         }
 
+    @property
+    def epochs_run(self) -> int:
+        """Number of epochs run in the last training or transform."""
+        return self.model.epochs_run
+
+    def reconfigure(self, **kwargs) -> "FCSSom":
+        """Change training parameters in place without rebuilding the model.
+
+        Raises:
+            ValueError if a parameter can not be changed on an existing model.
+        """
+        if "subsample" in kwargs:
+            self.subsample = fc_subsample.create_subsampler(kwargs.pop("subsample"))
+
+        unsupported = [k for k in kwargs if k not in RECONFIGURABLE_ARGS]
+        if unsupported:
+            raise ValueError(f"Parameters {unsupported} cannot be changed on an existing model.")
+
+        self.model.reconfigure(**kwargs)
+        self.modelargs["kwargs"] = {**self.modelargs["kwargs"], **kwargs}
+        return self
+
     def add_weight_images(self, marker_dict):
         """
         Params:
@@ -198,6 +256,11 @@ class FCSSom:
     def weights(self):
         return self._create_som(self.model.output_weights)
 
+    @property
+    def reference_weights(self):
+        """Weights used as initial values when transforming samples."""
+        return self._create_som(self.model.ref_weights)
+
     def _create_som(self, weights: np.array):
         return SOM(np.reshape(weights, self.dims), markers=self.markers)
 
@@ -230,24 +293,72 @@ class FCSSom:
         res, mask = self.prepare_data(data)
         return self.model.calculate_nearest_nodes(res, mask)
 
-    def train(self, data: Iterable[FCSData], sample: int = -1):
+    def train(self, data: Iterable[FCSData], sample: int = -1, keys: Iterable[str] = None):
         """Input an iterable with FCSData
         Params:
             data: FCSData object
             sample: Optional subsample to be used in training
+            keys: Optional sample identifiers used for deterministic subsampling.
         """
+        if self.subsample:
+            data = list(data)
+            keys = keys or map(str, range(len(data)))
+            data = [self.subsample(d, key=k) for d, k in zip(data, keys)]
+
         if self.marker_name_only:
             data = [d.marker_to_name_only() for d in data]
 
         joined = join_fcs_data(data, self.markers)
         arr, mask = self.prepare_data(joined, sample=sample, fit_scaler=True)
 
+        if self.multiresolution:
+            self._train_stages(arr, mask)
+
         self.model.train(arr, mask)
         self.trained = True
         return self
 
+    def _stage_args(self, stage: dict) -> Tuple[Tuple[int, int], dict]:
+        """Get map size and TFSom arguments of a multiresolution stage.
+
+        The radius arguments of the full map belong to its short refinement,
+        so stages start from half their map size unless set in the stage
+        and the end radius never exceeds the initial radius.
+        """
+        stage_args = {**self.modelargs["kwargs"], **stage}
+        stage_m, stage_n = stage_args.pop("dims")
+        initial_radius = float(stage.get("initial_radius", max(stage_m, stage_n) / 2.0))
+        end_radius = float(stage_args.get("end_radius") or 1.0)
+        stage_args["initial_radius"] = initial_radius
+        stage_args["end_radius"] = min(end_radius, initial_radius)
+        return (stage_m, stage_n), stage_args
+
+    def _train_stages(self, arr: np.array, mask: np.array):
+        """Train coarse maps and initialize the full map with upsampled weights."""
+        dim = self.model._dim
+        map_type = self.model._map_type
+        weights = None
+        for i, stage in enumerate(self.multiresolution):
+            (stage_m, stage_n), stage_args = self._stage_args(stage)
+            stage_model = TFSom(
+                (stage_m, stage_n, dim),
+                model_name=f"{self.name}_stage{i}",
+                **self._session_threads,
+                **stage_args).initialize()
+            if weights is not None:
+                stage_model.set_weights(upsample_weights(weights, (stage_m, stage_n), map_type))
+            stage_model.train(arr, mask, label=f"stage{i}")
+            weights = np.reshape(stage_model.output_weights, (stage_m, stage_n, dim))
+            stage_model.close()
+            LOGGER.info("Trained multiresolution stage %d with %dx%d nodes", i, stage_m, stage_n)
+
+        self.model.set_weights(upsample_weights(weights, (self.model._m, self.model._n), map_type))
+
     def transform(self, data: FCSData, sample: int = -1, label: str = "", scaler=None) -> SOM:
         """Transform input fcs into retrained SOM node weights."""
+        if self.subsample:
+            data = self.subsample(data, key=label)
+
         res, mask = self.prepare_data(data, sample=sample, scaler=scaler, fit_scaler=False)
 
         weights = self.model.transform(res, mask, label=label)
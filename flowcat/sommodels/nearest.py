@@ -0,0 +1,169 @@
+"""
+Best matching node search on the host for large SOM maps. Only depends on
+numpy and scipy.
+
+Searches are created from a config dict, eg:
+
+    {"method": "kdtree", "eps": 0.5}
+"""
+from typing import Tuple, Union
+import logging
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def exact_nearest(
+        weights: np.array,
+        data: np.array,
+        mask: np.array = None,
+        chunk_size: int = 4096) -> Tuple[np.array, np.array]:
+    """Find best matching nodes by scanning all nodes.
+
+    Missing channels are excluded from the distance using the mask, as in
+    the tensorflow implementation.
+
+    Returns:
+        Tuple of node indexes and euclidean distances.
+    """
+    if mask is None:
+        mask = np.ones(data.shape)
+    squared_weights = np.square(weights)
+
+    indexes = np.zeros(data.shape[0], dtype=np.int64)
+    distances = np.zeros(data.shape[0])
+    for start in range(0, data.shape[0], chunk_size):
+        chunk = data[start:start + chunk_size]
+        chunk_mask = mask[start:start + chunk_size]
+        masked = chunk * chunk_mask
+        squared = (
+            np.sum(masked * chunk, axis=1)[:, None]
+            - 2 * masked @ weights.T
+            + chunk_mask @ squared_weights.T)
+        nearest = np.argmin(squared, axis=1)
+        indexes[start:start + chunk_size] = nearest
+        distances[start:start + chunk_size] = np.sqrt(np.maximum(
+            squared[np.arange(nearest.shape[0]), nearest], 0))
+    return indexes, distances
+
+
+class KDTreeSearch:
+    """Approximate search with a KD-tree rebuilt on the current weights.
+
+    Events are grouped by their channels present in the mask and every group
+    is searched in a tree on the weights of the present channels only.
+    Missing markers mask whole columns, so usually a single tree is needed.
+    Events of masks beyond the max_trees most frequent ones use the exact
+    search. Recall is measured against the exact search on a random subset
+    of events, if it falls below min_recall all events are searched exactly.
+    """
+
+    method = "kdtree"
+
+    def __init__(
+            self,
+            eps: float = 0.0,
+            leafsize: int = 16,
+            recall_sample: int = 1000,
+            min_recall: float = 0.9,
+            max_trees: int = 4,
+            seed: int = None):
+        """
+        Args:
+            eps: Approximation factor, results are within (1 + eps) of the nearest distance.
+            leafsize: Number of nodes in tree leafs.
+            recall_sample: Number of events used to measure recall, 0 to disable.
+            min_recall: Fall back to exact search below this recall.
+            max_trees: Maximum number of trees built for different masks of present channels.
+            seed: Seed for selecting recall events.
+        """
+        self.eps = eps
+        self.leafsize = leafsize
+        self.recall_sample = recall_sample
+        self.min_recall = min_recall
+        self.max_trees = max_trees
+        self._rng = np.random.RandomState(seed)
+        self.recall = None
+
+    @property
+    def config(self) -> dict:
+        return {
+            "method": self.method,
+            "eps": self.eps,
+            "leafsize": self.leafsize,
+            "recall_sample": self.recall_sample,
+            "min_recall": self.min_recall,
+            "max_trees": self.max_trees,
+        }
+
+    def query(self, weights: np.array, data: np.array, mask: np.array = None) -> Tuple[np.array, np.array]:
+        """Find approximate best matching nodes.
+
+        Returns:
+            Tuple of node indexes and euclidean distances.
+        """
+        indexes = np.zeros(data.shape[0], dtype=np.int64)
+        distances = np.zeros(data.shape[0])
+        if mask is None:
+            distances[:], indexes[:] = cKDTree(weights, leafsize=self.leafsize).query(data, eps=self.eps)
+            return indexes, distances
+
+        present, groups, counts = np.unique(mask > 0, axis=0, return_inverse=True, return_counts=True)
+        groups = groups.ravel()
+        exact = np.zeros(data.shape[0], dtype=bool)
+        for rank, group in enumerate(np.argsort(-counts, kind="stable")):
+            selected = groups == group
+            channels = present[group]
+            if rank >= self.max_trees or not np.any(channels):
+                exact |= selected
+                continue
+            tree = cKDTree(weights[:, channels], leafsize=self.leafsize)
+            distances[selected], indexes[selected] = tree.query(
+                data[np.ix_(selected, channels)], eps=self.eps)
+        if np.any(exact):
+            indexes[exact], distances[exact] = exact_nearest(weights, data[exact], mask[exact])
+        return indexes, distances
+
+    def measure_recall(self, weights, data, mask, indexes) -> float:
+        """Get fraction of a random subset of events matching the exact search."""
+        size = min(self.recall_sample, data.shape[0])
+        selection = self._rng.choice(data.shape[0], size, replace=False)
+        sel_mask = None if mask is None else mask[selection]
+        exact, _ = exact_nearest(weights, data[selection], sel_mask)
+        return float(np.mean(exact == indexes[selection]))
+
+    def __call__(self, weights: np.array, data: np.array, mask: np.array = None) -> Tuple[np.array, np.array]:
+        """Search best matching nodes with exact fallback on low recall."""
+        indexes, distances = self.query(weights, data, mask)
+        if self.recall_sample and data.shape[0]:
+            self.recall = self.measure_recall(weights, data, mask, indexes)
+            LOGGER.debug("Approximate node search recall %.4f", self.recall)
+            if self.recall < self.min_recall:
+                LOGGER.warning(
+                    "Recall %.4f below %.4f, using exact node search", self.recall, self.min_recall)
+                indexes, distances = exact_nearest(weights, data, mask)
+        return indexes, distances
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.config}>"
+
+
+SEARCH_METHODS = {
+    KDTreeSearch.method: KDTreeSearch,
+}
+
+
+def create_search(config: Union[dict, str, None]) -> Union[KDTreeSearch, None]:
+    """Create node search from method name or config dict. None uses the exact search in the graph."""
+    if config is None:
+        return None
+    if isinstance(config, str):
+        config = {"method": config}
+    args = dict(config)
+    method = args.pop("method")
+    if method not in SEARCH_METHODS:
+        raise ValueError(f"Unknown node search method: {method}")
+    return SEARCH_METHODS[method](**args)
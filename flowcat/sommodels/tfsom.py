@@ -31,6 +31,8 @@ import tensorflow as tf
 from flowcat import seed as fc_seed
 from flowcat.utils import create_stamp, URLPath
 
+from . import nearest, topology
+
 """
 Adapted from code by Chris Gorman.
 https://github.com/cgorman/tensorflow-som
@@ -43,6 +45,10 @@ tf.logging.set_verbosity(tf.logging.WARN)
 
 LOGGER = logging.getLogger(__name__)
 
+CONVERGENCE_CRITERIA = ("mean_delta", "max_delta", "quantization_error")
+
+NEIGHBOURHOODS = ("gaussian", "truncated")
+
 
 def linear_cooling(initial, end, epoch, max_epochs):
     """Implement linear decay of parameter depending on the current epoch."""
@@ -70,13 +76,14 @@ def exponential_cooling(initial, end, epoch, max_epochs):
     #     diff = -log(end / start) / nEpoch;
     # }
     # return start * exp(-epoch * diff);
-    if end == 0:
-        diff_a = tf.log(0.1)
-    else:
-        diff_a = tf.log(
+    end = tf.cast(end, tf.float32)
+    diff_a = tf.where(
+        tf.equal(end, 0.0),
+        tf.log(0.1),
+        tf.log(
             tf.divide(
-                tf.cast(end, tf.float32),
-                tf.cast(initial, tf.float32)))
+                end,
+                tf.cast(initial, tf.float32))))
 
     diff = tf.divide(
         diff_a,
@@ -156,6 +163,100 @@ def calculate_node_distance(matched_location, location_vectors, map_type, distan
     return bmu_distances
 
 
+def embedded_node_distance(bmu_indices, map_type, distance_type, m, n):
+    """Calculate distances between best matching nodes and all nodes from grid coordinates.
+
+    Used for maps too large for a precomputed distance table.
+    """
+    coords, shifts, metric = topology.grid_embedding(m, n, map_type, distance_type)
+    coords = tf.constant(coords, dtype=tf.float32)
+    shifts = tf.constant(shifts, dtype=tf.float32)
+    bmu_coords = tf.gather(coords, bmu_indices)
+
+    # shape: [events, nodes, shifts, 2]
+    diff = (
+        tf.reshape(coords, (1, -1, 1, 2))
+        + tf.reshape(shifts, (1, 1, -1, 2))
+        - tf.reshape(bmu_coords, (-1, 1, 1, 2)))
+    if metric == "euclidean":
+        distance = tf.reduce_sum(tf.square(diff), axis=3)
+    elif metric == "manhattan":
+        distance = tf.reduce_sum(tf.abs(diff), axis=3)
+    elif metric == "chebyshev":
+        distance = tf.reduce_max(tf.abs(diff), axis=3)
+    else:
+        distance = (tf.abs(diff[..., 0]) + tf.abs(diff[..., 1]) + tf.abs(diff[..., 0] + diff[..., 1])) / 2
+    return tf.reduce_min(distance, axis=2)
+
+
+def truncated_gaussian(distance, sigma, truncate, distance_type):
+    """Gaussian neighbourhood of node distances, zero beyond truncate * sigma."""
+    # euclidean node distances are squared
+    geometric_distance = tf.sqrt(distance) if distance_type == "euclidean" else distance
+    kernel = tf.exp(tf.divide(tf.negative(distance), tf.multiply(tf.square(sigma), 2)))
+    return tf.where(
+        geometric_distance <= tf.multiply(float(truncate), sigma), kernel, tf.zeros_like(kernel))
+
+
+def neighbourhood_stencil(sigma, truncate, distance_type, max_offset):
+    """Create gaussian neighbourhood kernel for node offsets up to truncate * sigma.
+
+    Args:
+        sigma: Standard deviation of the neighbourhood.
+        truncate: Neighbourhood is zero beyond this multiple of sigma.
+        distance_type: Distance metric between nodes.
+        max_offset: Largest node offset, the stencil does not grow beyond.
+    Returns:
+        Square kernel with side length 2 * offset + 1.
+    """
+    cutoff = tf.multiply(float(truncate), sigma)
+    offset = tf.minimum(tf.cast(tf.ceil(cutoff), tf.int32), max_offset)
+    steps = tf.cast(tf.range(-offset, offset + 1), tf.float32)
+    rows, cols = tf.meshgrid(steps, steps, indexing="ij")
+    offsets = tf.stack([rows, cols], axis=-1)
+
+    if distance_type == "euclidean":
+        distance = squared_euclidean_distance(offsets)
+    elif distance_type == "manhattan":
+        distance = manhattan_distance(offsets)
+    elif distance_type == "chebyshev":
+        distance = chebyshev_distance(offsets)
+    else:
+        raise TypeError(f"Unknown distance type: {distance_type}")
+
+    return truncated_gaussian(distance, sigma, truncate, distance_type)
+
+
+def apply_stencil(node_values, kernel, map_size, map_type):
+    """Sum values of all nodes weighted by the kernel centered on each node.
+
+    Args:
+        node_values: Tensor of shape [m * n, channels].
+        kernel: Square kernel from neighbourhood_stencil.
+        map_size: Tuple of m and n.
+        map_type: Toroid maps wrap around at the edges, planar maps are zero padded.
+    Returns:
+        Tensor of shape [m * n, channels].
+    """
+    m, n = map_size
+    # channels are handled as separate images
+    grid = tf.reshape(tf.transpose(node_values), (-1, m, n, 1))
+    offset = (tf.shape(kernel)[0] - 1) // 2
+    if map_type == "toroid":
+        grid = tf.concat([grid[:, m - offset:], grid, grid[:, :offset]], axis=1)
+        grid = tf.concat([grid[:, :, n - offset:], grid, grid[:, :, :offset]], axis=2)
+    elif map_type == "planar":
+        grid = tf.pad(grid, [[0, 0], [offset, offset], [offset, offset], [0, 0]])
+    else:
+        raise TypeError(f"Unknown map type: {map_type}")
+
+    # kernel is symmetric, so correlation is equal to convolution
+    result = tf.nn.conv2d(
+        grid, tf.reshape(kernel, (2 * offset + 1, 2 * offset + 1, 1, 1)),
+        strides=[1, 1, 1, 1], padding="VALID")
+    return tf.transpose(tf.reshape(result, (-1, m * n)))
+
+
 def create_initializer(init, init_data, dims):
     """Create initializer for weights.
 
@@ -227,6 +328,10 @@ class TFSom:
             node_distance="euclidean", map_type="planar", std_coeff=0.5,
             model_name="Self-Organizing-Map",
             tensorboard_dir=None, seed=None,
+            intra_op_threads=None, inter_op_threads=None,
+            convergence=None, convergence_threshold=1e-3,
+            bmu_search=None,
+            neighbourhood="gaussian", truncate=3.0,
     ):
         """
         Initialize a self-organizing map on the tensorflow graph
@@ -236,14 +341,31 @@ class TFSom:
             batch_size: Number of cases in a single batch. (Not the number of
                 rows in one FCS files, this is more akin to passing multiple FCS
                 files to a single training step.)
+            buffer_size: Unused, the complete sample is staged in the graph.
+                Kept for compatibility with saved configs.
             initial_radius: Initial radius of neighborhood function.
             end_radius: End radius of neighborhood function on the last epoch.
             radius_cooling: Decay of radius over epochs.
             node_distance: Distance metric between nodes on the SOM map.
             map_type: Behavior of map edges. Either toroid (wrap-around) or planar (no wrap).
+                Hexagonal grids are available as hex and hex_toroid.
             std_coeff: Coefficient of the neighborhood function.
             model_name: Name of the SOM model. Used for tensorboard directory names.
             tensorboard_dir: Directory to save tensorboard data to. If none, tensorboard will not be generated.
+            intra_op_threads: Threads used by the session inside single operations. None uses all cores.
+            inter_op_threads: Threads used by the session to run independent operations. None uses all cores.
+            convergence: Stop training early if the criterion falls below the threshold.
+                Either mean_delta or max_delta for the weight change of
+                nodes in an epoch or quantization_error for the relative
+                improvement of the quantization error. None always runs all epochs.
+            convergence_threshold: Threshold for the convergence criterion.
+            bmu_search: Search best matching nodes on the host instead of
+                scanning all nodes in the graph, eg {"method": "kdtree", "eps": 0.5}.
+                See flowcat.sommodels.nearest for options.
+            neighbourhood: Either gaussian, which is evaluated for all nodes
+                and events, or truncated, which is zero beyond truncate * sigma
+                and updates nodes with a stencil around each best matching node.
+            truncate: Neighbourhood cutoff in multiples of sigma for truncated neighbourhoods.
         """
         # snapshot all local variables for config saving
         config = {k: v for k, v in locals().items() if k != "self"}
@@ -272,21 +394,52 @@ class TFSom:
         self._model_name = str(model_name)
         self._buffer_size = buffer_size
 
+        if convergence is not None and convergence not in CONVERGENCE_CRITERIA:
+            raise ValueError(f"Unknown convergence criterion: {convergence}")
+        self._convergence = convergence
+        self._convergence_threshold = float(convergence_threshold)
+        self.epochs_run = None
+
+        self._bmu_search = nearest.create_search(bmu_search)
+
+        if neighbourhood not in NEIGHBOURHOODS:
+            raise ValueError(f"Unknown neighbourhood: {neighbourhood}")
+        self._neighbourhood = neighbourhood
+        self._truncate = float(truncate)
+
+        # node distances are gathered from a table for all but very large maps
+        self._use_distance_table = self._m * self._n <= topology.MAX_TABLE_NODES
+        if map_type in ("hex", "hex_toroid") and neighbourhood == "truncated" and not self._use_distance_table:
+            raise ValueError("Truncated neighbourhood on hexagonal maps needs a distance table.")
+
         # Initialized later, just declaring up here for neatness and to avoid
         # warnings
         self._weights = None
         self._ref_weights = None
         self._epoch = None
+        self._schedule = None
 
         self._data_placeholder = None
         self._mask_placeholder = None
+        self._staging = None
 
         self._training_op = None
+        self._convergence_metrics = None
+        self._bmu_indices = None
+        self._min_distance = None
+        self._distance_table = None
+        self._local_variables = []
+        self._local_feed = {}
         self._assign_trained_op = None
         self._reset_weights_op = None
+        self._weights_input = None
+        self._set_weights_op = None
 
         self._initialized = False
 
+        self._intra_op_threads = intra_op_threads or 0
+        self._inter_op_threads = inter_op_threads or 0
+
         self._seed = seed
         if self._seed is None:
             self._seed = fc_seed.SEED
@@ -313,6 +466,11 @@ class TFSom:
                 "node_distance": self._node_distance,
                 "map_type": self._map_type,
                 "std_coeff": self._std_coeff,
+                "convergence": self._convergence,
+                "convergence_threshold": self._convergence_threshold,
+                "bmu_search": self._bmu_search.config if self._bmu_search else None,
+                "neighbourhood": self._neighbourhood,
+                "truncate": self._truncate,
                 "seed": self._seed
             }
             with (self._tensorboard_dir / "config.json").open("w") as f:
@@ -366,6 +524,11 @@ class TFSom:
         """
         return np.array(self._sess.run(self._weights))
 
+    @property
+    def bmu_recall(self):
+        """Recall of the last approximate node search."""
+        return self._bmu_search.recall if self._bmu_search else None
+
     @property
     def ref_weights(self):
         return np.array(self._sess.run(self._ref_weights))
@@ -379,7 +542,9 @@ class TFSom:
             graph=self._graph,
             config=tf.ConfigProto(
                 allow_soft_placement=True,
-                log_device_placement=False,))
+                log_device_placement=False,
+                intra_op_parallelism_threads=self._intra_op_threads,
+                inter_op_parallelism_threads=self._inter_op_threads,))
 
         with self._graph.as_default():
             self._data_placeholder, self._mask_placeholder = self._initialize_tf_graph()
@@ -387,7 +552,8 @@ class TFSom:
 
             # Initalize all variables
             init_op = tf.global_variables_initializer()
-            self._sess.run([init_op])
+            local_init_op = tf.variables_initializer(self._staging["variables"] + self._local_variables)
+            self._sess.run([init_op, local_init_op], feed_dict=self._local_feed)
 
             # Get some metric variables which we will reset each epoch
             if self.tensorboard:
@@ -405,15 +571,67 @@ class TFSom:
         else:
             self._summary_list.append(summary)
 
+    def _initialize_staging(self):
+        """Create variables holding the complete sample inside the graph.
+
+        The sample is copied into the graph once per training run. Each epoch
+        only shuffles an index order in-graph and batches are gathered from
+        the staged sample using that order. Staging variables are local, so
+        that they are not included in saved checkpoints.
+        """
+        with tf.name_scope("Staging"):
+            data_input = tf.placeholder(tf.float32, shape=(None, self._dim), name="data")
+            mask_input = tf.placeholder(tf.float32, shape=(None, self._dim), name="mask")
+
+            staged_data = tf.Variable(
+                tf.zeros((0, self._dim)), trainable=False, validate_shape=False,
+                collections=[tf.GraphKeys.LOCAL_VARIABLES], name="staged_data")
+            staged_mask = tf.Variable(
+                tf.zeros((0, self._dim)), trainable=False, validate_shape=False,
+                collections=[tf.GraphKeys.LOCAL_VARIABLES], name="staged_mask")
+            order = tf.Variable(
+                tf.zeros((0,), dtype=tf.int32), trainable=False, validate_shape=False,
+                collections=[tf.GraphKeys.LOCAL_VARIABLES], name="order")
+
+            stage_op = tf.group(
+                tf.assign(staged_data, data_input, validate_shape=False),
+                tf.assign(staged_mask, mask_input, validate_shape=False),
+                tf.assign(order, tf.range(tf.shape(data_input)[0]), validate_shape=False),
+            )
+            shuffle_op = tf.assign(
+                order, tf.random_shuffle(order), validate_shape=False)
+
+            batch_start = tf.placeholder(tf.int32, (), name="batch_start")
+            batch_stop = tf.placeholder(tf.int32, (), name="batch_stop")
+            batch_indexes = order[batch_start:batch_stop]
+            data = tf.reshape(tf.gather(staged_data, batch_indexes), (-1, self._dim), name="batch_data")
+            mask = tf.reshape(tf.gather(staged_mask, batch_indexes), (-1, self._dim), name="batch_mask")
+
+        self._staging = {
+            "data": data_input,
+            "mask": mask_input,
+            "stage_op": stage_op,
+            "shuffle_op": shuffle_op,
+            "batch_start": batch_start,
+            "batch_stop": batch_stop,
+            "order": order,
+            "variables": [staged_data, staged_mask, order],
+        }
+        return data, mask
+
     def _initialize_tf_graph(self):
-        """Initialize the SOM on the TensorFlow graph"""
-        data = tf.placeholder(tf.float32)
-        mask = tf.placeholder(tf.float32)
+        """Initialize the SOM on the TensorFlow graph
+
+        Returns:
+            Batch data and mask tensors. These can also be fed directly,
+            which bypasses the staged sample.
+        """
+        data, mask = self._initialize_staging()
 
         with tf.variable_scope(tf.get_variable_scope()):
             (
                 numerators, denominators,
-                self._epoch, self._weights, _, summaries
+                self._epoch, self._schedule, self._weights, _, summaries
             ) = self._tower_som(data, mask, self._initialization)
 
             sum_numerator = tf.get_variable(
@@ -427,6 +645,22 @@ class TFSom:
             )
             self._epoch_start_init_vars += [sum_numerator, sum_denominator]
 
+            # quantization error of the epoch, measured against the weights
+            # at the start of the epoch
+            min_distance = self._graph.get_tensor_by_name("BMU_Indices/min_distance:0")
+            # both can be fed with results of a search on the host
+            self._bmu_indices = self._graph.get_tensor_by_name("BMU_Indices/map_to_node_index:0")
+            self._min_distance = min_distance
+            # local, so that checkpoints keep the layout of earlier versions
+            sum_distance = tf.get_variable(
+                "sum_distance", shape=(), initializer=tf.zeros_initializer(),
+                collections=[tf.GraphKeys.LOCAL_VARIABLES])
+            num_events = tf.get_variable(
+                "num_events", shape=(), initializer=tf.zeros_initializer(),
+                collections=[tf.GraphKeys.LOCAL_VARIABLES])
+            self._local_variables += [sum_distance, num_events]
+            self._epoch_start_init_vars += [sum_distance, num_events]
+
             self._ref_weights = tf.get_variable(
                 name="ref_weights", initializer=self._weights)
 
@@ -436,27 +670,45 @@ class TFSom:
             self._batch_op = tf.group(
                 tf.assign_add(sum_numerator, numerators),
                 tf.assign_add(sum_denominator, denominators),
+                tf.assign_add(sum_distance, tf.reduce_sum(min_distance)),
+                tf.assign_add(num_events, tf.cast(tf.shape(min_distance)[0], tf.float32)),
             )
 
             # Divide them
             new_weights = tf.divide(sum_numerator, sum_denominator)
+            if self._neighbourhood == "truncated":
+                # nodes without events in their neighbourhood keep their weights
+                supported = tf.reduce_max(sum_denominator, axis=1, keepdims=True) > 1e-6
+                new_weights = tf.where(
+                    tf.tile(supported, (1, self._dim)), new_weights, self._weights)
             # diff new and old weights
+            node_delta = tf.sqrt(tf.reduce_sum(tf.pow(self._weights - new_weights, 2), axis=1))
+            control_deps = [node_delta]
             if self.tensorboard:
-                diff_weights = tf.reshape(
-                    tf.sqrt(tf.reduce_sum(tf.pow(self._weights - new_weights, 2), axis=1)),
-                    shape=(1, self._m, self._n, 1))
+                diff_weights = tf.reshape(node_delta, shape=(1, self._m, self._n, 1))
                 self.add_summary(tf.summary.image("weight_diff", diff_weights))
-                control_deps = [diff_weights]
-            else:
-                control_deps = []
+                control_deps.append(diff_weights)
 
             # Assign them
             with tf.control_dependencies(control_deps):
                 self._training_op = tf.assign(self._weights, new_weights)
 
+            self._convergence_metrics = {
+                "mean_delta": tf.reduce_mean(node_delta),
+                "max_delta": tf.reduce_max(node_delta),
+                "quantization_error": tf.divide(sum_distance, tf.maximum(num_events, 1.0)),
+            }
+
             self._assign_trained_op = tf.assign(self._ref_weights, self._weights)
             self._reset_weights_op = tf.assign(self._weights, self._ref_weights)
 
+            self._weights_input = tf.placeholder(
+                tf.float32, shape=(self._m * self._n, self._dim), name="weights_input")
+            self._set_weights_op = tf.group(
+                tf.assign(self._weights, self._weights_input),
+                tf.assign(self._ref_weights, self._weights_input),
+            )
+
         return data, mask
 
     def _tower_som(self, input_tensor, mask_tensor, initialization):
@@ -483,6 +735,15 @@ class TFSom:
         with tf.name_scope('Epoch'):
             epoch = tf.placeholder(tf.float32, ())
 
+        # Cooling parameters are fed together with the epoch, so that they
+        # can be changed without rebuilding the graph
+        with tf.name_scope('Schedule'):
+            schedule = {
+                "initial_radius": tf.placeholder(tf.float32, (), name="initial_radius"),
+                "end_radius": tf.placeholder(tf.float32, (), name="end_radius"),
+                "max_epochs": tf.placeholder(tf.float32, (), name="max_epochs"),
+            }
+
         # get best matching units for all events in batch
         with tf.name_scope('BMU_Indices'):
             # calculate dist for each cell to all nodes for all channels
@@ -526,14 +787,20 @@ class TFSom:
             # same for radius
             radius = apply_cooling(
                 self._radius_cooling,
-                self._initial_radius, self._end_radius,
-                epoch, self._max_epochs)
+                schedule["initial_radius"], schedule["end_radius"],
+                epoch, schedule["max_epochs"])
 
             # calculate the node distances between BMU and all other nodes
             # distance will depend on the used metric and the type of the map
-            map_size = tf.constant([self._m, self._n], dtype=tf.int64)
-            bmu_distances = calculate_node_distance(
-                bmu_locs, location_vects, self._map_type, self._node_distance, map_size)
+            if self._use_distance_table:
+                bmu_distances = tf.gather(self._create_distance_table(), bmu_indices)
+            elif self._map_type in ("planar", "toroid"):
+                map_size = tf.constant([self._m, self._n], dtype=tf.int64)
+                bmu_distances = calculate_node_distance(
+                    bmu_locs, location_vects, self._map_type, self._node_distance, map_size)
+            else:
+                bmu_distances = embedded_node_distance(
+                    bmu_indices, self._map_type, self._node_distance, self._m, self._n)
 
             # gaussian neighborhood, eg 67% neighborhood with 1std
             # keep in mind, that radius is decreasing with epoch
@@ -548,25 +815,29 @@ class TFSom:
                         2)))
 
         with tf.name_scope('Update_Weights'):
-            # weight input with learning rate and sum across events, if we
-            # divide with the summed learning rate we will get a distance
-            # weighted update
-            # shape: [num_neurons, dimensions]
-            masked_learning_rate = tf.multiply(
-                tf.expand_dims(neighbourhood_func, axis=-1),
-                tf.expand_dims(mask_tensor, axis=1),
-            )
-            numerator = tf.reduce_sum(
-                tf.multiply(
-                    masked_learning_rate,
-                    tf.expand_dims(input_tensor, axis=1)
-                ), axis=0)
-
-            # sum neighborhood function, eg the learn rate of each neuron
-            # we divide the batch summed new weights through the neighborhood
-            # function sum
-            # shape: [batch_size, neurons]
-            denominator = tf.reduce_sum(masked_learning_rate, axis=0) + float(1e-12)
+            if self._neighbourhood == "truncated":
+                numerator, denominator = self._stencil_update(
+                    input_tensor, mask_tensor, bmu_indices, radius)
+            else:
+                # weight input with learning rate and sum across events, if we
+                # divide with the summed learning rate we will get a distance
+                # weighted update
+                # shape: [num_neurons, dimensions]
+                masked_learning_rate = tf.multiply(
+                    tf.expand_dims(neighbourhood_func, axis=-1),
+                    tf.expand_dims(mask_tensor, axis=1),
+                )
+                numerator = tf.reduce_sum(
+                    tf.multiply(
+                        masked_learning_rate,
+                        tf.expand_dims(input_tensor, axis=1)
+                    ), axis=0)
+
+                # sum neighborhood function, eg the learn rate of each neuron
+                # we divide the batch summed new weights through the neighborhood
+                # function sum
+                # shape: [batch_size, neurons]
+                denominator = tf.reduce_sum(masked_learning_rate, axis=0) + float(1e-12)
 
         summaries = []
         if self.tensorboard:
@@ -584,26 +855,122 @@ class TFSom:
                 summaries.append(tf.summary.image("mapping_img", event_image))
 
         return (
-            numerator, denominator, epoch,
+            numerator, denominator, epoch, schedule,
             weights, mapped_events_per_node, summaries
         )
 
-    def run_till_tensor(self, tensors, data: np.array, mask: np.array, epoch: int):
-        assert data.shape[0] <= self._buffer_size, (
-            f"Data size {data.shape[0]} > Buffer size {self._buffer_size}. "
-            "Samples will be lost on reshuffling. "
-            "Increase buffer size to number of samples.")
+    def _create_distance_table(self):
+        """Create local variable holding distances between all pairs of nodes.
 
+        The table is fed on initialization, so that it is neither stored in
+        the graph definition nor in checkpoints.
+        """
+        with tf.name_scope("Node_Distances"):
+            nodes = self._m * self._n
+            table_input = tf.placeholder(tf.float32, shape=(nodes, nodes), name="table")
+            self._distance_table = tf.Variable(
+                table_input, trainable=False,
+                collections=[tf.GraphKeys.LOCAL_VARIABLES], name="node_distance_table")
+        self._local_variables.append(self._distance_table)
+        self._local_feed[table_input] = topology.node_distance_table(
+            self._m, self._n, self._map_type, self._node_distance)
+        return self._distance_table
+
+    def _stencil_update(self, input_tensor, mask_tensor, bmu_indices, radius):
+        """Calculate update with a truncated neighbourhood.
+
+        The neighbourhood only depends on the best matching node, so events
+        are summed per node first. Sums are then spread to neighbouring nodes
+        with a stencil, so the cost scales with the stencil size instead of
+        the number of nodes for every event.
+        """
+        nodes = self._m * self._n
+        node_data = tf.unsorted_segment_sum(
+            tf.multiply(input_tensor, mask_tensor), bmu_indices, nodes)
+        node_mask = tf.unsorted_segment_sum(mask_tensor, bmu_indices, nodes)
+        sigma = tf.multiply(radius, self._std_coeff)
+
+        if self._map_type in ("hex", "hex_toroid"):
+            # no regular stencil on hexagonal grids, use the full distance table
+            kernel = truncated_gaussian(self._distance_table, sigma, self._truncate, self._node_distance)
+            numerator = tf.matmul(kernel, node_data)
+            denominator = tf.matmul(kernel, node_mask) + float(1e-12)
+            return numerator, denominator
+
+        if self._map_type == "toroid":
+            # larger offsets would count wrapped nodes twice
+            max_offset = (min(self._m, self._n) - 1) // 2
+        else:
+            max_offset = max(self._m, self._n) - 1
+
+        kernel = neighbourhood_stencil(sigma, self._truncate, self._node_distance, max_offset)
+        map_size = (self._m, self._n)
+        numerator = apply_stencil(node_data, kernel, map_size, self._map_type)
+        denominator = apply_stencil(node_mask, kernel, map_size, self._map_type) + float(1e-12)
+        return numerator, denominator
+
+    def _epoch_feed(self, epoch: int) -> dict:
+        """Create feed dict for the given epoch and the current cooling schedule."""
+        return {
+            self._epoch: epoch,
+            self._schedule["initial_radius"]: self._initial_radius,
+            self._schedule["end_radius"]: self._end_radius,
+            self._schedule["max_epochs"]: self._max_epochs,
+        }
+
+    def reconfigure(
+            self,
+            max_epochs=None, batch_size=None, buffer_size=None,
+            initial_radius=None, end_radius=None,
+            convergence=None, convergence_threshold=None,
+            bmu_search=None) -> "TFSom":
+        """Change training hyperparameters of an initialized model in place.
+
+        Only parameters that are fed into the graph at runtime can be changed,
+        all other parameters require a new model. Weights are kept. Pass
+        convergence=False to disable early termination and bmu_search=False
+        to search nodes in the graph again.
+        """
+        if max_epochs is not None:
+            self._max_epochs = abs(int(max_epochs))
+        if batch_size is not None:
+            self._batch_size = abs(int(batch_size))
+        if buffer_size is not None:
+            self._buffer_size = buffer_size
+        if initial_radius is not None:
+            self._initial_radius = float(initial_radius)
+        if end_radius is not None:
+            self._end_radius = float(end_radius)
+        if convergence is not None:
+            if convergence and convergence not in CONVERGENCE_CRITERIA:
+                raise ValueError(f"Unknown convergence criterion: {convergence}")
+            self._convergence = convergence or None
+        if convergence_threshold is not None:
+            self._convergence_threshold = float(convergence_threshold)
+        if bmu_search is not None:
+            self._bmu_search = nearest.create_search(bmu_search or None)
+        return self
+
+    def _converged(self, metrics: dict, previous: dict) -> bool:
+        """Check whether the convergence criterion has been reached in the epoch."""
+        if self._convergence == "quantization_error":
+            if previous is None or previous["quantization_error"] <= 0:
+                return False
+            improvement = (
+                previous["quantization_error"] - metrics["quantization_error"]
+            ) / previous["quantization_error"]
+            return improvement < self._convergence_threshold
+        return metrics[self._convergence] < self._convergence_threshold
+
+    def run_till_tensor(self, tensors, data: np.array, mask: np.array, epoch: int):
         self._sess.run(
             self._epoch_start_init,
-            feed_dict={
-                self._epoch: epoch
-            }
+            feed_dict=self._epoch_feed(epoch)
         )
         result = self._sess.run(
             tensors,
             feed_dict={
-                self._epoch: epoch,
+                **self._epoch_feed(epoch),
                 self._data_placeholder: data,
                 self._mask_placeholder: mask,
             }
@@ -612,6 +979,9 @@ class TFSom:
 
     def calculate_nearest_nodes(self, data: np.array, mask: np.array):
         """Calculate the nearest nodes."""
+        if self._bmu_search:
+            mapped, _ = self._bmu_search(self.output_weights, data, mask)
+            return mapped
         mapped, = self.run_till_op("BMU_Indices/map_to_node_index", data, mask, 0)
         return mapped
 
@@ -632,13 +1002,7 @@ class TFSom:
             data: Numpy array.
             set_weights: Whether trained weights will be kept after training completes.
         """
-        data = data.copy()
-        mask = mask.copy()
         data_length = data.shape[0]
-        assert data_length <= self._buffer_size, (
-            f"Data size {data.shape[0]} > Buffer size {self._buffer_size}. "
-            "Samples will be lost on reshuffling. "
-            "Increase buffer size to number of samples.")
 
         if self.tensorboard:
             # Initialize the summary writer after the session has been initialized
@@ -650,10 +1014,20 @@ class TFSom:
         # reset weights to given values after running
         self._sess.run(self._reset_weights_op)
 
-        indexes = np.arange(0, data_length)
+        # copy the sample into the graph once, epochs only reorder indexes
+        self._sess.run(
+            self._staging["stage_op"],
+            feed_dict={
+                self._staging["data"]: data,
+                self._staging["mask"]: mask,
+            }
+        )
 
         global_step = 0
-        for epoch in range(self._max_epochs):
+        epochs_run = 0
+        previous_metrics = None
+        epoch = 0
+        while epoch < self._max_epochs:
             LOGGER.info("Epoch: %d/%d", epoch + 1, self._max_epochs)
 
             # if the tensorboard flag has been provided (for outputting the summaries)
@@ -663,43 +1037,58 @@ class TFSom:
 
             self._sess.run(
                 self._epoch_start_init,
-                feed_dict={
-                    self._epoch: epoch
-                }
+                feed_dict=self._epoch_feed(epoch)
             )
-            np.random.shuffle(indexes)
-            data = data[indexes]
-            mask = mask[indexes]
+            order = self._sess.run(self._staging["shuffle_op"])
+
+            # weights only change at the end of an epoch, so nodes for all
+            # events can be searched at once
+            if self._bmu_search:
+                bmu_indices, min_distances = self._bmu_search(self.output_weights, data, mask)
+
             for start in range(0, data_length, self._batch_size):
                 stop = start + self._batch_size
+                batch_feed = {
+                    **self._epoch_feed(epoch),
+                    self._staging["batch_start"]: start,
+                    self._staging["batch_stop"]: stop,
+                }
+                if self._bmu_search:
+                    batch_feed[self._bmu_indices] = bmu_indices[order[start:stop]]
+                    batch_feed[self._min_distance] = min_distances[order[start:stop]]
                 if self.tensorboard:
                     summary, _, = self._sess.run(
                         [merged_summaries, self._batch_op],
                         options=run_options, run_metadata=run_metadata,
-                        feed_dict={
-                            self._epoch: epoch,
-                            self._data_placeholder: data[start:stop],
-                            self._mask_placeholder: mask[start:stop],
-                        }
+                        feed_dict=batch_feed,
                     )
                     self._writer.add_run_metadata(run_metadata, f"step_{global_step}")
                     self._writer.add_summary(summary, global_step)
                 else:
-                    self._sess.run(
-                        self._batch_op,
-                        feed_dict={
-                            self._epoch: epoch,
-                            self._data_placeholder: data[start:stop],
-                            self._mask_placeholder: mask[start:stop],
-                        }
-                    )
+                    self._sess.run(self._batch_op, feed_dict=batch_feed)
                 LOGGER.info("Global step: %d", global_step)
                 global_step += 1
 
             # Calculate final weights after all batches have been processed
-            self._sess.run(
-                self._training_op, feed_dict={self._epoch: epoch}
+            _, metrics = self._sess.run(
+                [self._training_op, self._convergence_metrics],
+                feed_dict=self._epoch_feed(epoch)
             )
+            epochs_run += 1
+
+            # on convergence compress the remaining radius schedule into the
+            # final epoch instead of stopping at an intermediate radius
+            last_epoch = self._max_epochs - 1
+            if self._convergence and epoch < last_epoch and self._converged(metrics, previous_metrics):
+                LOGGER.info(
+                    "Converged after epoch %d: %s %f, continuing with final epoch",
+                    epoch + 1, self._convergence, metrics[self._convergence])
+                epoch = last_epoch
+            else:
+                epoch += 1
+            previous_metrics = metrics
+
+        self.epochs_run = epochs_run
 
         # set ref_weights to our current weights, these will be used to reset
         # weights the next time run_training is called.
@@ -707,6 +1096,12 @@ class TFSom:
             self._sess.run(self._assign_trained_op)
         return self
 
+    def set_weights(self, weights: np.array) -> "TFSom":
+        """Replace current and reference weights of an initialized model."""
+        weights = np.reshape(weights, (self._m * self._n, self._dim))
+        self._sess.run(self._set_weights_op, feed_dict={self._weights_input: weights})
+        return self
+
     def train(self, data, mask, label="learn") -> "TFSom":
         """Train the network on the data provided by the input tensor.
         Args:
@@ -724,6 +1119,11 @@ class TFSom:
         """Save the model to the given path. Does not work with buffered readers!"""
         self._saver.save(self._sess, str(path))
 
+    def close(self):
+        """Release the tensorflow session of the model."""
+        self._sess.close()
+        self._initialized = False
+
     def load(self, path: URLPath):
         """Load model from given path."""
         self._saver.restore(self._sess, str(path))
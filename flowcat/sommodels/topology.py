@@ -0,0 +1,128 @@
+"""
+Operations on the node grid of SOM maps. Only depends on numpy.
+"""
+import numpy as np
+
+
+def _interpolation_indexes(source: int, target: int, wrap: bool):
+    """Get neighbouring source indexes and weights for linear interpolation.
+
+    Node centers are aligned, so that node i of the target map is at
+    position (i + 0.5) * source / target - 0.5 in the source map.
+    """
+    positions = (np.arange(target) + 0.5) * source / target - 0.5
+    lower = np.floor(positions).astype(int)
+    fraction = positions - lower
+    upper = lower + 1
+    if wrap:
+        lower %= source
+        upper %= source
+    else:
+        lower = np.clip(lower, 0, source - 1)
+        upper = np.clip(upper, 0, source - 1)
+    return lower, upper, fraction
+
+
+def upsample_weights(weights: np.array, dims: tuple, map_type: str = "planar") -> np.array:
+    """Bilinearly interpolate SOM weights to a larger map.
+
+    Args:
+        weights: Array of shape (m, n, channels).
+        dims: Tuple of new rows and columns.
+        map_type: Either planar or toroid. Toroid maps wrap around at the edges.
+    Returns:
+        Array of shape (*dims, channels).
+    """
+    wrap = map_type == "toroid"
+    m, n, _ = weights.shape
+    new_m, new_n = dims
+
+    lower, upper, fraction = _interpolation_indexes(m, new_m, wrap)
+    fraction = fraction[:, None, None]
+    rows = weights[lower] * (1 - fraction) + weights[upper] * fraction
+
+    lower, upper, fraction = _interpolation_indexes(n, new_n, wrap)
+    fraction = fraction[None, :, None]
+    return rows[:, lower] * (1 - fraction) + rows[:, upper] * fraction
+
+
+MAP_TYPES = ("planar", "toroid", "hex", "hex_toroid")
+
+# largest map for which node distances are precomputed, the table needs
+# 4 * nodes ** 2 bytes
+MAX_TABLE_NODES = 4096
+
+METRICS = {
+    # squared, as in the rectangular tensorflow implementation
+    "euclidean": lambda diff: np.sum(np.square(diff), axis=-1),
+    "manhattan": lambda diff: np.sum(np.abs(diff), axis=-1),
+    "chebyshev": lambda diff: np.max(np.abs(diff), axis=-1),
+    "hex": lambda diff: (np.abs(diff[..., 0]) + np.abs(diff[..., 1]) + np.abs(diff[..., 0] + diff[..., 1])) / 2,
+}
+
+
+def grid_embedding(m: int, n: int, map_type: str, distance_type: str):
+    """Get node coordinates and wrap-around shifts of a map.
+
+    Distances between nodes are the minimum metric over all shifted copies
+    of the target coordinates.
+
+    Hexagonal maps have odd rows shifted right by half a node. Euclidean
+    distances use cartesian coordinates of node centers, manhattan and
+    chebyshev distances both count steps between neighbouring hexagons.
+
+    Returns:
+        Tuple of coordinates [m * n, 2], shifts [k, 2] and metric name.
+    """
+    rows, cols = np.meshgrid(np.arange(m), np.arange(n), indexing="ij")
+    rows = rows.ravel()
+    cols = cols.ravel()
+    wrap = map_type in ("toroid", "hex_toroid")
+    shift_rows, shift_cols = np.meshgrid([-1, 0, 1], [-1, 0, 1], indexing="ij") if wrap else ([0], [0])
+    shift_rows = np.ravel(shift_rows)
+    shift_cols = np.ravel(shift_cols)
+
+    if map_type in ("planar", "toroid"):
+        coords = np.stack([rows, cols], axis=1).astype(float)
+        shifts = np.stack([shift_rows * m, shift_cols * n], axis=1).astype(float)
+        metric = distance_type
+    elif map_type in ("hex", "hex_toroid"):
+        if map_type == "hex_toroid" and m % 2:
+            raise ValueError("Hexagonal toroid maps need an even number of rows.")
+        if distance_type == "euclidean":
+            height = np.sqrt(3) / 2
+            coords = np.stack([rows * height, cols + 0.5 * (rows % 2)], axis=1)
+            shifts = np.stack([shift_rows * m * height, shift_cols * n], axis=1)
+            metric = "euclidean"
+        elif distance_type in ("manhattan", "chebyshev"):
+            # axial coordinates of offset rows
+            coords = np.stack([rows, cols - (rows - (rows % 2)) // 2], axis=1).astype(float)
+            shifts = np.stack([shift_rows * m, shift_cols * n - shift_rows * m // 2], axis=1).astype(float)
+            metric = "hex"
+        else:
+            raise TypeError(f"Unknown distance type: {distance_type}")
+    else:
+        raise TypeError(f"Unknown map type: {map_type}")
+
+    if metric not in METRICS:
+        raise TypeError(f"Unknown distance type: {distance_type}")
+    return coords, shifts, metric
+
+
+def node_distance_table(
+        m: int, n: int, map_type: str, distance_type: str, chunk_size: int = 512) -> np.array:
+    """Precompute distances between all pairs of nodes.
+
+    Returns:
+        Float32 array of shape [m * n, m * n].
+    """
+    coords, shifts, metric = grid_embedding(m, n, map_type, distance_type)
+    metric = METRICS[metric]
+
+    table = np.zeros((m * n, m * n), dtype=np.float32)
+    for start in range(0, m * n, chunk_size):
+        sources = coords[start:start + chunk_size, None, :]
+        table[start:start + chunk_size] = np.min([
+            metric(coords[None, :, :] + shift - sources) for shift in shifts
+        ], axis=0)
+    return table
@@ -184,3 +184,34 @@ class TestCaseCollection(unittest.TestCase):
             for args, expected in filters:
                 filtered = dataset.filter(**args)
                 self.assertEqual(filtered.labels, expected)
+
+    def test_shard(self):
+        dataset = create_case_dataset([{"id": str(i)} for i in range(50)])
+        shards = [dataset.shard(i, 4) for i in range(4)]
+        labels = [label for shard in shards for label in shard.labels]
+        self.assertEqual(sorted(labels), sorted(dataset.labels))
+        self.assertTrue(all(len(shard) > 0 for shard in shards))
+
+        # assignment of a case does not depend on the other cases
+        partial = create_case_dataset([{"id": str(i)} for i in range(0, 50, 3)])
+        self.assertEqual(
+            partial.shard(1, 4).labels,
+            [label for label in shards[1].labels if int(label) % 3 == 0])
+
+        with self.assertRaises(ValueError):
+            dataset.shard(4, 4)
+
+    def test_shard_balance(self):
+        counts = [1000, 900, 100, 100, 100, 100, 50, 50]
+        dataset = case_dataset.CaseCollection([
+            case.Case(id=str(i), samples=[sample.FCSSample(id=f"{i}_t1", case_id=str(i), tube="1", count=count)])
+            for i, count in enumerate(counts)
+        ])
+        shards = [dataset.shard(i, 2, balance=True) for i in range(2)]
+        events = [sum(c.samples[0].count for c in shard) for shard in shards]
+        self.assertEqual(sum(len(shard) for shard in shards), len(dataset))
+        self.assertLessEqual(abs(events[0] - events[1]), 100)
+
+        # cases without counts are distributed by number
+        dataset = create_case_dataset([{"id": str(i)} for i in range(9)])
+        self.assertEqual([len(dataset.shard(i, 3, balance=True)) for i in range(3)], [3, 3, 3])
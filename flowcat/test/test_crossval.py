@@ -0,0 +1,68 @@
+import unittest
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal
+
+from flowcat import utils
+from flowcat.classifier import crossval
+from flowcat.classifier.padding import pad_batch
+from flowcat.types import som_codec
+
+
+def fold_result(name, groups, predicted):
+    return {
+        "name": name,
+        "train_size": 10,
+        "test_size": len(groups),
+        "metrics": {"balanced": float(np.mean(np.array(groups) == np.array(predicted)))},
+        "predictions": pd.DataFrame({"group": groups, "prediction": predicted}),
+    }
+
+
+class TestCrossval(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = utils.URLPath(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_shared_arrays(self):
+        data = np.random.rand(3, 4, 4, 2).astype(np.float32)
+        cases = []
+        for i, array in enumerate(data):
+            path = self.path / "soms" / f"c{i}_t1.npy"
+            path.parent.mkdir()
+            som_codec.save_array(array, path, "float32")
+            cases.append(SimpleNamespace(soms={"1": path}, data={}))
+
+        paths = crossval.save_shared_arrays(cases, ["1"], self.path / "arrays")
+        arrays = crossval.load_shared_arrays(paths)
+        assert_array_equal(arrays["1"], data)
+        self.assertIsInstance(arrays["1"], np.memmap)
+
+    def test_stored_padding(self):
+        """SOMs of a dataset transformed with padding should not be padded again."""
+        data = np.random.rand(3, 4, 4, 2).astype(np.float32)
+        cases = [
+            SimpleNamespace(data={"1": array}, get_tube=lambda tube, array=array: array)
+            for array in pad_batch(data, 2)
+        ]
+        for padding in (0, 1, 2, 3):
+            paths = crossval.save_shared_arrays(
+                cases, ["1"], self.path / f"arrays_{padding}", padding=padding, stored_padding={"1": 2})
+            assert_array_equal(crossval.load_shared_arrays(paths)["1"], pad_batch(data, padding))
+
+    def test_aggregate(self):
+        results = [
+            fold_result("fold_0", ["a", "b"], ["a", "b"]),
+            fold_result("fold_1", ["a", "b"], ["a", "a"]),
+        ]
+        report = crossval.aggregate_results(results, ["a", "b"], self.path / "report")
+        self.assertAlmostEqual(report["mean"]["balanced"], 0.75)
+        self.assertEqual(report["confusion"], [[2, 0], [1, 1]])
+        self.assertAlmostEqual(report["pooled"]["balanced"], 0.75)
+        self.assertTrue((self.path / "report" / "report.json").exists())
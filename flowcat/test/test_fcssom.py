@@ -39,3 +39,22 @@ class FCSSomTestCase(unittest.TestCase):
         model.train([traindata])
         result = model.transform(testdata)
         # assert_array_almost_equal(result.data, expected)
+
+    def test_multiresolution_stage_args(self):
+        """Coarse stages should shrink their radius from half the stage map size."""
+        model = fcssom.FCSSom(
+            (32, 32, 2),
+            seed=SEED,
+            markers=MARKERS,
+            multiresolution=[{"dims": [8, 8]}, {"dims": [16, 16], "initial_radius": 4}],
+            initial_radius=4, end_radius=2)
+
+        dims, args = model._stage_args(model.multiresolution[0])
+        self.assertEqual(dims, (8, 8))
+        self.assertEqual((args["initial_radius"], args["end_radius"]), (4.0, 2.0))
+
+        dims, args = model._stage_args({"dims": [2, 2]})
+        self.assertEqual((args["initial_radius"], args["end_radius"]), (1.0, 1.0))
+
+        dims, args = model._stage_args(model.multiresolution[1])
+        self.assertEqual((args["initial_radius"], args["end_radius"]), (4.0, 2.0))
@@ -0,0 +1,69 @@
+import unittest
+import tempfile
+from datetime import date
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from flowcat import io_functions, utils, flowcat_api
+from flowcat.dataset import case, case_dataset, sample
+from flowcat.sommodels.casesom import CaseSom
+from flowcat.types import fcsdata as fcs
+
+SEED = 42
+
+MARKERS = ["AA", "BB"]
+
+
+def create_dataset(ids):
+    cases = []
+    for i in ids:
+        data = fcs.FCSData((np.random.rand(200, 2), np.ones((200, 2))), channels=MARKERS)
+        cases.append(case.Case(id=i, date=date(2020, 1, 1), samples=[sample.FCSSample(
+            id=f"{i}_t1", case_id=i, tube="1", date=date(2020, 1, 1), markers=MARKERS, data=data)]))
+    return case_dataset.CaseCollection(cases, selected_markers={"1": MARKERS})
+
+
+class TransformDatasetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = utils.URLPath(self.tmpdir.name)
+        self.dataset = create_dataset(["a", "b", "c"])
+        self.reference = CaseSom(
+            tubes={"1": MARKERS},
+            modelargs={"dims": (4, 4, -1), "max_epochs": 1, "seed": SEED},
+            parallel=False)
+        self.reference.train(self.dataset)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_delta_storage(self):
+        output = self.path / "som"
+        flowcat_api.transform_dataset_to_som(self.reference, self.dataset, output, storage="delta_uint8")
+
+        config = io_functions.load_json(output / "config.json")
+        self.assertEqual(config["1"]["storage"], "delta_uint8")
+        self.assertTrue((output / config["1"]["reference"]["path"]).exists())
+
+        loaded = io_functions.load_case_collection(output)
+        self.assertEqual(loaded.labels, ["a", "b", "c"])
+        expected = self.reference.models["1"].transform(self.dataset.cases[0].get_tube("1", kind="fcs"))
+        som = loaded.cases[0].get_tube("1", kind="som").get_data()
+        self.assertEqual(som.data.shape, (4, 4, 2))
+        assert_allclose(som.data, expected.data.data, atol=0.01)
+
+    def test_reference_version(self):
+        output = self.path / "som"
+        flowcat_api.transform_dataset_to_som(self.reference, self.dataset, output)
+        config = io_functions.load_json(output / "config.json")
+        self.assertIn("version", config["1"]["reference"])
+
+        retrained = CaseSom(
+            tubes={"1": MARKERS},
+            modelargs={"dims": (4, 4, -1), "max_epochs": 1, "seed": SEED + 1},
+            parallel=False).train(self.dataset)
+        self.assertIsNone(
+            flowcat_api.load_updatable_som_dataset(output, flowcat_api.create_som_config(retrained)))
+        self.assertIsNotNone(
+            flowcat_api.load_updatable_som_dataset(output, flowcat_api.create_som_config(self.reference)))
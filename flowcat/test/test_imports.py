@@ -0,0 +1,34 @@
+"""
+Check that metadata apis can be used without loading heavy ML dependencies.
+"""
+import sys
+import subprocess
+import unittest
+
+
+HEAVY_MODULES = ("tensorflow", "keras", "vis")
+
+METADATA_IMPORTS = """
+import sys
+import flowcat
+from flowcat import io_functions, constants
+from flowcat.dataset import case_dataset
+import flowcat.cmdline
+from flowcat import flowcat
+print(",".join(m for m in {modules!r} if m in sys.modules))
+"""
+
+
+class TestImports(unittest.TestCase):
+    def test_metadata_without_tensorflow(self):
+        """Run imports in a new interpreter, since tests might have already loaded tensorflow."""
+        result = subprocess.run(
+            [sys.executable, "-c", METADATA_IMPORTS.format(modules=HEAVY_MODULES)],
+            stdout=subprocess.PIPE, check=True)
+        loaded = result.stdout.decode().strip()
+        self.assertEqual(loaded, "", f"Heavy modules loaded on import: {loaded}")
+
+    def test_api_without_module_getattr(self):
+        """The api must not depend on module __getattr__, which needs python 3.7."""
+        import flowcat
+        self.assertIn("flowcat", vars(flowcat))
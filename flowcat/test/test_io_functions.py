@@ -0,0 +1,195 @@
+import unittest
+from unittest import mock
+import tempfile
+from datetime import date
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from flowcat import io_functions, utils
+from flowcat.dataset import case, case_dataset, sample
+from flowcat.types.som import SOM
+
+
+class TestBundle(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = utils.URLPath(self.tmpdir.name) / "model.fcb"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_roundtrip(self):
+        arrays = {
+            "weights": np.random.rand(4, 4, 3).astype(np.float32),
+            "counts": np.arange(5),
+            "blob": np.frombuffer(b"scaler", dtype=np.uint8),
+        }
+        meta = {"tubes": ["1", "2"], "name": "test"}
+        io_functions.save_bundle(arrays, meta, self.path)
+
+        for mmap in (True, False):
+            loaded, loaded_meta = io_functions.load_bundle(self.path, mmap=mmap)
+            self.assertEqual(loaded_meta, meta)
+            self.assertEqual(set(loaded), set(arrays))
+            for name, array in arrays.items():
+                self.assertEqual(loaded[name].dtype, array.dtype)
+                assert_array_equal(loaded[name], array)
+
+    def test_integrity(self):
+        io_functions.save_bundle({"weights": np.ones((10, 10))}, {}, self.path)
+        data = bytearray(self.path.read_bytes())
+        data[-1] ^= 0xFF
+        self.path.write_bytes(bytes(data))
+
+        with self.assertRaises(ValueError):
+            io_functions.load_bundle(self.path)
+        loaded, _ = io_functions.load_bundle(self.path, verify=False)
+        self.assertEqual(loaded["weights"].shape, (10, 10))
+
+
+class TestFCSSomConfig(unittest.TestCase):
+    def test_merge_trained_multiresolution(self):
+        config = {
+            "dims": [32, 32, 2], "name": "t1", "markers": ["a", "b"], "trained": True,
+            "modelargs": {"init": "random", "kwargs": {"max_epochs": 2}},
+            "marker_name_only": False, "subsample": None,
+            "multiresolution": [{"dims": [8, 8]}],
+        }
+        merged = io_functions.merge_fcssom_config(config, max_epochs=4, multiresolution=[{"dims": [16, 16]}])
+        self.assertNotIn("multiresolution", merged)
+        self.assertEqual(merged["max_epochs"], 4)
+
+
+class TestCaseCollection(unittest.TestCase):
+    def test_save_replaces(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = utils.URLPath(tmpdir) / "meta.json.gz"
+            for ids in (["a", "b"], ["b"]):
+                cases = case_dataset.CaseCollection([
+                    case.Case(id=i, date=date(2020, 1, 1), samples=[sample.SOMSample(
+                        id=f"{i}_t1", case_id=i, tube="1", date=date(2020, 1, 1),
+                        path=utils.URLPath(f"{i}_t1.npy"), dims=(2, 2, 3), fingerprint="10-100")])
+                    for i in ids
+                ])
+                io_functions.save_case_collection(cases, path)
+
+            loaded = io_functions.load_case_collection(utils.URLPath(tmpdir), path)
+            self.assertEqual([c.id for c in loaded], ["b"])
+            self.assertEqual(loaded.cases[0].samples[0].fingerprint, "10-100")
+            self.assertEqual([p.name for p in utils.URLPath(tmpdir).iterdir()], ["meta.json.gz"])
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = utils.URLPath(self.tmpdir.name)
+        self.source = self.path / "source"
+        cases = []
+        for i, content in enumerate((b"first", b"second sample")):
+            (self.source / f"c{i}" / "t1.fcs").write_bytes(content)
+            cases.append(case.Case(id=f"c{i}", date=date(2020, 1, 1), samples=[sample.FCSSample(
+                id=f"c{i}_t1", case_id=f"c{i}", tube="1", date=date(2020, 1, 1),
+                path=utils.URLPath(f"c{i}/t1.fcs"), dataset_path=self.source)]))
+        self.dataset = case_dataset.CaseCollection(cases, data_path=self.source)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_export(self):
+        output = self.path / "output"
+        exported = io_functions.save_case_collection_with_data(self.dataset, output)
+
+        self.assertEqual(self.dataset.cases[0].samples[0].dataset_path, self.source)
+        self.assertEqual(exported.cases[0].samples[0].complete_path, output / "data" / "c0" / "t1.fcs")
+        self.assertEqual((output / "data" / "c1" / "t1.fcs").read_bytes(), b"second sample")
+
+        checksums = io_functions.load_json(output / "checksums.json.gz")
+        self.assertEqual(checksums["c0/t1.fcs"]["size"], 5)
+        self.assertEqual(checksums["c0/t1.fcs"]["mtime"], (self.source / "c0" / "t1.fcs").stat().st_mtime_ns)
+
+        loaded = io_functions.load_case_collection(output)
+        self.assertEqual([c.id for c in loaded], ["c0", "c1"])
+
+    def test_copy_checksums(self):
+        output = self.path / "output"
+        with mock.patch.object(utils.files, "_reflink", side_effect=OSError):
+            io_functions.save_case_collection_with_data(self.dataset, output, link=False)
+
+        checksums = io_functions.load_json(output / "checksums.json.gz")
+        self.assertEqual(checksums["c1/t1.fcs"]["sha256"], utils.file_sha256(self.source / "c1" / "t1.fcs"))
+        self.assertEqual((output / "data" / "c1" / "t1.fcs").read_bytes(), b"second sample")
+
+    def test_known_unread(self):
+        """Unchanged sources recorded in the checksums should not be read again."""
+        output = self.path / "output"
+        io_functions.save_case_collection_with_data(self.dataset, output, link=False)
+        with mock.patch.object(utils.files, "file_sha256", side_effect=AssertionError("file hashed")):
+            with mock.patch.object(utils.files, "clone_file", side_effect=AssertionError("file exported")):
+                io_functions.save_case_collection_with_data(self.dataset, output, link=False)
+
+    def test_skip_existing(self):
+        output = self.path / "output"
+        io_functions.save_case_collection_with_data(self.dataset, output, link=False)
+        (self.source / "c1" / "t1.fcs").write_bytes(b"changed")
+
+        files = [
+            (str(s.complete_path), str(output / "data" / s.path))
+            for c in self.dataset for s in c.samples
+        ]
+        _, methods = utils.export_files(files, link=False)
+        self.assertEqual(methods["skip"], 1)
+        self.assertEqual((output / "data" / "c1" / "t1.fcs").read_bytes(), b"changed")
+
+
+class TestMergeSOMDatasets(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = utils.URLPath(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def create_shard(self, name, ids, config=None):
+        path = self.path / name
+        (path / "data").mkdir()
+        samples = {}
+        for i in ids:
+            sompath = io_functions.save_som(
+                SOM(np.full((2, 2, 3), float(len(i)), dtype=np.float32), ["a", "b", "c"]),
+                path / "data" / f"{i}_t1", save_config=False)
+            samples[i] = sample.SOMSample(
+                id=f"{i}_t1", case_id=i, tube="1", date=date(2020, 1, 1),
+                path=sompath.relative_to(path / "data"), dims=(2, 2, 3))
+        cases = case_dataset.CaseCollection([
+            case.Case(id=i, date=date(2020, 1, 1), samples=[samples[i]]) for i in ids
+        ])
+        io_functions.save_case_collection(cases, path / "meta.json.gz")
+        io_functions.save_json(config or {"1": {"dims": [2, 2, 3], "channels": ["a", "b", "c"]}}, path / "config.json")
+        return path
+
+    def test_merge(self):
+        paths = [self.create_shard("shard_0_2", ["a", "bb"]), self.create_shard("shard_1_2", ["ccc"])]
+        output = self.path / "merged"
+        merged = io_functions.merge_som_datasets(paths, output)
+        self.assertEqual(merged.labels, ["a", "bb", "ccc"])
+
+        loaded = io_functions.load_case_collection(output)
+        self.assertEqual(loaded.labels, ["a", "bb", "ccc"])
+        som = loaded.cases[2].get_tube("1", kind="som").get_data()
+        assert_array_equal(som.data, np.full((2, 2, 3), 3.0))
+        self.assertEqual(io_functions.load_json(output / "config.json")["1"]["dims"], [2, 2, 3])
+
+    def test_conflicts(self):
+        paths = [self.create_shard("shard_0_2", ["a"]), self.create_shard("shard_1_2", ["a"])]
+        with self.assertRaises(RuntimeError):
+            io_functions.merge_som_datasets(paths, self.path / "merged")
+
+        other = self.create_shard("other", ["b"], config={"1": {"dims": [3, 3, 3], "channels": ["a", "b", "c"]}})
+        with self.assertRaises(ValueError):
+            io_functions.merge_som_datasets([paths[0], other], self.path / "merged")
+
+        config = {"1": {"dims": [2, 2, 3], "channels": ["a", "b", "c"], "reference": {"version": "1234"}}}
+        other = self.create_shard("other_reference", ["c"], config=config)
+        with self.assertRaises(ValueError):
+            io_functions.merge_som_datasets([paths[0], other], self.path / "merged")
@@ -0,0 +1,75 @@
+import os
+import unittest
+import tempfile
+from datetime import date
+
+from flowcat import utils
+from flowcat.dataset import case, case_dataset, sample, manifest
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = utils.URLPath(self.tmpdir.name)
+        cases = []
+        for i in range(3):
+            (self.path / f"c{i}.fcs").write_bytes(bytes([i]) * (1000 + i))
+            cases.append(case.Case(id=f"c{i}", date=date(2020, 1, 1), samples=[sample.FCSSample(
+                id=f"c{i}_t1", case_id=f"c{i}", tube="1", date=date(2020, 1, 1),
+                path=utils.URLPath(f"c{i}.fcs"), dataset_path=self.path)]))
+        self.dataset = case_dataset.CaseCollection(cases, data_path=self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_sampled_hash(self):
+        large = self.path / "large.fcs"
+        data = bytearray(os.urandom(5 << 20))
+        large.write_bytes(bytes(data))
+        digest = utils.sampled_hash(large)
+        data[-1] ^= 0xFF
+        large.write_bytes(bytes(data))
+        self.assertNotEqual(utils.sampled_hash(large), digest)
+        self.assertNotEqual(utils.sampled_hash(self.path / "c0.fcs"), utils.sampled_hash(self.path / "c1.fcs"))
+
+    def test_verify(self):
+        created = manifest.create_manifest(self.dataset, workers=2)
+        manifest_path = self.path / manifest.MANIFEST_NAME
+        manifest.save_manifest(created, manifest_path)
+        loaded = manifest.load_manifest(manifest_path)
+        self.assertEqual(set(loaded["files"]), {"c0.fcs", "c1.fcs", "c2.fcs"})
+
+        os.utime(str(self.path / "c0.fcs"), ns=(0, 1))
+        (self.path / "c1.fcs").write_bytes(b"corrupted")
+        (self.path / "c2.fcs").unlink()
+
+        status, updated = manifest.verify_manifest(self.dataset, loaded)
+        self.assertEqual(status, {
+            "c0.fcs": manifest.TOUCHED,
+            "c1.fcs": manifest.MODIFIED,
+            "c2.fcs": manifest.MISSING,
+        })
+        self.assertEqual(set(updated["files"]), {"c0.fcs", "c1.fcs"})
+        self.assertEqual(updated["files"]["c0.fcs"]["mtime"], 1)
+
+        status, _ = manifest.verify_manifest(self.dataset.filter(labels=["c0", "c1"]), updated)
+        self.assertEqual(set(status.values()), {manifest.UNCHANGED})
+
+    def test_new_missing(self):
+        """Samples missing from the manifest and from disk should be reported as missing."""
+        created = manifest.create_manifest(self.dataset.filter(labels=["c0"]))
+        (self.path / "c2.fcs").unlink()
+
+        status, updated = manifest.verify_manifest(self.dataset, created)
+        self.assertEqual(status, {
+            "c0.fcs": manifest.UNCHANGED,
+            "c1.fcs": manifest.NEW,
+            "c2.fcs": manifest.MISSING,
+        })
+        self.assertEqual(set(updated["files"]), {"c0.fcs", "c1.fcs"})
+
+    def test_create_missing(self):
+        """Missing files should be left out of a new manifest."""
+        (self.path / "c2.fcs").unlink()
+        created = manifest.create_manifest(self.dataset)
+        self.assertEqual(set(created["files"]), {"c0.fcs", "c1.fcs"})
@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal, assert_allclose
+
+from flowcat.sommodels import nearest
+
+
+def brute_force(weights, data, mask):
+    distances = np.sum(np.square(data[:, None, :] - weights[None, :, :]) * mask[:, None, :], axis=2)
+    indexes = np.argmin(distances, axis=1)
+    return indexes, np.sqrt(distances[np.arange(data.shape[0]), indexes])
+
+
+class NearestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.weights = rng.rand(64, 5)
+        self.data = rng.rand(500, 5)
+        self.mask = np.ones(self.data.shape)
+        self.mask[:50, 2] = 0
+
+    def test_exact(self):
+        indexes, distances = nearest.exact_nearest(self.weights, self.data, self.mask, chunk_size=64)
+        expected_indexes, expected_distances = brute_force(self.weights, self.data, self.mask)
+        assert_array_equal(indexes, expected_indexes)
+        assert_allclose(distances, expected_distances)
+
+    def test_kdtree(self):
+        search = nearest.create_search({"method": "kdtree", "seed": 0})
+        indexes, distances = search(self.weights, self.data, self.mask)
+        expected_indexes, expected_distances = brute_force(self.weights, self.data, self.mask)
+        assert_array_equal(indexes, expected_indexes)
+        assert_allclose(distances, expected_distances)
+        self.assertEqual(search.recall, 1.0)
+
+    def test_missing_columns(self):
+        """Events with masked channels should be searched in trees on the present channels."""
+        mask = np.ones(self.data.shape)
+        mask[:, 1] = 0
+        mask[:100, 3] = 0
+        mask[:10] = 0
+        expected_indexes, expected_distances = brute_force(self.weights, self.data, mask)
+        for max_trees in (0, 1, 4):
+            search = nearest.KDTreeSearch(max_trees=max_trees, recall_sample=0)
+            indexes, distances = search(self.weights, self.data, mask)
+            assert_array_equal(indexes, expected_indexes)
+            assert_allclose(distances, expected_distances)
+
+    def test_approximate(self):
+        search = nearest.create_search({"method": "kdtree", "eps": 2.0, "min_recall": 0.0, "seed": 0})
+        _, distances = search(self.weights, self.data, self.mask)
+        _, expected_distances = brute_force(self.weights, self.data, self.mask)
+        self.assertTrue(np.all(distances <= expected_distances * 3.0 + 1e-9))
+        self.assertTrue(0 <= search.recall <= 1)
+
+    def test_fallback(self):
+        search = nearest.KDTreeSearch(eps=10.0, min_recall=1.01, seed=0)
+        indexes, _ = search(self.weights, self.data, self.mask)
+        expected_indexes, _ = brute_force(self.weights, self.data, self.mask)
+        assert_array_equal(indexes, expected_indexes)
+
+    def test_create(self):
+        self.assertIsNone(nearest.create_search(None))
+        self.assertIsInstance(nearest.create_search("kdtree"), nearest.KDTreeSearch)
+        with self.assertRaises(ValueError):
+            nearest.create_search("unknown")
@@ -0,0 +1,167 @@
+import unittest
+import tempfile
+import importlib.util
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from flowcat import io_functions, utils
+from flowcat.classifier import numpy_model
+from flowcat.classifier.padding import pad_array
+from flowcat.dataset import case, sample
+from flowcat.types.classifier_config import SOMClassifierConfig
+from flowcat.types.som import SOM
+
+
+def naive_conv2d(data, kernel, bias, stride):
+    krows, kcols, _, filters = kernel.shape
+    batch, rows, cols, _ = data.shape
+    out_rows = (rows - krows) // stride + 1
+    out_cols = (cols - kcols) // stride + 1
+    result = np.zeros((batch, out_rows, out_cols, filters))
+    for b in range(batch):
+        for i in range(out_rows):
+            for j in range(out_cols):
+                window = data[b, i * stride:i * stride + krows, j * stride:j * stride + kcols]
+                for f in range(filters):
+                    result[b, i, j, f] = np.sum(window * kernel[..., f]) + bias[f]
+    return result
+
+
+def naive_forward(data, weights):
+    segments = []
+    for tube, tube_data in enumerate(data):
+        x = tube_data
+        for i, stride in enumerate((1, 1, 2)):
+            kernel, bias = weights[f"conv_{tube}_{i}"]
+            x = np.maximum(naive_conv2d(x, kernel, bias, stride), 0)
+        segments.append(x.max(axis=(1, 2)))
+    x = np.concatenate(segments, axis=-1)
+    for name in ("dense_0", "dense_1"):
+        kernel, bias = weights[name]
+        x = np.maximum(x @ kernel + bias, 0)
+    kernel, bias = weights["dense_2"]
+    x = x @ kernel + bias
+    x = np.exp(x - x.max(axis=-1, keepdims=True))
+    return x / x.sum(axis=-1, keepdims=True)
+
+
+def create_multi_input_meta(input_shapes, outputs):
+    """Create layer graph and random weights with the layout of create_model_multi_input."""
+    rng = np.random.RandomState(0)
+    layers = []
+    weights = {}
+    pooled = []
+    for tube, shape in enumerate(input_shapes):
+        previous = f"input_{tube}"
+        layers.append({"name": previous, "class": "InputLayer", "config": {}, "inbound": [], "num_weights": 0})
+        channels = shape[-1]
+        for i, (filters, kernel_size, stride) in enumerate(((32, 4, 1), (48, 3, 1), (64, 2, 2))):
+            name = f"conv_{tube}_{i}"
+            weights[name] = [
+                rng.normal(size=(kernel_size, kernel_size, channels, filters)).astype(np.float32) * 0.1,
+                rng.normal(size=filters).astype(np.float32) * 0.1,
+            ]
+            layers.append({
+                "name": name, "class": "Conv2D", "inbound": [previous], "num_weights": 2,
+                "config": {
+                    "strides": [stride, stride], "padding": "valid", "data_format": "channels_last",
+                    "dilation_rate": [1, 1], "activation": "relu"},
+            })
+            previous = name
+            channels = filters
+        layers.append({
+            "name": f"pool_{tube}", "class": "GlobalMaxPooling2D", "config": {"data_format": "channels_last"},
+            "inbound": [previous], "num_weights": 0})
+        pooled.append(f"pool_{tube}")
+
+    layers.append({
+        "name": "concat", "class": "Concatenate", "config": {"axis": -1},
+        "inbound": pooled, "num_weights": 0})
+    previous, units = "concat", 64 * len(input_shapes)
+    for i, (out_units, activation) in enumerate(((64, "relu"), (32, "relu"), (outputs, "softmax"))):
+        name = f"dense_{i}"
+        weights[name] = [
+            rng.normal(size=(units, out_units)).astype(np.float32) * 0.1,
+            rng.normal(size=out_units).astype(np.float32) * 0.1,
+        ]
+        layers.append({
+            "name": name, "class": "Dense", "config": {"activation": activation},
+            "inbound": [previous], "num_weights": 2})
+        previous, units = name, out_units
+
+    arrays = {
+        f"{numpy_model.BUNDLE_PREFIX}/{name}/{i}": weight
+        for name, layer_weights in weights.items() for i, weight in enumerate(layer_weights)
+    }
+    meta = {"layers": layers, "inputs": [f"input_{i}" for i in range(len(input_shapes))], "outputs": [previous]}
+    return arrays, meta, weights
+
+
+class NumpyModelTestCase(unittest.TestCase):
+    def test_conv2d(self):
+        data = np.random.rand(2, 7, 6, 3).astype(np.float32)
+        kernel = np.random.rand(3, 2, 3, 4).astype(np.float32)
+        bias = np.random.rand(4).astype(np.float32)
+        for stride in (1, 2):
+            assert_allclose(
+                numpy_model.conv2d(data, kernel, bias, strides=(stride, stride)),
+                naive_conv2d(data, kernel, bias, stride), rtol=1e-5)
+
+    def test_forward(self):
+        input_shapes = [(10, 10, 3), (10, 10, 2)]
+        arrays, meta, weights = create_multi_input_meta(input_shapes, 4)
+        data = [np.random.rand(5, *shape).astype(np.float32) for shape in input_shapes]
+
+        model = numpy_model.NumpyModel.from_bundle(arrays, meta)
+        result = model.predict(data)
+        self.assertEqual(result.shape, (5, 4))
+        assert_allclose(result, naive_forward(data, weights), rtol=1e-4, atol=1e-6)
+
+    def test_bundle(self):
+        arrays, meta, _ = create_multi_input_meta([(8, 8, 2)], 3)
+        data = [np.random.rand(2, 8, 8, 2).astype(np.float32)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = utils.URLPath(tmpdir) / "model.bundle"
+            io_functions.save_bundle(arrays, meta, path)
+            loaded = numpy_model.NumpyModel.from_bundle(*io_functions.load_bundle(path))
+            assert_allclose(
+                loaded.predict(data), numpy_model.NumpyModel.from_bundle(arrays, meta).predict(data))
+
+    def test_unsupported(self):
+        arrays, meta, _ = create_multi_input_meta([(8, 8, 2)], 3)
+        meta["layers"][1]["config"]["padding"] = "same"
+        with self.assertRaises(ValueError):
+            numpy_model.NumpyModel.from_bundle(arrays, meta)
+
+    def test_stored_padding(self):
+        """SOMs stored with padding should give the same inputs as unpadded SOMs."""
+        arrays, meta, _ = create_multi_input_meta([(8, 8, 2)], 3)
+        config = SOMClassifierConfig(
+            tubes={"1": {"dims": [6, 6, 2], "channels": ["a", "b"]}}, groups=["x", "y", "z"], pad_width=1)
+        classifier = numpy_model.NumpySOMClassifier(
+            config, numpy_model.NumpyModel.from_bundle(arrays, meta), ["x", "y", "z"])
+
+        data = np.random.rand(2, 6, 6, 2).astype(np.float32)
+        inputs = []
+        for padding in (0, 2):
+            cases = [
+                case.Case(id=str(i), samples=[sample.SOMSample(
+                    id=f"{i}_t1", case_id=str(i), tube="1", data=SOM(pad_array(som, padding), ["a", "b"]))])
+                for i, som in enumerate(data)
+            ]
+            inputs.append(classifier.array_from_cases(cases))
+        assert_allclose(inputs[1][0], inputs[0][0])
+        self.assertEqual(inputs[0][0].shape, (2, 8, 8, 2))
+
+    @unittest.skipUnless(importlib.util.find_spec("keras"), "keras is not installed")
+    def test_keras_outputs(self):
+        from flowcat.classifier.models import create_model_multi_input
+
+        input_shapes = [(14, 14, 3), (14, 14, 2)]
+        model = create_model_multi_input(input_shapes, 4)
+        data = [np.random.rand(8, *shape).astype(np.float32) for shape in input_shapes]
+        arrays, meta = numpy_model.model_to_bundle(model)
+        assert_allclose(
+            numpy_model.NumpyModel.from_bundle(arrays, meta).predict(data),
+            model.predict(data), rtol=1e-4, atol=1e-6)
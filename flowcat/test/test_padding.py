@@ -0,0 +1,34 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from flowcat.classifier.padding import (
+    pad_array, pad_arrays, pad_batch, repad_batch, pad_stored_arrays, stored_padding)
+
+
+class PaddingTestCase(unittest.TestCase):
+    def test_batch_padding(self):
+        for rows, cols, pad_width in [(2, 2, 1), (5, 7, 2), (2, 3, 4)]:
+            data = np.random.rand(3, rows, cols, 2)
+            expected = np.array([pad_array(array, pad_width) for array in data])
+            with self.subTest(rows=rows, cols=cols, pad_width=pad_width):
+                assert_array_equal(pad_batch(data, pad_width), expected)
+                assert_array_equal(pad_arrays(list(data), pad_width), expected)
+                for padding in (0, 1, 3):
+                    stored = np.array([pad_array(array, padding) for array in data])
+                    assert_array_equal(repad_batch(stored, padding, pad_width), expected)
+
+    def test_stored_arrays(self):
+        data = np.random.rand(3, 4, 5, 2)
+        expected = pad_batch(data, 2)
+        for padding in (0, 1, 2, 3):
+            stored = [pad_array(array, padding) for array in data]
+            with self.subTest(padding=padding):
+                self.assertEqual(stored_padding(stored[0].shape, (4, 5, -1)), padding)
+                assert_array_equal(pad_stored_arrays(stored, (4, 5, -1), 2), expected)
+
+        with self.assertRaises(ValueError):
+            stored_padding((5, 7, 2), (4, 5, 2))
+        with self.assertRaises(ValueError):
+            pad_stored_arrays([data[0], pad_array(data[1], 1)], (4, 5, 2), 2)
@@ -0,0 +1,41 @@
+import unittest
+from collections import Counter
+
+import numpy as np
+
+from flowcat.classifier import sampling
+
+
+GROUPS = ["a"] * 10 + ["b"] * 4 + ["c"] * 2
+
+
+def count_groups(positions):
+    return Counter(GROUPS[p] for p in positions)
+
+
+class SamplingTestCase(unittest.TestCase):
+    def test_counts(self):
+        sampler = sampling.EpochSampler(GROUPS, counts={"a": 5, "b": 8}, seed=0)
+        positions = sampler.sample()
+        self.assertEqual(sampler.epoch_size, 15)
+        self.assertEqual(count_groups(positions), {"a": 5, "b": 8, "c": 2})
+
+    def test_shuffle(self):
+        sampler = sampling.EpochSampler(GROUPS, seed=0)
+        first, second = sampler.sample(), sampler.sample()
+        self.assertEqual(sorted(first), list(range(len(GROUPS))))
+        self.assertFalse(np.array_equal(first, second))
+
+    def test_inverse_frequency(self):
+        sampler = sampling.EpochSampler(GROUPS, inverse_frequency=True, epoch_size=3000, seed=0)
+        counts = count_groups(sampler.sample())
+        self.assertEqual(sum(counts.values()), 3000)
+        for group in "abc":
+            self.assertAlmostEqual(counts[group] / 3000, 1 / 3, delta=0.05)
+
+    def test_create_sampler(self):
+        self.assertIsNone(sampling.create_sampler(GROUPS, None))
+        self.assertEqual(sampling.create_sampler(GROUPS, 3).epoch_size, 9)
+        self.assertTrue(sampling.create_sampler(GROUPS, "inverse").inverse_frequency)
+        with self.assertRaises(ValueError):
+            sampling.EpochSampler(GROUPS, counts={"a": 1}, epoch_size=10)
@@ -37,3 +37,13 @@ class TestSOM(unittest.TestCase):
             [[6, 5], [8, 7]],
         ]))
         self.assertEqual(selection.markers, ["B", "A"])
+
+    def test_padded(self):
+        testsom = som.SOM(np.array([
+            [[1, 1], [2, 1],],
+            [[3, 1], [3, 2],],
+        ]), ["A", "B"])
+        padded = testsom.get_padded(1)
+        self.assertEqual(padded.shape, (4, 4, 2))
+        assert_array_equal(padded[0], [[3, 2], [3, 1], [3, 2], [3, 1]])
+        assert_array_equal(padded[1:3, 1:3], testsom.data)
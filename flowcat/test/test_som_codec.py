@@ -0,0 +1,107 @@
+import unittest
+import tempfile
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from flowcat import io_functions, utils
+from flowcat.types import som_codec
+from flowcat.types.som import SOM
+
+
+class SOMCodecTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = utils.URLPath(self.tmpdir.name)
+        self.data = np.random.RandomState(0).rand(8, 8, 3).astype(np.float32)
+        self.data[..., 1] *= 100
+        self.data[..., 2] = 0.5
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_roundtrip(self):
+        for storage in som_codec.STORAGE_TYPES:
+            with self.subTest(storage=storage):
+                decoded = som_codec.decode(som_codec.encode(self.data, storage))
+                self.assertEqual(decoded.dtype, np.float32)
+                self.assertEqual(decoded.shape, self.data.shape)
+                if storage == "float32":
+                    assert_array_equal(decoded, self.data)
+                elif storage == "float16":
+                    assert_allclose(decoded, self.data, rtol=1e-3)
+                else:
+                    ranges = np.ptp(self.data.reshape(-1, 3), axis=0)
+                    max_error = ranges / np.iinfo(storage).max / 2 + 1e-6
+                    self.assertTrue(np.all(np.abs(decoded - self.data) <= max_error))
+                    assert_allclose(decoded[..., 2], 0.5)
+
+    def test_files(self):
+        for storage in som_codec.STORAGE_TYPES:
+            with self.subTest(storage=storage):
+                path = som_codec.save_array(self.data, self.path / f"som_{storage}", storage)
+                self.assertEqual(path.suffix, som_codec.storage_suffix(storage))
+                assert_allclose(som_codec.load_array(path), self.data, rtol=1e-2, atol=0.5)
+                self.assertEqual(SOM(path, ["a", "b", "c"]).data.dtype, np.float32)
+
+    def test_save_som(self):
+        som = SOM(self.data, ["a", "b", "c"])
+        for storage in ("float16", "uint16"):
+            with self.subTest(storage=storage):
+                path = self.path / storage
+                io_functions.save_som(som, path, storage=storage)
+                loaded = io_functions.load_som(path)
+                self.assertEqual(loaded.markers, som.markers)
+                assert_allclose(loaded.data, self.data, rtol=1e-3, atol=1e-3)
+
+    def test_delta(self):
+        reference = self.data + 0.1
+        reference[:2] += 1
+        for storage in som_codec.DELTA_TYPES:
+            for threshold in (None, 0.5):
+                with self.subTest(storage=storage, threshold=threshold):
+                    arrays = som_codec.encode_delta(self.data, reference, storage, threshold=threshold)
+                    decoded = som_codec.decode_deltas([arrays], reference[None])[0]
+                    self.assertEqual(decoded.shape, self.data.shape)
+                    if threshold is None:
+                        assert_allclose(decoded, self.data, rtol=1e-2, atol=1e-2)
+                    else:
+                        self.assertEqual(arrays["nodes"].size, 16)
+                        changed = np.abs(self.data - reference).max(axis=-1) > threshold
+                        assert_allclose(decoded[changed], self.data[changed], rtol=1e-2, atol=1e-2)
+                        assert_array_equal(decoded[~changed], reference[~changed])
+
+    def test_delta_files(self):
+        reference = self.data + np.random.RandomState(1).normal(scale=0.01, size=self.data.shape)
+        reference_path = self.path / "reference.npy"
+        np.save(str(reference_path), reference.astype(np.float32))
+        data_path = self.path / "data"
+        data_path.mkdir()
+
+        soms = [self.data, self.data * 1.01]
+        paths = [
+            som_codec.save_array(som, data_path / f"som_{i}", "delta_uint8", reference=reference_path)
+            for i, som in enumerate(soms)
+        ]
+        paths.append(som_codec.save_array(self.data, data_path / "plain", "float16"))
+        self.assertEqual(paths[0].suffix, ".npz")
+
+        batch = som_codec.load_arrays(paths)
+        self.assertEqual(batch.shape, (3, *self.data.shape))
+        self.assertEqual(batch.dtype, np.float32)
+        assert_allclose(batch[0], self.data, rtol=1e-2, atol=0.02)
+        assert_allclose(batch[1], soms[1], rtol=1e-2, atol=0.02)
+        assert_allclose(som_codec.load_array(paths[0]), batch[0])
+
+        # delta encoded SOMs can not be decoded against a changed reference
+        np.save(str(reference_path), reference.astype(np.float32) + 1)
+        with self.assertRaises(ValueError):
+            som_codec.load_array(paths[0])
+
+    def test_delta_without_reference(self):
+        with self.assertRaises(ValueError):
+            som_codec.save_array(self.data, self.path / "som", "delta_uint8")
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            som_codec.encode(self.data, "int4")
@@ -5,6 +5,7 @@ from numpy.testing import assert_array_equal
 import pandas as pd
 from sklearn.preprocessing import LabelBinarizer
 from flowcat.classifier.som_dataset import SOMDataset, SOMCase, SOMSequence
+from flowcat.classifier.sampling import EpochSampler
 
 from . import shared
 
@@ -118,3 +119,27 @@ class SOMDatasetTestCase(shared.FlowcatTestCase):
         ]])
         result, _ = sequence[0]
         assert_array_equal(result, expected_data)
+
+    def test_sampled_sequence(self):
+        dataset = create_som_dataset(
+            [
+                ("1", "a", {"1": [[[1, 1], [2, 1]], [[3, 1], [3, 2]]]}),
+                ("2", "a", {"1": [[[1, 1], [2, 1]], [[3, 1], [3, 2]]]}),
+                ("3", "b", {"1": [[[1, 1], [2, 1]], [[3, 1], [3, 2]]]}),
+            ],
+            [
+                ("1", (2, 2, 2), ("x", "y"))
+            ]
+        )
+        binarizer = LabelBinarizer()
+        binarizer.fit(["a", "b", "c"])
+        sampler = EpochSampler(dataset.groups, counts={"a": 4, "b": 6}, seed=0)
+        sequence = SOMSequence(dataset, binarizer, ["1"], batch_size=4, sampler=sampler)
+        self.assertEqual(len(sequence), 3)
+
+        labels = np.concatenate([sequence[i][1] for i in range(len(sequence))])
+        assert_array_equal(labels.sum(axis=0), [4, 6, 0])
+        self.assertEqual(sorted(sequence._cache), [0, 1, 2])
+
+        sequence.on_epoch_end()
+        self.assertEqual(len(sequence._positions), 10)
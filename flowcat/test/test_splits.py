@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from flowcat.dataset import splits
+
+
+GROUPS = ["a"] * 10 + ["b"] * 7 + ["c"] * 3
+
+
+def group_counts(indexes):
+    return {g: int(np.sum(np.asarray(GROUPS)[indexes] == g)) for g in sorted(set(GROUPS))}
+
+
+class SplitsTestCase(unittest.TestCase):
+    def test_holdout(self):
+        train, test = splits.holdout_split(GROUPS, 0.5, seed=1)
+        self.assertEqual(group_counts(train), {"a": 5, "b": 4, "c": 2})
+        self.assertEqual(sorted(np.concatenate([train, test])), list(range(len(GROUPS))))
+
+        train, test = splits.holdout_split(GROUPS, 2, seed=1)
+        self.assertEqual(group_counts(train), {"a": 2, "b": 2, "c": 2})
+
+        train, test = splits.holdout_split(GROUPS, 0.25, stratify=False, seed=1)
+        self.assertEqual((len(train), len(test)), (5, 15))
+
+    def test_seed(self):
+        assert_array_equal(splits.holdout_split(GROUPS, 0.5, seed=3)[0], splits.holdout_split(GROUPS, 0.5, seed=3)[0])
+        repeats = list(splits.repeated_holdout(GROUPS, 0.5, 3, seed=3))
+        self.assertEqual(len(repeats), 3)
+        self.assertFalse(np.array_equal(repeats[0][0], repeats[1][0]))
+        assert_array_equal(repeats[0][0], splits.holdout_split(GROUPS, 0.5, seed=np.random.RandomState(3))[0])
+
+    def test_kfold(self):
+        folds = list(splits.stratified_kfold(GROUPS, 3, seed=0))
+        tests = np.concatenate([test for _, test in folds])
+        self.assertEqual(sorted(tests), list(range(len(GROUPS))))
+        for train, test in folds:
+            self.assertEqual(len(np.intersect1d(train, test)), 0)
+            self.assertIn(len(test), (6, 7))
+            counts = group_counts(test)
+            self.assertIn(counts["a"], (3, 4))
+            self.assertEqual(counts["c"], 1)
+        with self.assertRaises(ValueError):
+            list(splits.stratified_kfold(GROUPS, 1))
+
+    def test_learning_curve(self):
+        subsets = list(splits.learning_curve(GROUPS, [0.2, 0.5, 10], seed=0))
+        self.assertEqual([len(s) for s in subsets], [4, 11, 20])
+        for smaller, larger in zip(subsets, subsets[1:]):
+            self.assertTrue(set(smaller) <= set(larger))
+        subsets = list(splits.learning_curve(GROUPS, [5, 10], stratify=False, seed=0))
+        self.assertEqual([len(s) for s in subsets], [5, 10])
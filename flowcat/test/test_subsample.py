@@ -0,0 +1,79 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from flowcat.types import fcsdata as fcs
+from flowcat.preprocessing import subsample
+
+
+def create_fcs(events, channels=3, seed=0):
+    data = np.random.RandomState(seed).rand(events, channels)
+    return fcs.FCSData((data, np.ones(data.shape)), channels=[f"c{i}" for i in range(channels)])
+
+
+class SubsampleTestCase(unittest.TestCase):
+
+    def test_create(self):
+        self.assertIsNone(subsample.create_subsampler(None))
+        sampler = subsample.create_subsampler({"strategy": "density", "size": 10, "bins": 4})
+        self.assertIsInstance(sampler, subsample.DensitySubsampler)
+        self.assertEqual(subsample.create_subsampler(sampler.config).config, sampler.config)
+        with self.assertRaises(ValueError):
+            subsample.create_subsampler({"strategy": "unknown"})
+
+    def test_sizes(self):
+        data = create_fcs(1000)
+        cases = [
+            ({"strategy": "uniform", "fraction": 0.25}, 250),
+            ({"strategy": "uniform", "fraction": 0.25, "size": 100}, 100),
+            ({"strategy": "capped", "size": 100}, 100),
+            ({"strategy": "capped", "size": 5000}, 1000),
+            ({"strategy": "density", "size": 100}, 100),
+            ({"strategy": "reservoir", "size": 100, "chunk_size": 64}, 100),
+        ]
+        for config, expected in cases:
+            with self.subTest(config=config):
+                sampler = subsample.create_subsampler({**config, "seed": 1})
+                result = sampler(data, key="case")
+                self.assertEqual(result.shape, (expected, 3))
+                self.assertEqual(result.channels, data.channels)
+                self.assertEqual(len(np.unique(result.data, axis=0)), expected)
+
+    def test_deterministic(self):
+        data = create_fcs(1000)
+        for strategy in subsample.STRATEGIES:
+            with self.subTest(strategy=strategy):
+                sampler = subsample.create_subsampler(
+                    {"strategy": strategy, "size": 100, "fraction": 0.1, "seed": 1}
+                    if strategy == "uniform" else
+                    {"strategy": strategy, "size": 100, "seed": 1})
+                assert_array_equal(sampler(data, key="a").data, sampler(data, key="a").data)
+                self.assertFalse(np.array_equal(sampler(data, key="a").data, sampler(data, key="b").data))
+
+    def test_density_keeps_rare(self):
+        common = np.random.RandomState(0).rand(9900, 2) * 0.1
+        rare = np.random.RandomState(1).rand(100, 2) * 0.1 + 0.9
+        data = fcs.FCSData((np.concatenate([common, rare]), np.ones((10000, 2))), channels=["a", "b"])
+
+        sampler = subsample.DensitySubsampler(size=1000, seed=1, bins=4)
+        result = sampler(data)
+        rare_count = np.count_nonzero(result.data[:, 0] > 0.5)
+        self.assertGreater(rare_count, 50)
+
+    def test_reservoir_stream(self):
+        data = create_fcs(1000).data
+        sampler = subsample.ReservoirSubsampler(size=100, seed=1, chunk_size=128)
+
+        chunks = (data[i:i + 128] for i in range(0, 1000, 128))
+        streamed = sampler.sample_stream(chunks, key="a")
+        selected = data[sampler.select(data, sampler.random_state("a"))]
+        assert_array_equal(np.sort(streamed, axis=0), np.sort(selected, axis=0))
+
+    def test_reservoir_uniform(self):
+        rng = np.random.RandomState(0)
+        counts = np.zeros(100)
+        for _ in range(500):
+            counts[subsample.reservoir_indices([30, 30, 40], 10, rng)] += 1
+        # every event should be selected with probability 10/100
+        self.assertTrue(np.all(np.abs(counts / 500 - 0.1) < 0.06))
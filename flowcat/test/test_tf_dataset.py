@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+import tensorflow as tf
+from sklearn.preprocessing import LabelBinarizer
+
+from flowcat.classifier import tf_dataset
+from flowcat.classifier.sampling import EpochSampler
+from flowcat.classifier.padding import pad_array
+
+from .test_som_dataset import create_som_dataset
+
+
+def create_dataset():
+    return create_som_dataset(
+        [
+            (str(i), group, {"1": np.random.rand(3, 3, 2)})
+            for i, group in enumerate(["a", "a", "a", "b", "b"])
+        ],
+        [
+            ("1", (3, 3, 2), ("x", "y"))
+        ]
+    )
+
+
+class TFDatasetTestCase(unittest.TestCase):
+    def test_padding(self):
+        data = np.random.rand(2, 3, 4, 2).astype(np.float32)
+        expected = np.array([pad_array(array, 2) for array in data])
+        stored = np.array([pad_array(array, 1) for array in data])
+        with tf.Session() as session:
+            assert_array_equal(session.run(tf_dataset.wrap_pad(tf.constant(data), 2)), expected)
+            assert_array_equal(session.run(tf_dataset.repad(tf.constant(stored), 1, 2)), expected)
+            assert_array_equal(session.run(tf_dataset.repad(tf.constant(expected), 2, 0)), data)
+
+    def test_batches(self):
+        dataset = create_dataset()
+        binarizer = LabelBinarizer().fit(["a", "b", "c"])
+        pipeline = tf_dataset.SOMTFDataset(
+            dataset, binarizer, ["1"], lambda case, tube: case.get_tube(tube), batch_size=2, pad_width=1)
+        self.assertEqual(len(pipeline), 3)
+
+        with tf.Session() as session:
+            batches = pipeline.generator(session)
+            epoch = [next(batches) for _ in range(len(pipeline))]
+
+        inputs = np.concatenate([batch[0][0] for batch in epoch])
+        labels = np.concatenate([batch[1] for batch in epoch])
+        self.assertEqual(inputs.shape, (5, 5, 5, 2))
+        assert_array_equal(labels.sum(axis=0), [3, 2, 0])
+        expected = {tuple(pad_array(case.data["1"], 1).ravel().astype(np.float32)) for case in dataset}
+        self.assertEqual({tuple(array.ravel()) for array in inputs}, expected)
+
+    def test_sampled_batches(self):
+        dataset = create_dataset()
+        binarizer = LabelBinarizer().fit(["a", "b", "c"])
+        sampler = EpochSampler(dataset.groups, counts={"a": 4, "b": 4}, seed=0)
+        pipeline = tf_dataset.SOMTFDataset(
+            dataset, binarizer, ["1"], lambda case, tube: case.get_tube(tube), batch_size=4, sampler=sampler)
+        self.assertEqual(len(pipeline), 2)
+
+        with tf.Session() as session:
+            batches = pipeline.generator(session)
+            labels = np.concatenate([next(batches)[1] for _ in range(len(pipeline))])
+        assert_array_equal(labels.sum(axis=0), [4, 4, 0])
+        self.assertLessEqual(len(pipeline._loaded), len(dataset))
@@ -1,5 +1,6 @@
 import logging
 import unittest
+from unittest import mock
 
 import numpy as np
 from numpy.testing import assert_array_equal, assert_allclose
@@ -74,6 +75,15 @@ class TFSomTestCase(unittest.TestCase):
         multi_batch = model.output_weights
         assert_allclose(single_batch, multi_batch, rtol=1e-04)
 
+    def test_buffer_size(self):
+        """Samples are staged in the graph, so samples larger than the buffer size are trained completely."""
+        data = np.random.rand(1000, 4)
+        mask = np.ones((1000, 4))
+
+        model = tfsom.TFSom((10, 10, 4), seed=SEED, max_epochs=2).initialize()
+        small_buffer = tfsom.TFSom((10, 10, 4), seed=SEED, max_epochs=2, buffer_size=100).initialize()
+        assert_allclose(small_buffer.transform(data, mask), model.transform(data, mask), rtol=1e-04)
+
     def test_missing_data(self):
         model = tfsom.TFSom(
             (3, 3, 4),
@@ -112,5 +122,108 @@ class TFSomTestCase(unittest.TestCase):
         error = sess.run(qe_model, feed_dict={fcs_label: data, som_label: transformed})
         self.assertTrue(error <= 0.1)
 
+    def test_reconfigure(self):
+        """Reconfigured models should behave like newly created models with the same parameters."""
+        data = np.random.rand(1000, 4)
+        mask = np.ones((1000, 4))
+
+        model = tfsom.TFSom((10, 10, 4), seed=SEED, max_epochs=10, initial_radius=5, end_radius=1).initialize()
+        model.train(data, mask)
+        trained = model.output_weights
+
+        graph = tf.Graph()
+        with graph.as_default():
+            initialization = tfsom.create_initializer("reference", trained, (10, 10, 4))
+        reference = tfsom.TFSom(
+            (10, 10, 4), graph=graph, initialization=initialization,
+            seed=SEED, max_epochs=2, initial_radius=2, end_radius=1).initialize()
+
+        model.reconfigure(max_epochs=2, initial_radius=2, end_radius=1)
+        assert_allclose(model.transform(data, mask), reference.transform(data, mask), rtol=1e-04)
+
+    def test_convergence(self):
+        """Converged training should skip to the final epoch."""
+        data = np.random.rand(1000, 4)
+        mask = np.ones((1000, 4))
+
+        model = tfsom.TFSom((10, 10, 4), seed=SEED, max_epochs=10).initialize()
+        model.transform(data, mask)
+        self.assertEqual(model.epochs_run, 10)
+
+        model.reconfigure(convergence="max_delta", convergence_threshold=float("inf"))
+        model.transform(data, mask)
+        self.assertEqual(model.epochs_run, 2)
+
+        model.reconfigure(convergence="quantization_error", convergence_threshold=float("inf"))
+        model.transform(data, mask)
+        self.assertEqual(model.epochs_run, 3)
+
+        with self.assertRaises(ValueError):
+            tfsom.TFSom((10, 10, 4), convergence="unknown")
+
+    def test_checkpoint_variables(self):
+        """Checkpoints should only contain the variables saved by earlier versions."""
+        model = tfsom.TFSom((10, 10, 4), seed=SEED, convergence="quantization_error").initialize()
+        saved = {v.op.name for v in model._graph.get_collection(tf.GraphKeys.GLOBAL_VARIABLES)}
+        self.assertEqual(saved, {"weights", "numerator", "denominator", "ref_weights"})
+
+    def test_bmu_search(self):
+        """Exact host search should give the same result as the graph search."""
+        data = np.random.rand(1000, 4)
+        mask = np.ones((1000, 4))
+
+        model = tfsom.TFSom((10, 10, 4), seed=SEED, max_epochs=3).initialize()
+        graph_nodes = model.calculate_nearest_nodes(data, mask)
+        graph_weights = model.transform(data, mask)
+
+        model.reconfigure(bmu_search={"method": "kdtree", "eps": 0.0})
+        assert_array_equal(model.calculate_nearest_nodes(data, mask), graph_nodes)
+        assert_allclose(model.transform(data, mask), graph_weights, rtol=1e-04)
+        self.assertEqual(model.bmu_recall, 1.0)
+
+    def test_truncated_neighbourhood(self):
+        """Truncated neighbourhood covering the whole map should equal the gaussian neighbourhood."""
+        data = np.random.rand(1000, 4)
+        mask = np.ones((1000, 4))
+        mask[:100, 1] = 0
+
+        for map_type, size in (("planar", 10), ("toroid", 11)):
+            for node_distance in ("euclidean", "manhattan", "chebyshev"):
+                args = dict(
+                    seed=SEED, max_epochs=3, initial_radius=3, end_radius=1,
+                    map_type=map_type, node_distance=node_distance)
+                gaussian = tfsom.TFSom((size, size, 4), **args).initialize()
+                truncated = tfsom.TFSom(
+                    (size, size, 4), neighbourhood="truncated", truncate=100, **args).initialize()
+                assert_allclose(
+                    truncated.transform(data, mask), gaussian.transform(data, mask),
+                    rtol=1e-04, atol=1e-06)
+
+        with self.assertRaises(ValueError):
+            tfsom.TFSom((10, 10, 4), neighbourhood="unknown")
+
+    def test_distance_table(self):
+        """Precomputed distance tables should equal distances calculated per batch."""
+        data = np.random.rand(500, 4)
+        mask = np.ones((500, 4))
+
+        for map_type in ("planar", "toroid", "hex", "hex_toroid"):
+            args = dict(seed=SEED, max_epochs=2, initial_radius=3, end_radius=1, map_type=map_type)
+            table = tfsom.TFSom((8, 8, 4), **args).initialize()
+            with mock.patch.object(tfsom.topology, "MAX_TABLE_NODES", 0):
+                computed = tfsom.TFSom((8, 8, 4), **args).initialize()
+            assert_allclose(table.transform(data, mask), computed.transform(data, mask), rtol=1e-04)
+
+    def test_set_weights(self):
+        """Set weights should be kept as reference for transforms."""
+        data = np.random.rand(1000, 4)
+        mask = np.ones((1000, 4))
+        weights = np.random.rand(10, 10, 4)
+
+        model = tfsom.TFSom((10, 10, 4), seed=SEED, max_epochs=0).initialize()
+        model.set_weights(weights)
+        assert_allclose(model.output_weights, weights.reshape(100, 4))
+        assert_allclose(model.transform(data, mask), weights.reshape(100, 4))
+
 
 logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,87 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from flowcat.sommodels import topology
+
+
+class UpsampleTestCase(unittest.TestCase):
+
+    def test_constant(self):
+        weights = np.full((4, 4, 3), 0.5)
+        for map_type in ("planar", "toroid"):
+            with self.subTest(map_type=map_type):
+                result = topology.upsample_weights(weights, (8, 12), map_type)
+                self.assertEqual(result.shape, (8, 12, 3))
+                assert_allclose(result, 0.5)
+
+    def test_planar(self):
+        weights = np.array([[0.0, 1.0], [2.0, 3.0]])[..., None]
+        result = topology.upsample_weights(weights, (4, 4), "planar")
+        assert_allclose(result[:, :, 0], [
+            [0.0, 0.25, 0.75, 1.0],
+            [0.5, 0.75, 1.25, 1.5],
+            [1.5, 1.75, 2.25, 2.5],
+            [2.0, 2.25, 2.75, 3.0],
+        ])
+
+    def test_toroid(self):
+        weights = np.array([[0.0, 1.0]])[..., None]
+        result = topology.upsample_weights(weights, (1, 4), "toroid")
+        # edges interpolate between the first and last column
+        assert_allclose(result[0, :, 0], [0.25, 0.25, 0.75, 0.75])
+
+    def test_identity(self):
+        weights = np.random.rand(5, 6, 2)
+        for map_type in ("planar", "toroid"):
+            assert_allclose(topology.upsample_weights(weights, (5, 6), map_type), weights)
+
+
+class DistanceTableTestCase(unittest.TestCase):
+
+    def test_rectangular(self):
+        m, n = 5, 6
+        rows, cols = np.divmod(np.arange(m * n), n)
+        drows = np.abs(rows[:, None] - rows[None, :])
+        dcols = np.abs(cols[:, None] - cols[None, :])
+        wrapped_rows = np.minimum(drows, m - drows)
+        wrapped_cols = np.minimum(dcols, n - dcols)
+
+        expected = {
+            ("planar", "euclidean"): drows ** 2 + dcols ** 2,
+            ("planar", "manhattan"): drows + dcols,
+            ("toroid", "euclidean"): wrapped_rows ** 2 + wrapped_cols ** 2,
+            ("toroid", "chebyshev"): np.maximum(wrapped_rows, wrapped_cols),
+        }
+        for (map_type, distance_type), table in expected.items():
+            with self.subTest(map_type=map_type, distance_type=distance_type):
+                assert_allclose(topology.node_distance_table(m, n, map_type, distance_type, chunk_size=7), table)
+
+    def test_hex_neighbours(self):
+        for distance_type in ("euclidean", "manhattan"):
+            with self.subTest(distance_type=distance_type):
+                table = topology.node_distance_table(6, 6, "hex", distance_type)
+                # interior node in even and odd row
+                for node in (2 * 6 + 2, 3 * 6 + 2):
+                    self.assertEqual(np.count_nonzero(np.isclose(table[node], 1)), 6)
+
+                table = topology.node_distance_table(6, 8, "hex_toroid", distance_type)
+                assert_allclose(table, table.T, atol=1e-6)
+                assert_allclose(np.count_nonzero(np.isclose(table, 1), axis=1), 6)
+
+    def test_hex_steps(self):
+        table = topology.node_distance_table(5, 5, "hex", "manhattan")
+        # odd rows are shifted right
+        self.assertEqual(table[1 * 5 + 1, 0 * 5 + 2], 1)
+        self.assertEqual(table[1 * 5 + 1, 0 * 5 + 0], 2)
+        self.assertEqual(table[2 * 5 + 2, 0 * 5 + 2], 2)
+        self.assertEqual(table[0, 4 * 5 + 4], 6)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            topology.node_distance_table(5, 6, "hex_toroid", "euclidean")
+        with self.assertRaises(TypeError):
+            topology.node_distance_table(5, 6, "sphere", "euclidean")
+        with self.assertRaises(TypeError):
+            topology.node_distance_table(5, 6, "planar", "cosine")
@@ -1,7 +1,9 @@
 # pylint: skip-file
 # flake8: noqa
 import unittest
+import os
 import pickle
+import tempfile
 
 from flowcat import utils
 from flowcat.utils.urlpath import cast_urlpath
@@ -66,3 +68,82 @@ class TestURLPath(unittest.TestCase):
         res = testfun(a="b", b="a")
         self.assertEqual(type(res[0]), utils.URLPath)
         self.assertNotEqual(type(res[1]), utils.URLPath)
+
+        res = testfun(a=None, b="a")
+        self.assertIsNone(res[0])
+
+
+class TestThreads(unittest.TestCase):
+    def test_thread_budget(self):
+        self.assertEqual(utils.thread_budget(1, cpus=8), 8)
+        self.assertEqual(utils.thread_budget(3, cpus=8), 2)
+        self.assertEqual(utils.thread_budget(16, cpus=8), 1)
+
+    def test_resolve_session_threads(self):
+        self.assertEqual(
+            utils.resolve_session_threads(None, None),
+            {"intra_op_threads": None, "inter_op_threads": None})
+        resolved = utils.resolve_session_threads("auto", "auto", workers=utils.available_cpus())
+        self.assertEqual(resolved, {"intra_op_threads": 1, "inter_op_threads": 1})
+        self.assertEqual(utils.parse_thread_count("auto"), "auto")
+        self.assertEqual(utils.parse_thread_count("4"), 4)
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_file_fingerprint(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = utils.URLPath(tmpdir) / "sample.fcs"
+            path.write_bytes(b"abc")
+            fingerprint = utils.file_fingerprint(path)
+            self.assertEqual(fingerprint, utils.file_fingerprint(str(path)))
+
+            os.utime(str(path), ns=(0, 1))
+            self.assertNotEqual(utils.file_fingerprint(path), fingerprint)
+            self.assertTrue(utils.file_fingerprint(path).startswith("3-"))
+
+
+class TestStageCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.stages = utils.StageCache(utils.URLPath(self.tmpdir.name))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_keys(self):
+        stage = self.stages.stage("som", cases=[["a", [["a_t1", "1-2"]]]], args={"max_epochs": 2})
+        same = self.stages.stage("som", args={"max_epochs": 2}, cases=[["a", [["a_t1", "1-2"]]]])
+        self.assertEqual(stage.key, same.key)
+        for changed in (
+                self.stages.stage("som", cases=[["a", [["a_t1", "1-3"]]]], args={"max_epochs": 2}),
+                self.stages.stage("som", cases=[["a", [["a_t1", "1-2"]]]], args={"max_epochs": 3}),
+                self.stages.stage("som_val", cases=[["a", [["a_t1", "1-2"]]]], args={"max_epochs": 2})):
+            self.assertNotEqual(stage.key, changed.key)
+
+    def test_commit(self):
+        stage = self.stages.stage("reference", args={})
+        self.assertFalse(stage.done)
+        (stage.path / "partial.npy").write_bytes(b"old")
+        self.stages.start(stage)
+        self.assertFalse(stage.path.exists())
+
+        (stage.path / "tube1" / "weights.npy").write_bytes(b"weights")
+        self.stages.commit(stage)
+        self.assertTrue(stage.done)
+        manifest = self.stages.load_manifest(stage)
+        self.assertEqual(manifest["files"], {"tube1/weights.npy": 7})
+        with self.assertRaises(RuntimeError):
+            self.stages.start(stage)
+
+    def test_seed(self):
+        first = self.stages.stage("som", cases=["a"], args={"a": 1})
+        self.stages.start(first)
+        (first.path / "data" / "a.npy").write_bytes(b"a")
+        self.stages.commit(first)
+        self.stages.commit(self.stages.stage("som", cases=["a"], args={"a": 2}))
+
+        second = self.stages.stage("som", cases=["a", "b"], args={"a": 1})
+        self.assertEqual(self.stages.previous(second).key, first.key)
+        self.stages.seed(second, first)
+        self.assertEqual((second.path / "data" / "a.npy").read_bytes(), b"a")
+        self.assertFalse(second.done)
@@ -2,18 +2,19 @@ from copy import deepcopy
 from dataclasses import dataclass, asdict, replace
 
 import numpy as np
-from flowcat import utils, io_functions
-from flowcat.utils import classification_utils
+from flowcat import utils
 
 
 
 def load_somclassifier_config(path: utils.URLPath) -> "SOMClassifierConfig":
     """Load somclassifier config from the given path."""
+    from flowcat import io_functions
     return SOMClassifierConfig(**io_functions.load_json(path))
 
 
 def save_somclassifier_config(config: "SOMClassifierConfig", path: utils.URLPath):
     """Save configuration to the given path."""
+    from flowcat import io_functions
     io_functions.save_json(config.to_json(), path)
 
 
@@ -51,5 +52,6 @@ class SOMClassifierConfig:
     def get_loss(self, modeldir=None):
         if self.cost_matrix is None:
             return "categorical_crossentropy"
+        from flowcat.utils import classification_utils
         cost_matrix = np.load(modeldir / self.cost_matrix)
         return classification_utils.WeightedCategoricalCrossentropy(cost_matrix)
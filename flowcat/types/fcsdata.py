@@ -255,6 +255,10 @@ class FCSData:
     def copy(self) -> "FCSData":
         return self.__class__(self)
 
+    def take(self, indexes) -> "FCSData":
+        """Select events by row index, keeping channel metadata."""
+        return self.__class__((self.data[indexes], self.mask[indexes]), channels=self.channels)
+
     def drop_empty(self) -> "FCSData":
         """Drop all channels containing nix in the channel name.
         """
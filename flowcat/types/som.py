@@ -12,6 +12,7 @@ import pandas as pd
 
 from flowcat.utils import URLPath
 from flowcat.types.marker import Marker
+from flowcat.types import som_codec
 
 
 LOGGER = logging.getLogger(__name__)
@@ -26,7 +27,7 @@ class SOM:
 
     def __post_init__(self):
         if isinstance(self.data, (URLPath, str)):
-            self.data = np.load(str(self.data))
+            self.data = som_codec.load_array(self.data)
 
         self.markers = [Marker.convert(m) for m in self.markers]
 
@@ -44,14 +45,14 @@ class SOM:
         return pd.DataFrame(self.data.reshape((-1, len(self.markers))), columns=self.markers)
 
     def get_padded(self, pad_width) -> np.array:
-        """Return as new numpy array. Optionally with padding by adding zeros
-        to the borders of the SOM.
+        """Return as new numpy array. Optionally with padding by wrapping
+        the borders of the toroidal SOM.
 
         Args:
             pad_width: Additional padding for SOM on borders. The width is
                        added to each border.
         """
-        data = np.reshape(self.data.values, (*self.dims, -1))
+        data = np.reshape(self.data, (*self.dims[:2], -1))
         data = np.pad(data, pad_width=[
             (pad_width, pad_width),
             (pad_width, pad_width),
@@ -0,0 +1,236 @@
+"""Compact storage of SOM weights on disk.
+
+Supported storage types:
+    float32: Unchanged .npy file.
+    float16: Half precision .npy file.
+    uint8, uint16: Per-channel scaled integers in a .npz file, containing
+        the quantized data and per-channel offset and scale.
+    delta_float16, delta_uint8, delta_uint16: Difference to the reference
+        SOM weights of the tube, encoded as above in a .npz file. The file
+        contains the path of the reference relative to the file and the
+        reference version. Optionally only nodes with a difference above a
+        threshold are stored together with their node indexes.
+
+All loaded SOM data is upcast to float32.
+"""
+from typing import List, Tuple
+import os
+import hashlib
+
+import numpy as np
+
+from flowcat.utils import URLPath
+
+
+STORAGE_TYPES = ("float32", "float16", "uint8", "uint16")
+
+QUANTIZED_TYPES = ("uint8", "uint16")
+
+DELTA_TYPES = ("delta_float16", "delta_uint8", "delta_uint16")
+
+# loaded reference weights by absolute path and modification time
+_REFERENCES = {}
+
+
+def storage_suffix(storage: str) -> str:
+    """Get file suffix for the storage type."""
+    if storage not in STORAGE_TYPES and storage not in DELTA_TYPES:
+        raise ValueError(f"Unknown SOM storage type: {storage}")
+    return ".npz" if storage in QUANTIZED_TYPES or storage in DELTA_TYPES else ".npy"
+
+
+def reference_version(reference: np.array) -> str:
+    """Get a short hash identifying the reference weights."""
+    return hashlib.sha256(np.ascontiguousarray(reference, dtype=np.float32).tobytes()).hexdigest()[:16]
+
+
+def encode_delta(data: np.array, reference: np.array, storage: str, threshold: float = None) -> dict:
+    """Encode the difference of SOM weights to the reference weights.
+
+    Args:
+        threshold: Only store nodes with a maximum absolute difference above
+            the threshold, all other nodes are decoded as the reference.
+    """
+    if storage not in DELTA_TYPES:
+        raise ValueError(f"Unknown SOM delta storage type: {storage}")
+    if data.shape != reference.shape:
+        raise ValueError(f"SOM shape {data.shape} does not match reference {reference.shape}")
+    delta = (data - reference).reshape(-1, data.shape[-1])
+    nodes = None
+    if threshold is not None:
+        nodes = np.flatnonzero(np.abs(delta).max(axis=1) > threshold).astype(np.int32)
+        delta = delta[nodes]
+
+    arrays = encode(delta, storage[len("delta_"):])
+    arrays["shape"] = np.array(data.shape)
+    if nodes is not None:
+        arrays["nodes"] = nodes
+    return arrays
+
+
+def encode(data: np.array, storage: str = "float32") -> dict:
+    """Encode SOM weights of shape [..., channels] into arrays for storage."""
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown SOM storage type: {storage}")
+    if storage in ("float32", "float16"):
+        return {"data": data.astype(storage)}
+
+    max_value = np.iinfo(storage).max
+    channels = data.reshape(-1, data.shape[-1])
+    if not channels.size:
+        return {
+            "data": data.astype(storage),
+            "offset": np.zeros(data.shape[-1], dtype=np.float32),
+            "scale": np.ones(data.shape[-1], dtype=np.float32),
+        }
+    offset = channels.min(axis=0).astype(np.float32)
+    scale = ((channels.max(axis=0) - offset) / max_value).astype(np.float32)
+    scale[scale == 0] = 1.0
+    quantized = np.round((data - offset) / scale).clip(0, max_value).astype(storage)
+    return {"data": quantized, "offset": offset, "scale": scale}
+
+
+def decode(arrays: dict) -> np.array:
+    """Decode stored arrays into float32 SOM weights.
+
+    Delta encoded arrays are decoded to the difference to the reference.
+    """
+    if "shape" in arrays:
+        return decode_deltas([arrays])[0]
+    data = arrays["data"]
+    if "scale" in arrays:
+        return (data.astype(np.float32) * arrays["scale"] + arrays["offset"]).astype(np.float32)
+    return data.astype(np.float32, copy=False)
+
+
+def decode_deltas(arrays: List[dict], references: np.array = None) -> np.array:
+    """Decode multiple delta encoded SOMs of the same shape at once.
+
+    Args:
+        arrays: List of stored arrays.
+        references: Optional reference weights for each SOM of shape
+            [len(arrays), ..., channels] added to the decoded differences.
+    Returns:
+        Float32 array of shape [len(arrays), ..., channels].
+    """
+    shape = tuple(arrays[0]["shape"])
+    nodes = int(np.prod(shape[:-1]))
+    channels = shape[-1]
+
+    values = []
+    soms = []
+    indexes = []
+    offsets = np.zeros((len(arrays), channels), dtype=np.float32)
+    scales = np.ones((len(arrays), channels), dtype=np.float32)
+    for i, som_arrays in enumerate(arrays):
+        if tuple(som_arrays["shape"]) != shape:
+            raise ValueError(f"SOM shape {tuple(som_arrays['shape'])} does not match {shape}")
+        data = som_arrays["data"].reshape(-1, channels)
+        values.append(data)
+        soms.append(np.full(data.shape[0], i))
+        indexes.append(som_arrays["nodes"] if "nodes" in som_arrays else np.arange(nodes))
+        if "scale" in som_arrays:
+            offsets[i] = som_arrays["offset"]
+            scales[i] = som_arrays["scale"]
+
+    soms = np.concatenate(soms)
+    values = np.concatenate(values).astype(np.float32) * scales[soms] + offsets[soms]
+    deltas = np.zeros((len(arrays), nodes, channels), dtype=np.float32)
+    deltas[soms, np.concatenate(indexes)] = values
+    deltas = deltas.reshape(len(arrays), *shape)
+    if references is not None:
+        deltas += references
+    return deltas
+
+
+def load_reference(path: str) -> Tuple[np.array, str]:
+    """Load reference weights and their version, cached until the file changes."""
+    path = os.path.abspath(str(path))
+    key = (path, os.stat(path).st_mtime_ns)
+    if key not in _REFERENCES:
+        reference = np.load(path).astype(np.float32)
+        _REFERENCES[key] = (reference, reference_version(reference))
+    return _REFERENCES[key]
+
+
+def _resolve_reference(path: str, arrays: dict) -> np.array:
+    """Get reference weights of a delta encoded SOM, checking the version."""
+    reference_path = os.path.join(os.path.dirname(str(path)), str(arrays["reference"]))
+    reference, version = load_reference(reference_path)
+    if version != str(arrays["reference_version"]):
+        raise ValueError(
+            f"{path} was encoded against reference version {arrays['reference_version']}, "
+            f"but {reference_path} has version {version}")
+    return reference
+
+
+def save_array(
+        data: np.array,
+        path: URLPath,
+        storage: str = "float32",
+        reference: URLPath = None,
+        threshold: float = None) -> URLPath:
+    """Save SOM weights with the given storage type.
+
+    Args:
+        reference: Path to .npy reference weights, needed for delta storage types.
+        threshold: Minimum node difference stored in delta storage types.
+    Returns:
+        Path of the written file with the suffix of the storage type.
+    """
+    path = path.with_suffix(storage_suffix(storage))
+    # replace existing files instead of writing into them, since they might
+    # be hardlinked to other datasets
+    temp_path = path.with_name(f".tmp_{path.name}")
+    if storage in DELTA_TYPES:
+        if reference is None:
+            raise ValueError(f"Storage type {storage} needs reference weights.")
+        reference_data, version = load_reference(reference)
+        arrays = encode_delta(data, reference_data, storage, threshold=threshold)
+        arrays["reference"] = np.array(os.path.relpath(str(reference), os.path.dirname(str(path))))
+        arrays["reference_version"] = np.array(version)
+        np.savez(str(temp_path), **arrays)
+    elif storage in QUANTIZED_TYPES:
+        np.savez(str(temp_path), **encode(data, storage))
+    else:
+        np.save(str(temp_path), encode(data, storage)["data"])
+    os.replace(str(temp_path), str(path))
+    return path
+
+
+def _load_stored(path: str) -> dict:
+    if path.endswith(".npz"):
+        with np.load(path) as npz:
+            return dict(npz)
+    return {"data": np.load(path)}
+
+
+def load_array(path: URLPath) -> np.array:
+    """Load SOM weights saved in any storage type as float32."""
+    return load_arrays([path])[0]
+
+
+def load_arrays(paths: List[URLPath]) -> np.array:
+    """Load multiple SOMs of the same shape as a float32 batch.
+
+    Delta encoded SOMs are reconstructed together.
+    """
+    paths = [str(p) for p in paths]
+    stored = [_load_stored(p) for p in paths]
+
+    delta_indexes = [i for i, arrays in enumerate(stored) if "reference" in arrays]
+    plain_indexes = [i for i, arrays in enumerate(stored) if "reference" not in arrays]
+    deltas = None
+    if delta_indexes:
+        references = np.stack([_resolve_reference(paths[i], stored[i]) for i in delta_indexes])
+        deltas = decode_deltas([stored[i] for i in delta_indexes], references)
+        if not plain_indexes:
+            return deltas
+
+    plains = [decode(stored[i]) for i in plain_indexes]
+    shape = plains[0].shape if deltas is None else deltas.shape[1:]
+    batch = np.empty((len(paths), *shape), dtype=np.float32)
+    batch[plain_indexes] = plains
+    if deltas is not None:
+        batch[delta_indexes] = deltas
+    return batch
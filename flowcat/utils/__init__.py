@@ -2,3 +2,7 @@ from .urlpath import *
 from .dataframes import *
 from .time_timers import *
 from .logs import *
+from .threads import *
+from .fingerprint import *
+from .stages import *
+from .files import *
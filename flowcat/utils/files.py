@@ -0,0 +1,153 @@
+"""
+Parallel export of data files with hardlinks, reflinks or copies.
+"""
+import os
+import hashlib
+import threading
+from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+# ioctl request to clone a file on copy-on-write filesystems (btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Get sha256 hexdigest of a file."""
+    digest = hashlib.sha256()
+    with open(str(path), "rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_file_sha256(source: str, destination: str, chunk_size: int = 1 << 20) -> str:
+    """Copy file content and get its sha256 hexdigest in the same pass."""
+    digest = hashlib.sha256()
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        for chunk in iter(lambda: src.read(chunk_size), b""):
+            digest.update(chunk)
+            dst.write(chunk)
+    return digest.hexdigest()
+
+
+def _reflink(source: str, destination: str):
+    import fcntl
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def clone_file(source: str, destination: str, link: bool = True) -> Tuple[str, str]:
+    """Create destination with the content of source, replacing existing files.
+
+    Hardlinks are tried first, then reflinks and finally copies.
+
+    Returns:
+        Tuple of method used, either hardlink, reflink or copy, and the
+        sha256 of copied files, which is None for links.
+    """
+    temp_destination = os.path.join(os.path.dirname(destination), f".tmp_{os.path.basename(destination)}")
+    if os.path.lexists(temp_destination):
+        os.unlink(temp_destination)
+
+    method = None
+    sha256 = None
+    if link:
+        try:
+            os.link(source, temp_destination)
+            method = "hardlink"
+        except OSError:
+            pass
+    if method is None:
+        try:
+            _reflink(source, temp_destination)
+            method = "reflink"
+        except (OSError, ImportError):
+            sha256 = copy_file_sha256(source, temp_destination)
+            method = "copy"
+    os.replace(temp_destination, destination)
+    return method, sha256
+
+
+def export_file(source: str, destination: str, known: dict = None, link: bool = True) -> Tuple[str, dict]:
+    """Export single file unless the destination already has the same content.
+
+    Sources are only read if they are copied or compared to an existing
+    destination of the same size. Hardlinks and reflinks share the content
+    of the source, so their sha256 is not computed.
+
+    Args:
+        known: Previous checksum entry of the destination. If the source
+            has the same size and modification time as recorded, an existing
+            destination of the same size is kept without hashing.
+    Returns:
+        Tuple of method and checksum entry with size, modification time and
+        sha256, which is None if it has not been computed.
+    """
+    source = str(source)
+    destination = str(destination)
+    stat = os.stat(source)
+    checksum = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": None}
+    unchanged = bool(known) and all(known.get(key) == checksum[key] for key in ("size", "mtime"))
+    if unchanged:
+        checksum["sha256"] = known.get("sha256")
+
+    if os.path.exists(destination):
+        if os.path.samefile(source, destination):
+            return "skip", checksum
+        if os.stat(destination).st_size == checksum["size"]:
+            if unchanged:
+                return "skip", checksum
+            sha256 = file_sha256(source)
+            if file_sha256(destination) == sha256:
+                return "skip", {**checksum, "sha256": sha256}
+    else:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+    method, sha256 = clone_file(source, destination, link=link)
+    return method, {**checksum, "sha256": sha256}
+
+
+def _format_bytes(num: float) -> str:
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if num < 1024 or unit == "TB":
+            return f"{num:.1f}{unit}"
+        num /= 1024
+
+
+def export_files(
+        files: List[Tuple[str, str]],
+        known: Dict[str, dict] = None,
+        workers: int = 8,
+        link: bool = True,
+        label: str = "Exporting") -> Tuple[Dict[str, dict], Dict[str, int]]:
+    """Export files concurrently, printing progress in bytes.
+
+    Args:
+        files: List of source and destination paths.
+        known: Previous checksums by destination path.
+        workers: Number of threads.
+        link: Try hardlinks before reflinks and copies.
+    Returns:
+        Tuple of checksums by destination path and number of files per method.
+    """
+    known = known or {}
+    total = sum(os.stat(str(source)).st_size for source, _ in files)
+    done = 0
+    lock = threading.Lock()
+    methods = {}
+
+    def export(paths):
+        nonlocal done
+        source, destination = paths
+        method, checksum = export_file(source, destination, known=known.get(str(destination)), link=link)
+        with lock:
+            done += checksum["size"]
+            methods[method] = methods.get(method, 0) + 1
+            print(f"{label}: {_format_bytes(done)}/{_format_bytes(total)}\r", end="", flush=True)
+        return str(destination), checksum
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        checksums = dict(executor.map(export, files))
+    print("")
+    return checksums, methods
@@ -0,0 +1,43 @@
+"""
+Cheap fingerprints of files to detect changed inputs without reading them.
+"""
+import os
+import hashlib
+
+
+def file_fingerprint(path: "URLPath") -> str:
+    """Get fingerprint of a file from its size and modification time."""
+    stat = os.stat(str(path))
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def _hasher():
+    """Get fast non-cryptographic hash, xxhash if installed, otherwise blake2b."""
+    try:
+        import xxhash
+        return xxhash.xxh64()
+    except ImportError:
+        return hashlib.blake2b(digest_size=8)
+
+
+def hash_algorithm() -> str:
+    """Name of the hash used for sampled content hashes."""
+    return _hasher().name
+
+
+def sampled_hash(path: "URLPath", blocks: int = 16, block_size: int = 1 << 16) -> str:
+    """Hash file size and evenly spaced blocks of a file including its end.
+
+    Files smaller than all blocks are hashed completely.
+    """
+    digest = _hasher()
+    size = os.stat(str(path)).st_size
+    digest.update(str(size).encode())
+    with open(str(path), "rb") as handle:
+        if size <= blocks * block_size:
+            digest.update(handle.read())
+        else:
+            for i in range(blocks):
+                handle.seek(i * (size - block_size) // (blocks - 1))
+                digest.update(handle.read(block_size))
+    return digest.hexdigest()
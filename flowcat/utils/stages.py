@@ -0,0 +1,131 @@
+"""
+Content-addressed cache of pipeline stage artifacts.
+
+Every stage is identified by a key hashed from its inputs, eg case ids and
+file fingerprints, stage arguments and keys of upstream stages. Artifacts
+are saved to <root>/<stage name>/<key>/ and a manifest.json is written once
+the stage has completed, so stages without manifest are run again.
+"""
+import os
+import json
+import shutil
+import hashlib
+import datetime
+import dataclasses
+from dataclasses import dataclass
+
+from .urlpath import URLPath
+
+
+MANIFEST_NAME = "manifest.json"
+
+
+def _json_default(obj):
+    if dataclasses.is_dataclass(obj):
+        return dataclasses.asdict(obj)
+    return str(obj)
+
+
+def input_hash(data) -> str:
+    """Hash json serializable data, other objects are hashed by their string."""
+    serialized = json.dumps(data, sort_keys=True, default=_json_default)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+@dataclass
+class Stage:
+    """Single stage run identified by the hashes of its inputs."""
+
+    name: str
+    key: str
+    path: URLPath
+    inputs: dict  # hash of each input
+
+    @property
+    def manifest_path(self) -> URLPath:
+        return self.path / MANIFEST_NAME
+
+    @property
+    def done(self) -> bool:
+        return self.manifest_path.exists()
+
+
+class StageCache:
+    """Directory of stage artifacts stored under their input keys."""
+
+    def __init__(self, path: URLPath):
+        self.path = URLPath(path)
+
+    def stage(self, name: str, **inputs) -> Stage:
+        """Get stage for the given inputs, which might have already been run."""
+        hashes = {input_name: input_hash(value) for input_name, value in inputs.items()}
+        key = input_hash({"stage": name, **hashes})[:24]
+        return Stage(name=name, key=key, path=self.path / name / key, inputs=hashes)
+
+    def start(self, stage: Stage):
+        """Remove artifacts of an incomplete previous run of the stage."""
+        if stage.done:
+            raise RuntimeError(f"Stage {stage.name} {stage.key} has already been run")
+        if stage.path.exists():
+            shutil.rmtree(str(stage.path))
+
+    def commit(self, stage: Stage):
+        """Mark stage as completed by writing its manifest."""
+        files = {
+            str(path.relative_to(stage.path)): path.stat().st_size
+            for path in sorted(stage.path.glob("**/*")) if path.is_file()
+        }
+        manifest = {
+            "stage": stage.name,
+            "key": stage.key,
+            "inputs": stage.inputs,
+            "created": datetime.datetime.now().isoformat(),
+            "files": files,
+        }
+        temp_path = stage.path / f".tmp_{MANIFEST_NAME}"
+        with temp_path.open("w") as mfile:
+            json.dump(manifest, mfile, indent=2)
+        os.replace(str(temp_path), str(stage.manifest_path))
+
+    def load_manifest(self, stage: Stage) -> dict:
+        with stage.manifest_path.open("r") as mfile:
+            return json.load(mfile)
+
+    def previous(self, stage: Stage, ignore: list = ("cases",)) -> Stage:
+        """Get the latest completed run of the stage with matching inputs except the ignored ones."""
+        candidates = []
+        stage_root = self.path / stage.name
+        if not stage_root.exists():
+            return None
+        for manifest_path in stage_root.glob(f"*/{MANIFEST_NAME}"):
+            with manifest_path.open("r") as mfile:
+                manifest = json.load(mfile)
+            if manifest["key"] == stage.key:
+                continue
+            if all(
+                    manifest["inputs"].get(name) == value
+                    for name, value in stage.inputs.items() if name not in ignore):
+                candidates.append(manifest)
+        if not candidates:
+            return None
+        latest = max(candidates, key=lambda m: m["created"])
+        return Stage(
+            name=stage.name, key=latest["key"], path=stage_root / latest["key"], inputs=latest["inputs"])
+
+    def seed(self, stage: Stage, source: Stage):
+        """Start stage with the artifacts of another run, files are hardlinked if possible.
+
+        Linked files must be replaced and not modified in place.
+        """
+        self.start(stage)
+        shutil.copytree(
+            str(source.path), str(stage.path),
+            copy_function=_link_or_copy,
+            ignore=shutil.ignore_patterns(MANIFEST_NAME))
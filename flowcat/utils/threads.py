@@ -0,0 +1,54 @@
+"""
+Helpers for dividing cpu cores among concurrently running workers.
+"""
+import os
+from typing import Union
+
+
+def available_cpus() -> int:
+    """Get the number of cpus usable by the current process."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def thread_budget(workers: int = 1, cpus: int = None) -> int:
+    """Get the number of threads per worker if cpus are divided equally."""
+    if cpus is None:
+        cpus = available_cpus()
+    return max(1, cpus // max(1, workers))
+
+
+def parse_thread_count(value: str) -> Union[int, str, None]:
+    """Parse thread count arguments, which are either a number or 'auto'."""
+    if value is None or value == "":
+        return None
+    if value == "auto":
+        return value
+    return int(value)
+
+
+def resolve_session_threads(
+        intra_op_threads: Union[int, str] = None,
+        inter_op_threads: Union[int, str] = None,
+        workers: int = 1) -> dict:
+    """Resolve 'auto' thread counts for a single tensorflow session.
+
+    Args:
+        intra_op_threads: Threads used inside single operations. 'auto'
+            divides available cpus among workers.
+        inter_op_threads: Threads used to run independent operations. 'auto'
+            uses a single thread, since the SOM graph is mostly sequential.
+        workers: Number of sessions running concurrently.
+    Returns:
+        Dict with intra_op_threads and inter_op_threads, None for default.
+    """
+    if intra_op_threads == "auto":
+        intra_op_threads = thread_budget(workers)
+    if inter_op_threads == "auto":
+        inter_op_threads = 1
+    return {
+        "intra_op_threads": intra_op_threads,
+        "inter_op_threads": inter_op_threads,
+    }
@@ -65,7 +65,7 @@ def has_urlpath_in_hint(hint):
 
 
 def _cast(obj):
-    if isinstance(obj, URLPath):
+    if obj is None or isinstance(obj, URLPath):
         return obj
     elif isinstance(obj, str):
         return URLPath(obj)
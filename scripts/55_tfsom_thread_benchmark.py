@@ -0,0 +1,87 @@
+"""Benchmark thread splits for concurrent SOM transforms on a single node.
+
+Runs the default 32x32 transform in a number of worker processes with
+different intra/inter op thread counts and reports the throughput of all
+workers combined.
+"""
+# pylint: skip-file
+# flake8: noqa
+import time
+import json
+import multiprocessing
+
+import numpy as np
+from argmagic import argmagic
+
+from flowcat import utils
+from flowcat.constants import DEFAULT_TRANSFORM_SOM_ARGS
+
+
+def run_worker(args):
+    from flowcat.sommodels import tfsom
+
+    intra, inter, events, channels, repeats = args
+    model = tfsom.TFSom(
+        (32, 32, channels),
+        map_type="toroid",
+        intra_op_threads=intra,
+        inter_op_threads=inter,
+        **{k: v for k, v in DEFAULT_TRANSFORM_SOM_ARGS.items() if k != "subsample"},
+    ).initialize()
+    data = np.random.rand(events, channels)
+    mask = np.ones((events, channels))
+    model.transform(data, mask)  # warmup
+
+    time_a = time.time()
+    for _ in range(repeats):
+        model.transform(data, mask)
+    return time.time() - time_a
+
+
+def benchmark(workers, intra, inter, events, channels, repeats):
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        time_a = time.time()
+        pool.map(run_worker, [(intra, inter, events, channels, repeats)] * workers)
+        duration = time.time() - time_a
+    return workers * repeats / duration
+
+
+def main(
+        output: utils.URLPath = None,
+        events: int = 50000,
+        channels: int = 12,
+        repeats: int = 5,
+        workers: json.loads = None):
+    """
+    Args:
+        output: Optional json file to save results to.
+        events: Number of events per transformed sample.
+        channels: Number of channels per sample.
+        repeats: Number of transforms per worker.
+        workers: List of worker counts to test.
+    """
+    cpus = utils.available_cpus()
+    if workers is None:
+        workers = [w for w in (1, 2, 4, 8, 16) if w <= cpus]
+
+    results = []
+    for num_workers in workers:
+        budget = utils.thread_budget(num_workers, cpus)
+        splits = {(0, 0), (budget, 1), (budget, 2), (max(1, budget // 2), 2)}
+        for intra, inter in sorted(splits):
+            throughput = benchmark(num_workers, intra, inter, events, channels, repeats)
+            print(f"workers={num_workers} intra={intra} inter={inter}: {throughput:.2f} transforms/s")
+            results.append({
+                "workers": num_workers, "intra_op_threads": intra, "inter_op_threads": inter,
+                "throughput": throughput,
+            })
+
+    best = max(results, key=lambda r: r["throughput"])
+    print("Best split:", best)
+    if output:
+        with output.open("w") as ofile:
+            json.dump({"cpus": cpus, "results": results, "best": best}, ofile, indent=2)
+
+
+if __name__ == "__main__":
+    argmagic(main)
@@ -0,0 +1,103 @@
+"""Compare single resolution and coarse-to-fine reference SOM training.
+
+Trains the default 32x32 toroid reference on synthetic events, once as in
+the current reference training and once with multiresolution stages, and
+reports training time and quantization error of both maps.
+"""
+# pylint: skip-file
+# flake8: noqa
+import time
+import json
+
+import numpy as np
+from argmagic import argmagic
+
+from flowcat import utils
+from flowcat.constants import DEFAULT_REFERENCE_SOM_ARGS
+from flowcat.types.fcsdata import FCSData
+
+
+DEFAULT_STAGES = [
+    {"dims": [8, 8], "max_epochs": 10},
+    {"dims": [16, 16], "max_epochs": 4},
+]
+
+
+def create_data(events, channels, populations, seed):
+    rng = np.random.RandomState(seed)
+    centers = rng.rand(populations, channels)
+    sizes = rng.dirichlet(np.ones(populations) * 0.5)
+    labels = rng.choice(populations, size=events, p=sizes)
+    data = np.clip(centers[labels] + rng.normal(scale=0.05, size=(events, channels)), 0, 1)
+    return FCSData((data, np.ones(data.shape)), channels=[f"c{i}" for i in range(channels)])
+
+
+def quantization_error(weights, data, chunk_size=10000):
+    """Mean euclidean distance of events to their best matching node."""
+    weights = weights.reshape(-1, weights.shape[-1])
+    distances = []
+    for start in range(0, data.shape[0], chunk_size):
+        chunk = data[start:start + chunk_size]
+        squared = (
+            (chunk ** 2).sum(axis=1)[:, None]
+            - 2 * chunk @ weights.T
+            + (weights ** 2).sum(axis=1)[None, :])
+        distances.append(np.sqrt(np.maximum(squared.min(axis=1), 0)))
+    return float(np.concatenate(distances).mean())
+
+
+def train(fcsdata, args):
+    from flowcat.sommodels.fcssom import FCSSom
+
+    model = FCSSom(markers=fcsdata.channels, **args)
+    time_a = time.time()
+    model.train([fcsdata])
+    duration = time.time() - time_a
+
+    scaled, _ = model.prepare_data(fcsdata.copy())
+    return duration, quantization_error(model.weights.data, scaled)
+
+
+def main(
+        output: utils.URLPath = None,
+        events: int = 500000,
+        channels: int = 12,
+        populations: int = 20,
+        final_epochs: int = 2,
+        final_radius: float = 4,
+        stages: json.loads = None,
+        seed: int = 42):
+    """
+    Args:
+        output: Optional json file to save results to.
+        events: Number of pooled reference events.
+        channels: Number of channels.
+        populations: Number of gaussian populations in the synthetic data.
+        final_epochs: Epochs of the refinement on the full map.
+        final_radius: Initial radius of the refinement on the full map.
+        stages: List of coarse stages, defaults to 8x8 and 16x16.
+    """
+    fcsdata = create_data(events, channels, populations, seed)
+
+    single_args = {**DEFAULT_REFERENCE_SOM_ARGS, "seed": seed}
+    multi_args = {
+        **single_args,
+        "max_epochs": final_epochs,
+        "initial_radius": final_radius,
+        "multiresolution": stages or DEFAULT_STAGES,
+    }
+
+    results = {}
+    for name, args in (("single", single_args), ("multiresolution", multi_args)):
+        duration, error = train(fcsdata, args)
+        print(f"{name}: {duration:.1f}s quantization error {error:.5f}")
+        results[name] = {"time": duration, "quantization_error": error}
+
+    print(f"Speedup: {results['single']['time'] / results['multiresolution']['time']:.2f}x")
+    if output:
+        with output.open("w") as ofile:
+            json.dump({"args": {"events": events, "channels": channels}, "results": results}, ofile, indent=2)
+
+
+if __name__ == "__main__":
+    argmagic(main)
@@ -0,0 +1,104 @@
+"""Validate compact SOM storage types against classifier accuracy.
+
+Encodes the SOMs of a held-out set with each storage type, decodes them as
+they would be loaded from disk and reports classifier accuracy and the
+prediction agreement with float32 SOMs.
+"""
+# pylint: skip-file
+# flake8: noqa
+import json
+
+import numpy as np
+from argmagic import argmagic
+
+from flowcat import utils, io_functions
+from flowcat.types import som_codec
+
+
+def create_arrays(cases, classifier, storage):
+    from flowcat.classifier.padding import pad_array
+
+    return [
+        np.array([
+            pad_array(
+                som_codec.decode(som_codec.encode(
+                    case.get_tube(tube, kind="som").get_data().data, storage)),
+                classifier.config.pad_width)
+            for case in cases
+        ])
+        for tube in classifier.config.tubes
+    ]
+
+
+def main(
+        data: utils.URLPath,
+        model: utils.URLPath,
+        output: utils.URLPath = None,
+        meta: utils.URLPath = None,
+        labels: utils.URLPath = None,
+        storages: json.loads = None):
+    """
+    Args:
+        data: Path to SOM dataset.
+        model: Path to trained SOM classifier.
+        output: Optional json file to save results to.
+        labels: Json list of held-out case ids, defaults to the validation ids of the model.
+        storages: List of storage types to compare, defaults to all.
+    """
+    from flowcat.classifier.classifier import SOMClassifier
+
+    classifier = SOMClassifier.load(model)
+    dataset = io_functions.load_case_collection(data, meta)
+
+    if labels:
+        labels = io_functions.load_json(labels)
+    else:
+        labels = classifier.data_ids["validation"]
+    if not labels:
+        raise ValueError("No held-out labels given and model has no validation ids.")
+
+    dataset = dataset.filter(labels=labels)
+    if classifier.config.mapping:
+        dataset = dataset.map_groups(classifier.config.mapping)
+    dataset = dataset.filter(groups=classifier.config.groups)
+    cases = list(dataset)
+    true_labels = np.array([case.group for case in cases])
+    print(f"Validating on {len(cases)} held-out cases")
+
+    # float32 predictions are the reference for all other storage types
+    storages = ["float32"] + [s for s in storages or som_codec.STORAGE_TYPES if s != "float32"]
+
+    results = {}
+    reference_labels = None
+    for storage in storages:
+        xdata = create_arrays(cases, classifier, storage)
+        predictions = classifier.model.predict(xdata)
+        pred_labels = classifier.binarizer.inverse_transform(predictions)
+        if reference_labels is None:
+            reference_labels = pred_labels
+
+        accuracy = float(np.mean(pred_labels == true_labels))
+        results[storage] = {
+            "accuracy": accuracy,
+            "agreement": float(np.mean(pred_labels == reference_labels)),
+            "max_probability_delta": None,
+        }
+        if storage == "float32":
+            reference_predictions = predictions
+        else:
+            results[storage]["max_probability_delta"] = float(np.max(np.abs(predictions - reference_predictions)))
+
+    base_accuracy = results["float32"]["accuracy"]
+    for storage, result in results.items():
+        result["accuracy_delta"] = result["accuracy"] - base_accuracy
+        print(
+            f"{storage}: accuracy {result['accuracy']:.4f} "
+            f"(delta {result['accuracy_delta']:+.4f}), agreement {result['agreement']:.4f}")
+
+    if output:
+        with output.open("w") as ofile:
+            json.dump({"cases": len(cases), "results": results}, ofile, indent=2)
+
+
+if __name__ == "__main__":
+    argmagic(main)
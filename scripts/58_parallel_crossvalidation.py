@@ -0,0 +1,55 @@
+"""Cross-validation or learning curve of the default SOM classifier with
+folds trained concurrently.
+"""
+# pylint: skip-file
+# flake8: noqa
+import json
+
+from argmagic import argmagic
+
+from flowcat import utils
+from flowcat.classifier import crossval, som_dataset
+from flowcat.types.classifier_config import SOMClassifierConfig
+
+
+def main(
+        data: utils.URLPath,
+        output: utils.URLPath,
+        groups: json.loads = None,
+        mapping: json.loads = None,
+        folds: int = 10,
+        sizes: json.loads = None,
+        workers: int = 4,
+        epochs: int = 20,
+        seed: int = None):
+    """
+    Args:
+        data: Path to SOM dataset.
+        output: Output directory for fold results and the aggregated report.
+        groups: Json list of groups, defaults to all groups in the dataset.
+        mapping: Json dict mapping existing groups to new groups.
+        folds: Number of cross-validation folds.
+        sizes: Json list of training sizes to run a learning curve instead of cross-validation.
+        workers: Number of folds trained concurrently.
+    """
+    dataset = som_dataset.SOMDataset.from_path(data)
+    if mapping:
+        dataset = dataset.map_groups(mapping)
+    groups = groups or sorted(set(dataset.groups))
+    dataset = dataset.filter(groups=groups)
+
+    config = SOMClassifierConfig(
+        tubes=dataset.config,
+        groups=groups,
+        mapping=mapping,
+        train_epochs=epochs)
+
+    if sizes:
+        report = crossval.learning_curve(dataset, config, output, sizes, seed=seed, workers=workers)
+    else:
+        report = crossval.cross_validate(dataset, config, output, folds=folds, seed=seed, workers=workers)
+    print(json.dumps(report.get("mean", report), indent=2))
+
+
+if __name__ == "__main__":
+    argmagic(main)